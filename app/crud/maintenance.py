@@ -1,12 +1,20 @@
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import select
+from sqlalchemy import bindparam, select, text, or_, Integer, Float
 from fastapi import HTTPException, status
-from typing import Optional
+from typing import Optional, Iterator, List
 from datetime import datetime
+import re
 
-from app.models import User, Vehicle, MaintenanceRecord
+from app.models import User, Vehicle, MaintenanceRecord, MAINTENANCE_SEARCH_TABLE
 from app.schemas.maintenance import MaintenanceCreate, MaintenanceUpdate, MaintenanceResponse
 from app.utils.maintenance import make_maintenance_response
+from app.utils import pagination
+from app.utils.pagination import paginate_query, DEFAULT_PAGE_SIZE
+from app.utils.fields import FieldSelection, apply_field_selection
+from app.utils.filters import FilterField, FilterSpec, fetch_filtered_page
+from app.crud.versions import crud_bump_user_data_version
+from app.crud.user_stats import crud_adjust_user_stats, crud_refresh_user_stats_extremes
+from app.crud.reminder import crud_refresh_vehicle_reminder_schedules
 
 
 def crud_create_maintenance_record(
@@ -35,9 +43,11 @@ def crud_create_maintenance_record(
 
     if maintenance_create.mileage > vehicle.mileage:
         vehicle.mileage = maintenance_create.mileage
+        crud_refresh_vehicle_reminder_schedules(db=db, vehicle=vehicle)
 
     new_record = MaintenanceRecord(
         vehicle_id=vehicle.id,
+        user_id=current_user.id,
         maintenance_provider=maintenance_create.maintenance_provider,
         maintenance_type=maintenance_create.maintenance_type,
         description=maintenance_create.description,
@@ -47,28 +57,89 @@ def crud_create_maintenance_record(
     )
 
     db.add(new_record)
+    crud_adjust_user_stats(
+        db=db, user_id=current_user.id, vehicle_id=vehicle.id, records=1, cost=new_record.cost or 0.0
+    )
+    crud_refresh_user_stats_extremes(db=db, user_id=current_user.id, vehicle_id=vehicle.id)
+    crud_bump_user_data_version(db=db, user_id=current_user.id)
     db.commit()
     db.refresh(new_record)
 
     return new_record
 
 
-def base_maintenance_records_query(db: Session, current_user: User):
-    # Pycharm doesn't like the '==' comparator but works just fine at runtime
-    user_vehicle_ids = select(Vehicle.id).where(Vehicle.user_id == current_user.id)
+def base_maintenance_records_query(db: Session, current_user: User, load_vehicle: bool = True):
+    query = db.query(MaintenanceRecord)
+
+    if load_vehicle:
+        query = query.options(joinedload(MaintenanceRecord.vehicle))
 
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
     query = (
-        db.query(MaintenanceRecord)
-        .options(joinedload(MaintenanceRecord.vehicle))
-        .filter(MaintenanceRecord.vehicle_id.in_(user_vehicle_ids))
+        query
+        .filter(MaintenanceRecord.user_id == current_user.id)
         .order_by(MaintenanceRecord.created_at.asc())
     )
     return query
 
 
-def crud_fetch_all_vehicle_maintenance_records(db: Session, current_user: User) -> dict:
-    query = base_maintenance_records_query(db=db, current_user=current_user)
-    return {"maintenance": query.all()}
+def crud_fetch_all_vehicle_maintenance_records(
+        db: Session,
+        current_user: User,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        fields: Optional[FieldSelection] = None
+) -> dict:
+
+    if fields is None:
+        query = base_maintenance_records_query(db=db, current_user=current_user)
+    else:
+        query = base_maintenance_records_query(db=db, current_user=current_user, load_vehicle=False)
+        query = apply_field_selection(query=query, model=MaintenanceRecord, selection=fields,
+                                      relationship=MaintenanceRecord.vehicle)
+
+    records, next_cursor = paginate_query(query=query, model=MaintenanceRecord, limit=limit, cursor=cursor)
+
+    return {"maintenance": records, "next_cursor": next_cursor}
+
+
+def crud_stream_vehicle_maintenance_records(db: Session, current_user: User, batch_size: int = 1000) -> Iterator[str]:
+    # Oldest first, read straight off the (user_id, created_at, id) index so nothing is sorted in memory before
+    # the first line is sent
+    query = base_maintenance_records_query(db=db, current_user=current_user).order_by(None).order_by(
+        MaintenanceRecord.created_at.asc(), MaintenanceRecord.id.asc()
+    )
+
+    for record in query.yield_per(batch_size):
+        yield MaintenanceResponse.model_validate(record).model_dump_json() + "\n"
+
+
+MAINTENANCE_FILTERS = FilterSpec(
+    name="maintenance_records",
+    model=MaintenanceRecord,
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    statement=(
+        select(MaintenanceRecord)
+        .options(joinedload(MaintenanceRecord.vehicle))
+        .where(MaintenanceRecord.user_id == bindparam("user_id"))
+    ),
+    # Range bounds are inclusive
+    fields={
+        "vehicle_id": FilterField(MaintenanceRecord.vehicle_id, "equal"),
+        "maintenance_provider": FilterField(MaintenanceRecord.maintenance_provider, "contains"),
+        "maintenance_type": FilterField(MaintenanceRecord.maintenance_type, "contains"),
+        "description": FilterField(MaintenanceRecord.description, "contains"),
+        "mileage": FilterField(MaintenanceRecord.mileage, "equal"),
+        "cost": FilterField(MaintenanceRecord.cost, "equal"),
+        "serviced_at": FilterField(MaintenanceRecord.serviced_at, "equal"),
+        "mileage_min": FilterField(MaintenanceRecord.mileage, "min"),
+        "mileage_max": FilterField(MaintenanceRecord.mileage, "max"),
+        "cost_min": FilterField(MaintenanceRecord.cost, "min"),
+        "cost_max": FilterField(MaintenanceRecord.cost, "max"),
+        "serviced_at_after": FilterField(MaintenanceRecord.serviced_at, "min"),
+        "serviced_at_before": FilterField(MaintenanceRecord.serviced_at, "max")
+    }
+)
 
 
 def crud_fetch_all_vehicle_maintenance_records_filtered(
@@ -80,7 +151,15 @@ def crud_fetch_all_vehicle_maintenance_records_filtered(
         description: Optional[str],
         mileage: Optional[int],
         cost: Optional[float],
-        serviced_at: Optional[datetime]
+        serviced_at: Optional[datetime],
+        mileage_min: Optional[int] = None,
+        mileage_max: Optional[int] = None,
+        cost_min: Optional[float] = None,
+        cost_max: Optional[float] = None,
+        serviced_at_after: Optional[datetime] = None,
+        serviced_at_before: Optional[datetime] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None
 ) -> dict:
 
     filters = {
@@ -90,26 +169,94 @@ def crud_fetch_all_vehicle_maintenance_records_filtered(
         "description": description,
         "mileage": mileage,
         "cost": cost,
-        "serviced_at": serviced_at
+        "serviced_at": serviced_at,
+        "mileage_min": mileage_min,
+        "mileage_max": mileage_max,
+        "cost_min": cost_min,
+        "cost_max": cost_max,
+        "serviced_at_after": serviced_at_after,
+        "serviced_at_before": serviced_at_before
     }
 
-    if all(value is None for value in filters.values()):
+    records, next_cursor = fetch_filtered_page(
+        db=db,
+        spec=MAINTENANCE_FILTERS,
+        user_id=current_user.id,
+        filters=filters,
+        limit=limit,
+        cursor=cursor
+    )
+
+    return {"maintenance": records, "next_cursor": next_cursor}
+
+
+SEARCH_TOKEN = re.compile(r"\w+")
+
+
+def parse_search_terms(search: str) -> List[str]:
+    terms = SEARCH_TOKEN.findall(search)
+
+    if not terms:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="At least one filter parameter must be provided."
+            detail="Search must contain at least one word."
         )
 
+    return terms
+
+
+def crud_search_maintenance_records(
+        db: Session,
+        current_user: User,
+        search: str,
+        vehicle_id: Optional[int] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        offset: int = 0
+) -> dict:
+    """
+    Records whose description or provider contain every word of search as a word prefix, best match first.
+    On SQLite the FTS5 index answers the match and ranks with bm25. Other backends fall back to ILIKE per word,
+    newest first.
+    """
+    terms = parse_search_terms(search)
+    limit = max(1, min(limit, pagination.MAX_PAGE_SIZE))
+
     query = base_maintenance_records_query(db=db, current_user=current_user)
 
-    for attr, value in filters.items():
-        if value is not None:
-            column = getattr(MaintenanceRecord, attr)
-            if isinstance(value, str):
-                query = query.filter(column.ilike(f"%{value}%"))
-            else:
-                query = query.filter(column == value)
+    if vehicle_id is not None:
+        # Pycharm doesn't like the '==' comparator but works just fine at runtime
+        query = query.filter(MaintenanceRecord.vehicle_id == vehicle_id)
+
+    if db.get_bind().dialect.name == "sqlite":
+        # Each word quoted so user input can't be read as FTS5 query syntax, * makes it a prefix match
+        match = " ".join(f'"{term}"*' for term in terms)
+        matches = (
+            text(
+                f"SELECT rowid AS record_id, rank FROM {MAINTENANCE_SEARCH_TABLE} "
+                f"WHERE {MAINTENANCE_SEARCH_TABLE} MATCH :match"
+            )
+            .bindparams(match=match)
+            .columns(record_id=Integer, rank=Float)
+            .subquery("matches")
+        )
+        query = (
+            query
+            .join(matches, matches.c.record_id == MaintenanceRecord.id)
+            .order_by(None)
+            .order_by(matches.c.rank.asc(), MaintenanceRecord.id.asc())
+        )
+    else:
+        for term in terms:
+            query = query.filter(
+                or_(MaintenanceRecord.description.ilike(f"%{term}%"),
+                    MaintenanceRecord.maintenance_provider.ilike(f"%{term}%"))
+            )
+        query = query.order_by(None).order_by(MaintenanceRecord.created_at.desc(), MaintenanceRecord.id.desc())
+
+    records = query.offset(offset).limit(limit + 1).all()
+    next_offset = offset + limit if len(records) > limit else None
 
-    return {"maintenance": query.all()}
+    return {"maintenance": records[:limit], "next_offset": next_offset}
 
 
 def crud_update_maintenance_record(
@@ -127,13 +274,14 @@ def crud_update_maintenance_record(
             detail="Maintenance record not found."
         )
 
-    if record.vehicle.user_id != current_user.id:
+    if record.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to update this record."
         )
 
     old_data = make_maintenance_response(maintenance_record=record)
+    old_cost = record.cost or 0.0
 
     excluded_fields = {"id", "created_at", "updated_at"}
     changes = {field: False for field in MaintenanceResponse.model_fields.keys() if field not in excluded_fields}
@@ -152,6 +300,12 @@ def crud_update_maintenance_record(
             "update_message": f"No updates were made to Maintenance Record ID {maintenance_record_id}."
         }
 
+    if changes["cost"]:
+        crud_adjust_user_stats(
+            db=db, user_id=current_user.id, vehicle_id=record.vehicle_id, cost=(record.cost or 0.0) - old_cost
+        )
+        crud_refresh_user_stats_extremes(db=db, user_id=current_user.id)
+    crud_bump_user_data_version(db=db, user_id=current_user.id)
     db.commit()
     db.refresh(record)
 
@@ -172,13 +326,18 @@ def crud_delete_maintenance_record(db: Session, current_user: User, maintenance_
             detail="Maintenance record not found."
         )
 
-    if record.vehicle.user_id != current_user.id:
+    if record.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to delete this record."
         )
 
     db.delete(record)
+    crud_adjust_user_stats(
+        db=db, user_id=current_user.id, vehicle_id=record.vehicle_id, records=-1, cost=-(record.cost or 0.0)
+    )
+    crud_refresh_user_stats_extremes(db=db, user_id=current_user.id, vehicle_id=record.vehicle_id)
+    crud_bump_user_data_version(db=db, user_id=current_user.id)
     db.commit()
 
     return {
@@ -0,0 +1,191 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, tuple_, update
+from typing import Dict, List, Optional, Sequence
+from datetime import datetime, timedelta
+
+from app.models import User, Vehicle, MaintenanceReminder, NotificationOutbox
+from app.crud.versions import UPSERTS
+from app.utils.scheduler import DueReminder
+
+
+def make_idempotency_key(reminder_id: int, notify_at: datetime) -> str:
+    # Basic ISO format, without the colons that would break it inside an email's Message-ID
+    return f"reminder-{reminder_id}-{notify_at:%Y%m%dT%H%M%S.%f}"
+
+
+def make_notification_payload(reminder: MaintenanceReminder, vehicle: Vehicle, user: User) -> dict:
+    return {
+        "idempotency_key": make_idempotency_key(reminder_id=reminder.id, notify_at=reminder.notify_at),
+        "reminder_id": reminder.id,
+        "user_id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "maintenance_type": reminder.maintenance_type,
+        "details": reminder.details,
+        "notify_at": reminder.notify_at.isoformat(),
+        "next_due_date": reminder.next_due_date.isoformat() if reminder.next_due_date else None,
+        "next_due_mileage": reminder.next_due_mileage,
+        "vehicle": {
+            "id": vehicle.id,
+            "nickname": vehicle.nickname,
+            "make": vehicle.make,
+            "model": vehicle.model,
+            "year": vehicle.year
+        }
+    }
+
+
+def crud_enqueue_reminder_notifications(
+        db: Session,
+        due: List[DueReminder],
+        sinks: Sequence[str],
+        now: Optional[datetime] = None
+) -> int:
+    """
+    Queues a notification per sink for every due reminder and records its notify_at as notified, in one commit, so
+    a reminder is never marked without its notifications or queued twice. Reminders rescheduled, deactivated or
+    deleted since they came due are skipped. Returns the outbox rows added.
+    """
+    now = now or datetime.utcnow()
+    due_at = {reminder.reminder_id: reminder.notify_at for reminder in due}
+
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    rows = db.execute(
+        select(MaintenanceReminder, Vehicle, User)
+        .join(Vehicle, Vehicle.id == MaintenanceReminder.vehicle_id)
+        .join(User, User.id == Vehicle.user_id)
+        .where(MaintenanceReminder.id.in_(due_at), MaintenanceReminder.is_active)
+    ).all()
+    rows = [
+        (reminder, vehicle, user) for reminder, vehicle, user in rows
+        if reminder.notify_at == due_at[reminder.id] and reminder.last_notified_at != reminder.notify_at
+    ]
+
+    if not rows or not sinks:
+        db.rollback()
+        return 0
+
+    upsert = UPSERTS[db.get_bind().dialect.name]
+    statement = upsert(NotificationOutbox).values([
+        {
+            "idempotency_key": make_idempotency_key(reminder_id=reminder.id, notify_at=reminder.notify_at),
+            "sink": sink,
+            "reminder_id": reminder.id,
+            "payload": make_notification_payload(reminder=reminder, vehicle=vehicle, user=user),
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now
+        }
+        for reminder, vehicle, user in rows
+        for sink in sinks
+    ])
+    # Another process that fired the same reminder got there first
+    statement = statement.on_conflict_do_nothing(
+        index_elements=[NotificationOutbox.idempotency_key, NotificationOutbox.sink]
+    )
+    added = db.execute(statement).rowcount
+
+    # updated_at is kept as it was, reminders without a service date start their schedule from it
+    db.execute(
+        update(MaintenanceReminder)
+        .where(tuple_(MaintenanceReminder.id, MaintenanceReminder.notify_at).in_(
+            [(reminder.id, reminder.notify_at) for reminder, _, _ in rows]
+        ))
+        .values(last_notified_at=MaintenanceReminder.notify_at, updated_at=MaintenanceReminder.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+    return added
+
+
+def crud_claim_outbox_batch(
+        db: Session,
+        claim_token: str,
+        batch_size: int,
+        lease: timedelta,
+        now: Optional[datetime] = None
+) -> List[NotificationOutbox]:
+    """
+    Takes up to batch_size pending rows that are due, oldest first, and moves them a lease ahead under claim_token.
+    Concurrent workers never take the same row while the lease runs.
+    """
+    now = now or datetime.utcnow()
+    claimable = (NotificationOutbox.status == "pending", NotificationOutbox.next_attempt_at <= now)
+
+    candidates = (
+        select(NotificationOutbox.id)
+        .where(*claimable)
+        .order_by(NotificationOutbox.next_attempt_at, NotificationOutbox.id)
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    # The conditions are checked again on the rows being updated, so one that another worker claimed in the
+    # meantime is left out instead of taken twice
+    claimed = db.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(candidates), *claimable)
+        .values(next_attempt_at=now + lease, claimed_by=claim_token)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+
+    if not claimed:
+        return []
+
+    return db.query(NotificationOutbox).filter(
+        NotificationOutbox.claimed_by == claim_token, NotificationOutbox.status == "pending"
+    ).order_by(NotificationOutbox.id).all()
+
+
+def crud_mark_outbox_delivered(db: Session, claim_token: str, ids: List[int], now: Optional[datetime] = None) -> None:
+    db.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_(ids), NotificationOutbox.claimed_by == claim_token)
+        .values(status="delivered", delivered_at=now or datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def crud_mark_outbox_failed(
+        db: Session,
+        claim_token: str,
+        retry_at: Dict[int, Optional[datetime]],
+        error: str
+) -> None:
+    """Counts a failed attempt for each row, to be retried at its time or given up on when that is None."""
+    for outbox_id, next_attempt_at in retry_at.items():
+        values = {"attempts": NotificationOutbox.attempts + 1, "last_error": error[:1000]}
+        if next_attempt_at is None:
+            values["status"] = "failed"
+        else:
+            values["next_attempt_at"] = next_attempt_at
+
+        db.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id == outbox_id, NotificationOutbox.claimed_by == claim_token)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+
+def crud_fetch_outbox_backlog(db: Session, now: Optional[datetime] = None) -> dict:
+    now = now or datetime.utcnow()
+
+    pending, oldest = db.execute(
+        select(func.count(NotificationOutbox.id), func.min(NotificationOutbox.created_at))
+        .where(NotificationOutbox.status == "pending")
+    ).one()
+    failed = db.execute(
+        select(func.count(NotificationOutbox.id)).where(NotificationOutbox.status == "failed")
+    ).scalar()
+    db.rollback()
+
+    return {
+        "pending": pending,
+        "failed": failed,
+        "oldest_pending_seconds": (now - oldest).total_seconds() if oldest is not None else 0.0
+    }
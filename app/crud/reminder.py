@@ -1,12 +1,18 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import select
+from sqlalchemy.orm import Session, contains_eager, joinedload
+from sqlalchemy import and_, bindparam, func, or_, select, tuple_
 from fastapi import HTTPException, status
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from app.models import User, Vehicle, MaintenanceReminder
 from app.schemas.reminder import MaintenanceReminderCreate, MaintenanceReminderUpdate, MaintenanceReminderResponse
-from app.utils.reminder import make_maintenance_reminder_response
+from app.utils.reminder import make_maintenance_reminder_response, apply_reminder_schedule, make_due_reminder_row
+from app.utils.reminder_status import reminder_columns, reminder_schedule, reminder_schedule_rows
+from app.utils.pagination import paginate_query, page_size, encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE
+from app.utils.fields import FieldSelection, apply_field_selection
+from app.utils.filters import FilterField, FilterSpec, fetch_filtered_page
+from app.crud.versions import crud_bump_user_data_version
+from app.crud.user_stats import crud_adjust_user_stats
 
 
 def crud_create_maintenance_reminder(
@@ -54,10 +60,17 @@ def crud_create_maintenance_reminder(
         notify_before_days=maintenance_reminder.notify_before_days,
         estimated_miles_driven_per_month=maintenance_reminder.estimated_miles_driven_per_month,
         is_active=maintenance_reminder.is_active,
-        vehicle_id=maintenance_reminder.vehicle_id
+        vehicle_id=maintenance_reminder.vehicle_id,
+        user_id=current_user.id,
+        # Stamped here rather than by the server default so the schedule below can fall back to it
+        created_at=datetime.utcnow().replace(microsecond=0)
     )
 
+    apply_reminder_schedule(maintenance_reminder=new_record, vehicle_mileage=vehicle.mileage)
+
     db.add(new_record)
+    crud_adjust_user_stats(db=db, user_id=current_user.id, vehicle_id=vehicle.id, reminders=1)
+    crud_bump_user_data_version(db=db, user_id=current_user.id)
     db.commit()
     db.refresh(new_record)
 
@@ -65,23 +78,73 @@ def crud_create_maintenance_reminder(
 
 
 def base_maintenance_reminders_query(db: Session, current_user: User, load_vehicle: bool = False):
-    # Pycharm doesn't like the '==' comparator but works just fine at runtime
-    user_vehicle_ids = select(Vehicle.id).where(Vehicle.user_id == current_user.id)
-
     query = db.query(MaintenanceReminder)
 
     if load_vehicle:
-        query = query.join(Vehicle).options(joinedload(MaintenanceReminder.vehicle))
+        query = query.options(joinedload(MaintenanceReminder.vehicle))
 
-    query = query.filter(MaintenanceReminder.vehicle_id.in_(user_vehicle_ids))
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    query = query.filter(MaintenanceReminder.user_id == current_user.id)
     query = query.order_by(MaintenanceReminder.created_at.asc())
 
     return query
 
 
-def crud_fetch_all_maintenance_reminders(db: Session, current_user: User) -> dict:
-    query = base_maintenance_reminders_query(db=db, current_user=current_user)
-    return {"reminders": query.all()}
+def crud_fetch_all_maintenance_reminders(
+        db: Session,
+        current_user: User,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        fields: Optional[FieldSelection] = None
+) -> dict:
+
+    if fields is None:
+        query = base_maintenance_reminders_query(db=db, current_user=current_user, load_vehicle=True)
+    else:
+        query = base_maintenance_reminders_query(db=db, current_user=current_user)
+        query = apply_field_selection(query=query, model=MaintenanceReminder, selection=fields,
+                                      relationship=MaintenanceReminder.vehicle)
+
+    reminders, next_cursor = paginate_query(query=query, model=MaintenanceReminder, limit=limit, cursor=cursor)
+
+    return {"reminders": reminders, "next_cursor": next_cursor}
+
+
+MAINTENANCE_REMINDER_FILTERS = FilterSpec(
+    name="reminders",
+    model=MaintenanceReminder,
+    # The vehicle filters and the vehicle returned with each reminder share one join
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    statement=(
+        select(MaintenanceReminder)
+        .join(MaintenanceReminder.vehicle)
+        .options(contains_eager(MaintenanceReminder.vehicle))
+        .where(MaintenanceReminder.user_id == bindparam("user_id"))
+    ),
+    # Range bounds are inclusive
+    fields={
+        "vehicle_id": FilterField(MaintenanceReminder.vehicle_id, "equal"),
+        "maintenance_type": FilterField(MaintenanceReminder.maintenance_type, "contains"),
+        "details": FilterField(MaintenanceReminder.details, "contains"),
+        "interval_miles": FilterField(MaintenanceReminder.interval_miles, "equal"),
+        "interval_months": FilterField(MaintenanceReminder.interval_months, "equal"),
+        "last_serviced_mileage": FilterField(MaintenanceReminder.last_serviced_mileage, "equal"),
+        "last_serviced_date": FilterField(MaintenanceReminder.last_serviced_date, "equal"),
+        "notify_before_miles": FilterField(MaintenanceReminder.notify_before_miles, "equal"),
+        "notify_before_days": FilterField(MaintenanceReminder.notify_before_days, "equal"),
+        "estimated_miles_driven_per_month": FilterField(MaintenanceReminder.estimated_miles_driven_per_month, "equal"),
+        "is_active": FilterField(MaintenanceReminder.is_active, "equal"),
+        "vehicle_make": FilterField(Vehicle.make, "contains"),
+        "vehicle_model": FilterField(Vehicle.model, "contains"),
+        "vehicle_year": FilterField(Vehicle.year, "equal"),
+        "vehicle_vin": FilterField(Vehicle.vin, "contains"),
+        "vehicle_nickname": FilterField(Vehicle.nickname, "contains"),
+        "last_serviced_mileage_min": FilterField(MaintenanceReminder.last_serviced_mileage, "min"),
+        "last_serviced_mileage_max": FilterField(MaintenanceReminder.last_serviced_mileage, "max"),
+        "last_serviced_date_after": FilterField(MaintenanceReminder.last_serviced_date, "min"),
+        "last_serviced_date_before": FilterField(MaintenanceReminder.last_serviced_date, "max")
+    }
+)
 
 
 def crud_fetch_all_maintenance_reminders_filtered(
@@ -102,7 +165,13 @@ def crud_fetch_all_maintenance_reminders_filtered(
         vehicle_model: Optional[str],
         vehicle_year: Optional[int],
         vehicle_vin: Optional[str],
-        vehicle_nickname: Optional[str]
+        vehicle_nickname: Optional[str],
+        last_serviced_mileage_min: Optional[int] = None,
+        last_serviced_mileage_max: Optional[int] = None,
+        last_serviced_date_after: Optional[datetime] = None,
+        last_serviced_date_before: Optional[datetime] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None
 ) -> dict:
 
     filters = {
@@ -117,36 +186,100 @@ def crud_fetch_all_maintenance_reminders_filtered(
         "notify_before_days": notify_before_days,
         "estimated_miles_driven_per_month": estimated_miles_driven_per_month,
         "is_active": is_active,
-        "make": vehicle_make,
-        "model": vehicle_model,
-        "year": vehicle_year,
-        "vin": vehicle_vin,
-        "nickname": vehicle_nickname
+        "vehicle_make": vehicle_make,
+        "vehicle_model": vehicle_model,
+        "vehicle_year": vehicle_year,
+        "vehicle_vin": vehicle_vin,
+        "vehicle_nickname": vehicle_nickname,
+        "last_serviced_mileage_min": last_serviced_mileage_min,
+        "last_serviced_mileage_max": last_serviced_mileage_max,
+        "last_serviced_date_after": last_serviced_date_after,
+        "last_serviced_date_before": last_serviced_date_before
     }
 
-    if all(value is None for value in filters.values()):
+    reminders, next_cursor = fetch_filtered_page(
+        db=db,
+        spec=MAINTENANCE_REMINDER_FILTERS,
+        user_id=current_user.id,
+        filters=filters,
+        limit=limit,
+        cursor=cursor
+    )
+
+    return {"reminders": reminders, "next_cursor": next_cursor}
+
+
+DUE_STATUSES = ("overdue", "upcoming", "all")
+
+
+def crud_fetch_due_maintenance_reminders(
+        db: Session,
+        current_user: User,
+        due_status: str = "all",
+        vehicle_id: Optional[int] = None,
+        within_days: Optional[int] = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None
+) -> dict:
+    """
+    Active reminders whose notify_at has passed (overdue) or is still ahead (upcoming), most urgent first.
+    Reminders without a schedule never show up. within_days leaves out upcoming reminders further away than that.
+    notify_at already accounts for the odometer, see apply_reminder_schedule, so a vehicle driven past the due
+    mileage lists its reminder as overdue.
+    """
+    if due_status not in DUE_STATUSES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="At least one filter parameter must be provided."
+            detail=f"status must be one of: {', '.join(DUE_STATUSES)}."
         )
 
-    query = base_maintenance_reminders_query(db=db, current_user=current_user, load_vehicle=True)
+    now = datetime.utcnow()
 
-    for attr, value in filters.items():
-        if value is None:
-            continue
+    # The status split and the urgency order are both ranges on notify_at, answered from the
+    # (user_id, notify_at) index, only the rows of the page are read
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    query = (
+        db.query(MaintenanceReminder)
+        .join(MaintenanceReminder.vehicle)
+        .options(contains_eager(MaintenanceReminder.vehicle))
+        .filter(
+            MaintenanceReminder.user_id == current_user.id,
+            MaintenanceReminder.is_active,
+            MaintenanceReminder.notify_at.is_not(None)
+        )
+    )
 
-        if hasattr(MaintenanceReminder, attr):
-            column = getattr(MaintenanceReminder, attr)
-        else:
-            column = getattr(Vehicle, attr)
+    if due_status == "overdue":
+        query = query.filter(MaintenanceReminder.notify_at <= now)
+    elif due_status == "upcoming":
+        query = query.filter(MaintenanceReminder.notify_at > now)
 
-        if isinstance(value, str):
-            query = query.filter(column.ilike(f"%{value}%"))
-        else:
-            query = query.filter(column == value)
+    if within_days is not None and due_status != "overdue":
+        query = query.filter(MaintenanceReminder.notify_at <= now + timedelta(days=within_days))
 
-    return {"reminders": query.all()}
+    if vehicle_id is not None:
+        query = query.filter(MaintenanceReminder.vehicle_id == vehicle_id)
+
+    if cursor is not None:
+        notify_at, row_id = decode_cursor(cursor)
+        cursor_values = tuple_(
+            notify_at, row_id, types=[MaintenanceReminder.notify_at.type, MaintenanceReminder.id.type]
+        )
+        query = query.filter(tuple_(MaintenanceReminder.notify_at, MaintenanceReminder.id) > cursor_values)
+
+    reminders = query.order_by(
+        MaintenanceReminder.notify_at.asc(), MaintenanceReminder.id.asc()
+    ).limit(page_size(limit) + 1).all()
+
+    next_cursor = None
+    if len(reminders) > page_size(limit):
+        reminders = reminders[:page_size(limit)]
+        next_cursor = encode_cursor(created_at=reminders[-1].notify_at, row_id=reminders[-1].id)
+
+    return {
+        "reminders": [make_due_reminder_row(maintenance_reminder=reminder, now=now) for reminder in reminders],
+        "next_cursor": next_cursor
+    }
 
 
 def crud_update_maintenance_reminder(
@@ -187,7 +320,7 @@ def crud_update_maintenance_reminder(
             detail="Reminder must include either a complete mileage-based or time-based configuration."
         )
 
-    if reminder.vehicle.user_id != current_user.id:
+    if reminder.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to update this record."
@@ -236,6 +369,11 @@ def crud_update_maintenance_reminder(
             "update_message": f"No updates were made to Maintenance Reminder ID {maintenance_reminder_id}."
         }
 
+    # Stamped here rather than by onupdate so the schedule is derived from the stored value
+    reminder.updated_at = datetime.utcnow()
+    apply_reminder_schedule(maintenance_reminder=reminder, vehicle_mileage=vehicle.mileage)
+
+    crud_bump_user_data_version(db=db, user_id=current_user.id)
     db.commit()
     db.refresh(reminder)
 
@@ -246,6 +384,84 @@ def crud_update_maintenance_reminder(
     return {"old_data": old_data, "updated_data": updated_data, "changes": changes, "update_message": update_message}
 
 
+def crud_refresh_vehicle_reminder_schedules(db: Session, vehicle: Vehicle) -> None:
+    """Called whenever the vehicle's mileage moves, reminders whose notify_mileage it reached are due from now."""
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    reminders = db.query(MaintenanceReminder).filter(MaintenanceReminder.vehicle_id == vehicle.id).all()
+
+    # Only rows whose derived values actually moved are written back on flush
+    for reminder in reminders:
+        apply_reminder_schedule(maintenance_reminder=reminder, vehicle_mileage=vehicle.mileage)
+        if db.is_modified(reminder):
+            # Not an edit of the reminder, and those without a service date start their schedule from updated_at
+            reminder.updated_at = MaintenanceReminder.updated_at
+
+
+def crud_backfill_reminder_schedules(db: Session) -> int:
+    """
+    Derives the schedule columns of reminders saved before they existed, all in one vectorized pass over their
+    columns rather than apply_reminder_schedule row by row, see app/utils/reminder_status.py. Returns how many
+    were scheduled.
+    """
+    table = MaintenanceReminder.__table__
+
+    # Only reminders the schedule gives a next due date or mileage to, those without either stay unscheduled and
+    # would otherwise be selected again on every start
+    rows = db.execute(
+        select(
+            MaintenanceReminder.id,
+            func.coalesce(
+                MaintenanceReminder.last_serviced_date, MaintenanceReminder.updated_at, MaintenanceReminder.created_at
+            ),
+            MaintenanceReminder.interval_months,
+            MaintenanceReminder.notify_before_days,
+            MaintenanceReminder.last_serviced_mileage,
+            MaintenanceReminder.interval_miles,
+            MaintenanceReminder.notify_before_miles,
+            MaintenanceReminder.estimated_miles_driven_per_month,
+            Vehicle.mileage
+        )
+        .outerjoin(Vehicle, Vehicle.id == MaintenanceReminder.vehicle_id)
+        .where(
+            MaintenanceReminder.next_due_date.is_(None),
+            MaintenanceReminder.next_due_mileage.is_(None),
+            or_(
+                and_(MaintenanceReminder.interval_months.is_not(None), MaintenanceReminder.interval_months != 0),
+                and_(
+                    MaintenanceReminder.last_serviced_mileage.is_not(None),
+                    MaintenanceReminder.interval_miles.is_not(None),
+                    MaintenanceReminder.interval_miles != 0
+                )
+            )
+        )
+    ).all()
+
+    if not rows:
+        return 0
+
+    schedule = reminder_schedule(
+        columns=reminder_columns([row[1:8] for row in rows]), vehicle_mileage=[row[8] for row in rows]
+    )
+    # Reminders without a service date start their schedule from updated_at, stamping it now would move the start
+    # away from the notify_at just derived from it
+    db.execute(
+        table.update()
+        .where(table.c.id == bindparam("b_id"))
+        .values(
+            next_due_date=bindparam("next_due_date"),
+            notify_date=bindparam("notify_date"),
+            next_due_mileage=bindparam("next_due_mileage"),
+            notify_mileage=bindparam("notify_mileage"),
+            notify_at=bindparam("notify_at"),
+            updated_at=table.c.updated_at
+        ),
+        [{"b_id": row[0], **values} for row, values in zip(rows, reminder_schedule_rows(schedule))]
+    )
+    db.commit()
+
+    return len(rows)
+
+
 def crud_delete_maintenance_reminder(db: Session, current_user: User, maintenance_reminder_id: int) -> dict:
     reminder = db.query(MaintenanceReminder).filter(MaintenanceReminder.id == maintenance_reminder_id).first()
 
@@ -255,19 +471,15 @@ def crud_delete_maintenance_reminder(db: Session, current_user: User, maintenanc
             detail="Maintenance Reminder not found."
         )
 
-    # Pycharm doesn't like the '==' comparator but works just fine at runtime
-    vehicle = db.query(Vehicle).filter(
-        Vehicle.id == reminder.vehicle_id,
-        Vehicle.user_id == current_user.id
-    ).first()
-
-    if not vehicle:
+    if reminder.user_id != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"You do not have permission to delete reminder for Vehicle ID {reminder.vehicle_id}."
         )
 
     db.delete(reminder)
+    crud_adjust_user_stats(db=db, user_id=current_user.id, vehicle_id=reminder.vehicle_id, reminders=-1)
+    crud_bump_user_data_version(db=db, user_id=current_user.id)
     db.commit()
 
     return {
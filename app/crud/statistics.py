@@ -1,9 +1,10 @@
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from collections import Counter
+from sqlalchemy import case, func
+from datetime import datetime
 
-from app.models import User, Vehicle, MaintenanceRecord, MaintenanceReminder
+from app.models import User, Vehicle, MaintenanceReminder, UserStats, VehicleStats
 from app.schemas.statistics import UserMaintenanceStats
+from app.crud.versions import crud_fetch_user_data_version
 
 
 def crud_fetch_user_maintenance_statistics(db: Session, current_user: User) -> dict:
@@ -18,22 +19,34 @@ def crud_fetch_user_maintenance_statistics(db: Session, current_user: User) -> d
     most_maintained_vehicle: Optional[str] = None
     """
 
-    user_vehicles = db.query(Vehicle).filter(Vehicle.user_id == current_user.id).all()
-    vehicle_ids = [v.id for v in user_vehicles]
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    user_stats = db.query(UserStats).filter(UserStats.user_id == current_user.id).first() or UserStats(
+        vehicle_count=0, record_count=0, total_cost=0.0, max_cost=0.0, reminder_count=0
+    )
 
-    maintenance_stats = query_maintenance_records(db=db, vehicle_ids=vehicle_ids)
+    # if there is a tie, as in equal amounts of maintenance records for a vehicle, the vehicle
+    # whose first record was logged earliest wins
+    most_maintained_vehicle_row = (
+        db.query(Vehicle.nickname)
+        .join(VehicleStats, VehicleStats.vehicle_id == Vehicle.id)
+        .filter(VehicleStats.user_id == current_user.id, VehicleStats.record_count > 0)
+        .order_by(VehicleStats.record_count.desc(), VehicleStats.first_record_id.asc())
+        .limit(1)
+        .first()
+    )
 
-    maintenance_reminder_stats = query_maintenance_reminders(db=db, vehicle_ids=vehicle_ids)
+    # Overdue and upcoming move with the clock rather than with writes, so they are still counted per request
+    maintenance_reminder_stats = query_maintenance_reminders(db=db, user_id=current_user.id)
 
     stats = UserMaintenanceStats(
-        total_amount_of_vehicles=len(vehicle_ids),
-        total_maintenance_records=maintenance_stats.get("total_maintenance_records"),
-        total_maintenance_cost=maintenance_stats.get("total_maintenance_cost"),
-        total_maintenance_reminders=maintenance_reminder_stats.get("total_maintenance_reminders"),
+        total_amount_of_vehicles=user_stats.vehicle_count,
+        total_maintenance_records=user_stats.record_count,
+        total_maintenance_cost=user_stats.total_cost,
+        total_maintenance_reminders=user_stats.reminder_count,
         upcoming_reminder_count=maintenance_reminder_stats.get("upcoming_reminder_count"),
         overdue_reminder_count=maintenance_reminder_stats.get("overdue_reminder_count"),
-        highest_cost_maintenance_record=maintenance_stats.get("highest_cost_maintenance_record"),
-        most_maintained_vehicle=maintenance_stats.get("most_maintained_vehicle")
+        highest_cost_maintenance_record=user_stats.max_cost,
+        most_maintained_vehicle=most_maintained_vehicle_row[0] if most_maintained_vehicle_row else None
     )
 
     message = "User maintenance stats fetched successfully."
@@ -41,40 +54,26 @@ def crud_fetch_user_maintenance_statistics(db: Session, current_user: User) -> d
     return {"stats": stats, "generated_at": datetime.utcnow(), "message": message}
 
 
-def query_maintenance_records(db: Session, vehicle_ids: list) -> dict:
-    maintenance_records = db.query(MaintenanceRecord).filter(MaintenanceRecord.vehicle_id.in_(vehicle_ids)).all()
-    for record in maintenance_records:
-        print(f"ID: {record.id}, Cost: {record.cost}, Vehicle: {record.vehicle.nickname}")
-
-    total_maintenance_records = len(maintenance_records)
-    total_maintenance_cost = sum(record.cost for record in maintenance_records if record.cost)
-
-    valid_costs = [record.cost for record in maintenance_records if record.cost is not None]
-
-    highest_cost_maintenance_record = float(max(valid_costs))
-
-    vehicle_counts = Counter([record.vehicle_id for record in maintenance_records])
-    # if there is a tie, as in equal amounts of maintenance records for a vehicle, index 0 will be set as val
-    most_maintained_vehicle_id = vehicle_counts.most_common(1)[0][0] if vehicle_counts else None
+def crud_fetch_user_statistics_version(db: Session, current_user: User) -> str:
+    """
+    Statistics also move with the clock, a reminder turns overdue once its notify_at passes. The next notify_at
+    still ahead is part of the version, so it changes the moment that happens even without a write.
+    """
+    now = datetime.utcnow()
 
-    most_maintained_vehicle = None
-    if most_maintained_vehicle_id:
-        # Pycharm doesn't like the '==' comparator but works just fine at runtime
-        most_maintained_vehicle_obj = db.query(Vehicle.nickname).filter(
-            Vehicle.id == most_maintained_vehicle_id).first()
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    next_notify_at = db.query(func.min(MaintenanceReminder.notify_at)).filter(
+        MaintenanceReminder.user_id == current_user.id,
+        MaintenanceReminder.notify_at > now
+    ).scalar()
 
-        if most_maintained_vehicle_obj:
-            most_maintained_vehicle = most_maintained_vehicle_obj[0]
+    version = crud_fetch_user_data_version(db=db, user_id=current_user.id)
+    next_change = int(next_notify_at.timestamp()) if next_notify_at else 0
 
-    return {
-        "total_maintenance_records": total_maintenance_records,
-        "total_maintenance_cost": total_maintenance_cost,
-        "highest_cost_maintenance_record": highest_cost_maintenance_record,
-        "most_maintained_vehicle": most_maintained_vehicle
-    }
+    return f"{version}.{next_change}"
 
 
-def query_maintenance_reminders(db: Session, vehicle_ids: list) -> dict:
+def query_maintenance_reminders(db: Session, user_id: int) -> dict:
     """
     total_maintenance_reminders=,
     upcoming_reminder_count=,
@@ -82,53 +81,14 @@ def query_maintenance_reminders(db: Session, vehicle_ids: list) -> dict:
     """
     now = datetime.utcnow()
 
-    reminders = db.query(MaintenanceReminder).filter(MaintenanceReminder.vehicle_id.in_(vehicle_ids)).all()
-
-    total_maintenance_reminders = len(reminders)
-
-    upcoming_reminder_count = 0
-    overdue_reminder_count = 0
-
-    for reminder in reminders:
-        is_upcoming = False
-        is_overdue = False
-
-        if reminder.last_serviced_date:
-            starting_reminder_date = reminder.last_serviced_date
-        elif reminder.updated_at:
-            starting_reminder_date = reminder.updated_at
-        else:
-            starting_reminder_date = reminder.created_at
-
-        if reminder.interval_months:
-            service_due_date = starting_reminder_date + timedelta(days=(reminder.interval_months * 30))
-            notify_before_date = service_due_date - timedelta(days=reminder.notify_before_days)
-
-            if now >= notify_before_date:
-                is_overdue = True
-            else:
-                is_upcoming = True
-
-        if (
-                reminder.last_serviced_mileage is not None and
-                reminder.interval_miles and
-                reminder.estimated_miles_driven_per_month
-        ):
-            service_mileage_due = reminder.last_serviced_mileage + reminder.interval_miles
-            notify_before_mileage = service_mileage_due - reminder.notify_before_miles
-
-            estimated_months_passed = (now - starting_reminder_date).days / 30
-            estimated_miles_driven = reminder.estimated_miles_driven_per_month * estimated_months_passed
-
-            if estimated_miles_driven + reminder.last_serviced_mileage >= notify_before_mileage:
-                is_overdue = True
-            else:
-                is_upcoming = True
-
-        if is_overdue:
-            overdue_reminder_count += 1
-        elif is_upcoming:
-            upcoming_reminder_count += 1
+    # notify_at is persisted by apply_reminder_schedule, so overdue/upcoming are plain range counts. Inactive
+    # reminders are counted too, as they always were here, GET /reminders/due/ leaves them out
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    total_maintenance_reminders, overdue_reminder_count, upcoming_reminder_count = db.query(
+        func.count(MaintenanceReminder.id),
+        func.coalesce(func.sum(case((MaintenanceReminder.notify_at <= now, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((MaintenanceReminder.notify_at > now, 1), else_=0)), 0)
+    ).filter(MaintenanceReminder.user_id == user_id).one()
 
     return {
         "total_maintenance_reminders": total_maintenance_reminders,
@@ -0,0 +1,250 @@
+"""
+Keeps user_stats and vehicle_stats in step with every write and rebuilds them from scratch.
+
+    python -m app.crud.user_stats [--check] [--user-id ID]
+
+The command recomputes every user's totals from their vehicles, maintenance records and reminders, reports the
+users whose stored totals disagree and writes the recomputed ones. --check only reports.
+"""
+from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, insert, select, update
+from typing import Iterable, Optional
+import argparse
+import math
+
+from app.models import User, Vehicle, MaintenanceRecord, MaintenanceReminder, UserStats, VehicleStats
+from app.crud.versions import UPSERTS
+
+
+USER_TOTALS = ("vehicle_count", "record_count", "total_cost", "max_cost", "reminder_count")
+VEHICLE_TOTALS = ("record_count", "total_cost", "reminder_count", "first_record_id")
+
+
+def _upsert_adding(db: Session, model, key: str, values: dict) -> None:
+    upsert = UPSERTS[db.get_bind().dialect.name]
+
+    statement = upsert(model).values(**values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[getattr(model, key)],
+        set_={
+            column: getattr(model, column) + getattr(statement.excluded, column)
+            for column in values if column not in (key, "user_id")
+        }
+    )
+    db.execute(statement)
+
+
+def crud_adjust_user_stats(
+        db: Session,
+        user_id: int,
+        vehicle_id: Optional[int] = None,
+        vehicles: int = 0,
+        records: int = 0,
+        cost: float = 0.0,
+        reminders: int = 0
+) -> None:
+    """
+    Adds the deltas to the user's totals, and to the vehicle's when vehicle_id is given, creating either row on
+    its first write. Call it before the commit of the write it describes, like crud_bump_user_data_version.
+    """
+    _upsert_adding(db, UserStats, "user_id", {
+        "user_id": user_id,
+        "vehicle_count": vehicles,
+        "record_count": records,
+        "total_cost": cost,
+        "reminder_count": reminders
+    })
+
+    if vehicle_id is not None:
+        _upsert_adding(db, VehicleStats, "vehicle_id", {
+            "vehicle_id": vehicle_id,
+            "user_id": user_id,
+            "record_count": records,
+            "total_cost": cost,
+            "reminder_count": reminders
+        })
+
+
+def crud_refresh_user_stats_extremes(db: Session, user_id: int, vehicle_id: Optional[int] = None) -> None:
+    """
+    The highest cost and a vehicle's first record can't be adjusted by a delta once the row holding them changes
+    or goes away, so they are read back after the write, one seek each on the (user_id, cost) and vehicle_id
+    indexes. Flushes the session first.
+    """
+    db.flush()
+
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    max_cost = select(func.coalesce(func.max(MaintenanceRecord.cost), 0.0)).where(
+        MaintenanceRecord.user_id == user_id
+    ).scalar_subquery()
+    db.execute(update(UserStats).where(UserStats.user_id == user_id).values(max_cost=max_cost))
+
+    if vehicle_id is not None:
+        first_record_id = select(func.min(MaintenanceRecord.id)).where(
+            MaintenanceRecord.vehicle_id == vehicle_id
+        ).scalar_subquery()
+        db.execute(
+            update(VehicleStats).where(VehicleStats.vehicle_id == vehicle_id).values(first_record_id=first_record_id)
+        )
+
+
+def crud_remove_vehicle_stats(db: Session, user_id: int, vehicle_id: int) -> None:
+    """Takes a vehicle being deleted, with its records and reminders, out of the user's totals."""
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    vehicle_stats = db.query(VehicleStats).filter(VehicleStats.vehicle_id == vehicle_id).first()
+
+    if vehicle_stats is None:
+        crud_adjust_user_stats(db=db, user_id=user_id, vehicles=-1)
+    else:
+        crud_adjust_user_stats(
+            db=db,
+            user_id=user_id,
+            vehicles=-1,
+            records=-vehicle_stats.record_count,
+            cost=-vehicle_stats.total_cost,
+            reminders=-vehicle_stats.reminder_count
+        )
+        db.delete(vehicle_stats)
+
+
+def crud_delete_user_stats(db: Session, user_id: int) -> None:
+    # The foreign keys cascade only where the database enforces them, SQLite would otherwise hand a reused id the
+    # deleted user's totals
+    db.execute(delete(VehicleStats).where(VehicleStats.user_id == user_id))
+    db.execute(delete(UserStats).where(UserStats.user_id == user_id))
+
+
+def compute_user_stats(db: Session, user_ids: Optional[Iterable[int]] = None) -> tuple:
+    """
+    Totals recomputed from the vehicles, maintenance records and reminders themselves, as
+    ({user_id: user totals}, {vehicle_id: vehicle totals}). Covers every user unless user_ids is given.
+    """
+    user_query = db.query(User.id)
+    vehicle_query = db.query(Vehicle.id, Vehicle.user_id)
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        user_query = user_query.filter(User.id.in_(user_ids))
+        vehicle_query = vehicle_query.filter(Vehicle.user_id.in_(user_ids))
+
+    users = {
+        user_id: {"vehicle_count": 0, "record_count": 0, "total_cost": 0.0, "max_cost": 0.0, "reminder_count": 0}
+        for (user_id,) in user_query
+    }
+    vehicles = {
+        vehicle_id: {"user_id": user_id, "record_count": 0, "total_cost": 0.0, "reminder_count": 0,
+                     "first_record_id": None}
+        for vehicle_id, user_id in vehicle_query
+    }
+    vehicle_ids = select(vehicle_query.subquery().c.id)
+
+    records = db.query(
+        MaintenanceRecord.vehicle_id,
+        func.count(MaintenanceRecord.id),
+        func.coalesce(func.sum(MaintenanceRecord.cost), 0.0),
+        func.coalesce(func.max(MaintenanceRecord.cost), 0.0),
+        func.min(MaintenanceRecord.id)
+    ).filter(MaintenanceRecord.vehicle_id.in_(vehicle_ids)).group_by(MaintenanceRecord.vehicle_id)
+
+    reminders = db.query(MaintenanceReminder.vehicle_id, func.count(MaintenanceReminder.id)).filter(
+        MaintenanceReminder.vehicle_id.in_(vehicle_ids)
+    ).group_by(MaintenanceReminder.vehicle_id)
+
+    for vehicle_id, record_count, total_cost, max_cost, first_record_id in records:
+        vehicles[vehicle_id].update(record_count=record_count, total_cost=float(total_cost),
+                                    first_record_id=first_record_id)
+        user = users[vehicles[vehicle_id]["user_id"]]
+        user["max_cost"] = max(user["max_cost"], float(max_cost))
+
+    for vehicle_id, reminder_count in reminders:
+        vehicles[vehicle_id]["reminder_count"] = reminder_count
+
+    for vehicle in vehicles.values():
+        user = users[vehicle["user_id"]]
+        user["vehicle_count"] += 1
+        user["record_count"] += vehicle["record_count"]
+        user["total_cost"] += vehicle["total_cost"]
+        user["reminder_count"] += vehicle["reminder_count"]
+
+    return users, vehicles
+
+
+def _totals_differ(stored, computed: dict, columns: tuple) -> bool:
+    if stored is None:
+        return any(computed[column] for column in columns)
+
+    for column in columns:
+        stored_value, computed_value = getattr(stored, column), computed[column]
+        if isinstance(computed_value, float):
+            # total_cost is built up by additions and subtractions, allow for the rounding they pick up
+            if not math.isclose(stored_value, computed_value, rel_tol=1e-9, abs_tol=1e-6):
+                return True
+        elif stored_value != computed_value:
+            return True
+
+    return False
+
+
+def crud_rebuild_user_stats(db: Session, user_ids: Optional[Iterable[int]] = None, write: bool = True) -> dict:
+    """
+    Recomputes user_stats and vehicle_stats for user_ids, or everyone, and replaces the stored rows unless write
+    is False. Returns how many users were checked and the ids of those whose stored totals were off.
+    """
+    users, vehicles = compute_user_stats(db=db, user_ids=user_ids)
+
+    stored_users = {row.user_id: row for row in db.query(UserStats).filter(UserStats.user_id.in_(list(users)))}
+    stored_vehicles = {
+        row.vehicle_id: row for row in db.query(VehicleStats).filter(VehicleStats.user_id.in_(list(users)))
+    }
+
+    mismatched = {
+        user_id for user_id, computed in users.items()
+        if _totals_differ(stored_users.get(user_id), computed, USER_TOTALS)
+    }
+    mismatched.update(
+        computed["user_id"] for vehicle_id, computed in vehicles.items()
+        if _totals_differ(stored_vehicles.get(vehicle_id), computed, VEHICLE_TOTALS)
+    )
+
+    if write:
+        db.execute(delete(VehicleStats).where(VehicleStats.user_id.in_(list(users))))
+        db.execute(delete(UserStats).where(UserStats.user_id.in_(list(users))))
+        if users:
+            db.execute(insert(UserStats), [{"user_id": user_id, **totals} for user_id, totals in users.items()])
+        if vehicles:
+            db.execute(
+                insert(VehicleStats), [{"vehicle_id": vehicle_id, **totals} for vehicle_id, totals in vehicles.items()]
+            )
+        db.commit()
+
+    return {"users": len(users), "mismatched": sorted(mismatched)}
+
+
+def crud_backfill_user_stats(db: Session) -> int:
+    """Builds the rows of users who have none yet, e.g. everyone in a database from before user_stats existed."""
+    missing = db.query(User.id).filter(~select(UserStats.user_id).where(UserStats.user_id == User.id).exists())
+    user_ids = [user_id for (user_id,) in missing]
+
+    if user_ids:
+        crud_rebuild_user_stats(db=db, user_ids=user_ids)
+
+    return len(user_ids)
+
+
+def main():
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="Only report users whose stored totals are off")
+    parser.add_argument("--user-id", type=int, action="append", help="Limit to these users, repeatable")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        result = crud_rebuild_user_stats(db=db, user_ids=args.user_id, write=not args.check)
+
+    print(f"Checked {result['users']} users, {len(result['mismatched'])} with stale totals.")
+    for user_id in result["mismatched"]:
+        print(f"  user {user_id}")
+
+
+if __name__ == "__main__":
+    main()
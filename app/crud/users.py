@@ -1,11 +1,24 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import select, func
 from fastapi import HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from typing import Type, List
+from typing import Type, Optional, Iterator
+import json
+import os
 
 from app.models import User
 from app.schemas.users import UserCreate, UserLogin, UserUpdate, UserResponse
-from app.utils.security import hash_password, verify_password, create_access_token
+from app.utils.security import hash_password, verify_password, verify_and_update_password, create_access_token
+from app.utils.security import invalidate_cached_user
+from app.utils.cache import TTLCache
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.crud.user_stats import crud_delete_user_stats
+
+
+# Registering or deleting a user drops the cached total in this process, other workers catch up after the TTL
+USER_COUNT_TTL_SECONDS = float(os.getenv("USER_COUNT_TTL_SECONDS", 60))
+
+user_count_cache = TTLCache(name="user_count_cache", max_entries=1, ttl_seconds=USER_COUNT_TTL_SECONDS)
 
 
 def crud_register_new_user(db: Session, user: UserCreate) -> User:
@@ -35,17 +48,32 @@ def crud_register_new_user(db: Session, user: UserCreate) -> User:
     db.commit()
     db.refresh(new_user)
 
+    user_count_cache.clear()
+
     return new_user
 
 
 def crud_authenticate_user(db: Session, username: str, password: str) -> Type[User]:
     user = db.query(User).filter(User.username == username).first()
-    if not user or not verify_password(password, user.password_hash):
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials."
         )
 
+    verified, new_hash = verify_and_update_password(password, user.password_hash)
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid credentials."
+        )
+
+    # Hash was made with another BCRYPT_ROUNDS, store it again at the current cost
+    if new_hash:
+        user.password_hash = new_hash
+        db.commit()
+        invalidate_cached_user(user_id=user.id)
+
     return user
 
 
@@ -93,9 +121,47 @@ def crud_fetch_user_by_id(db: Session, user_id: int) -> Type[User]:
     return user
 
 
-def crud_fetch_all_users(db: Session) -> List[Type[User]]:
-    users = db.query(User).all()
-    return users
+def crud_count_users(db: Session) -> int:
+    total = user_count_cache.get("total")
+    if total is None:
+        total = db.scalar(select(func.count(User.id)))
+        user_count_cache.set("total", total)
+
+    return total
+
+
+def crud_fetch_all_users(
+        db: Session,
+        limit: int = DEFAULT_PAGE_SIZE,
+        after_id: Optional[int] = None,
+        include_total: bool = False
+) -> dict:
+
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    query = db.query(User)
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+
+    users = query.order_by(User.id.asc()).limit(limit + 1).all()
+
+    next_after_id = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_after_id = users[-1].id
+
+    total = crud_count_users(db=db) if include_total else None
+
+    return {"users": users, "next_after_id": next_after_id, "total": total}
+
+
+def crud_stream_all_users(db: Session, batch_size: int = 1000) -> Iterator[str]:
+    rows = db.execute(
+        select(User.id, User.username, User.email).order_by(User.id.asc()).execution_options(yield_per=batch_size)
+    )
+
+    for user_id, username, email in rows:
+        yield json.dumps({"id": user_id, "username": username, "email": email}) + "\n"
 
 
 def crud_update_user(db: Session, user_id: int, user_update: UserUpdate) -> dict:
@@ -157,6 +223,8 @@ def crud_update_user(db: Session, user_id: int, user_update: UserUpdate) -> dict
     db.commit()
     db.refresh(db_user)
 
+    invalidate_cached_user(user_id=db_user.id)
+
     updated_data = UserResponse(id=db_user.id, username=db_user.username, email=db_user.email)
 
     updated_vals = [key for key, val in changes.items() if val]
@@ -178,7 +246,11 @@ def crud_delete_user(db: Session, user_id: int) -> dict:
             detail=f"User: {user_id} not found."
         )
 
+    crud_delete_user_stats(db=db, user_id=user_id)
     db.delete(db_user)
     db.commit()
 
+    invalidate_cached_user(user_id=user_id)
+    user_count_cache.clear()
+
     return {"user_id": user_id, "message": f"User: {user_id} successfully deleted."}
@@ -1,3 +1,4 @@
+from sqlalchemy import bindparam, select
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 from typing import Optional
@@ -5,6 +6,35 @@ from typing import Optional
 from app.models import Vehicle, User
 from app.schemas.vehicles import VehicleCreate, VehicleUpdate, VehicleResponse
 from app.utils.vehicles import make_vehicle_response
+from app.utils.pagination import paginate_query, DEFAULT_PAGE_SIZE
+from app.utils.fields import FieldSelection, apply_field_selection
+from app.utils.filters import FilterField, FilterSpec, TEXT_MATCH_MODES, fetch_filtered_page
+from app.crud.versions import crud_bump_user_data_version
+from app.crud.user_stats import crud_adjust_user_stats, crud_refresh_user_stats_extremes, crud_remove_vehicle_stats
+from app.crud.reminder import crud_refresh_vehicle_reminder_schedules
+
+
+VEHICLE_FILTERS = FilterSpec(
+    name="vehicles",
+    model=Vehicle,
+    # Pycharm does not like '==' comparator for SQL queries - works fine at runtime
+    statement=select(Vehicle).where(Vehicle.user_id == bindparam("user_id")),
+    fields={
+        "vehicle_type": FilterField(Vehicle.vehicle_type, "text"),
+        "make": FilterField(Vehicle.make, "text"),
+        "model": FilterField(Vehicle.model, "text"),
+        "color": FilterField(Vehicle.color, "text"),
+        "year": FilterField(Vehicle.year, "equal"),
+        "mileage": FilterField(Vehicle.mileage, "equal"),
+        "vin": FilterField(Vehicle.vin, "text"),
+        "license_plate": FilterField(Vehicle.license_plate, "text"),
+        "registration_state": FilterField(Vehicle.registration_state, "text"),
+        "fuel_type": FilterField(Vehicle.fuel_type, "text"),
+        "transmission_type": FilterField(Vehicle.transmission_type, "text"),
+        "is_active": FilterField(Vehicle.is_active, "equal"),
+        "nickname": FilterField(Vehicle.nickname, "text")
+    }
+)
 
 
 def crud_register_new_vehicle(db: Session, current_user: User, vehicle_create: VehicleCreate) -> Vehicle:
@@ -46,17 +76,30 @@ def crud_register_new_vehicle(db: Session, current_user: User, vehicle_create: V
     )
 
     db.add(new_vehicle)
+    db.flush()
+    crud_adjust_user_stats(db=db, user_id=current_user.id, vehicle_id=new_vehicle.id, vehicles=1)
+    crud_bump_user_data_version(db=db, user_id=current_user.id)
     db.commit()
     db.refresh(new_vehicle)
 
     return new_vehicle
 
 
-def crud_fetch_user_vehicles(db: Session, current_user: User) -> dict:
-    return {"vehicles": db.query(Vehicle).filter_by(user_id=current_user.id).all()}
+def crud_fetch_user_vehicles(
+        db: Session,
+        current_user: User,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None,
+        fields: Optional[FieldSelection] = None
+) -> dict:
+
+    query = db.query(Vehicle).filter_by(user_id=current_user.id)
+
+    if fields is not None:
+        query = apply_field_selection(query=query, model=Vehicle, selection=fields)
+    vehicles, next_cursor = paginate_query(query=query, model=Vehicle, limit=limit, cursor=cursor)
 
-    # Pycharm doesn't like the '==' comparator but works just fine at runtime
-    # return {"vehicles": db.query(Vehicle).filter(Vehicle.user_id == current_user.id).all()}
+    return {"vehicles": vehicles, "next_cursor": next_cursor}
 
 
 def crud_filter_user_vehicles(
@@ -74,7 +117,10 @@ def crud_filter_user_vehicles(
     fuel_type: Optional[str] = None,
     transmission_type: Optional[str] = None,
     is_active: Optional[bool] = None,
-    nickname: Optional[str] = None
+    nickname: Optional[str] = None,
+    match: str = "prefix",
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None
 ) -> dict:
 
     filters = {
@@ -93,24 +139,23 @@ def crud_filter_user_vehicles(
         "nickname": nickname
     }
 
-    if all(value is None for value in filters.values()):
+    if match not in TEXT_MATCH_MODES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="At least one filter parameter must be provided."
+            detail=f"match must be one of: {', '.join(TEXT_MATCH_MODES)}."
         )
 
-    # Pycharm does not like '==' comparator for SQL queries - works fine at runtime
-    query = db.query(Vehicle).filter(Vehicle.user_id == current_user.id)
-
-    for attr, value in filters.items():
-        if value is not None:
-            column = getattr(Vehicle, attr)
-            if isinstance(value, str):
-                query = query.filter(column.ilike(f"%{value}%"))
-            else:
-                query = query.filter(column == value)
+    vehicles, next_cursor = fetch_filtered_page(
+        db=db,
+        spec=VEHICLE_FILTERS,
+        user_id=current_user.id,
+        filters=filters,
+        limit=limit,
+        cursor=cursor,
+        match=match
+    )
 
-    return {"vehicles": query.all()}
+    return {"vehicles": vehicles, "next_cursor": next_cursor}
 
 
 def crud_update_vehicle(db: Session, current_user: User, vehicle_id: int, update_data: VehicleUpdate) -> dict:
@@ -142,6 +187,10 @@ def crud_update_vehicle(db: Session, current_user: User, vehicle_id: int, update
             "update_message": f"No updates were made to vehicle ID {vehicle_id}."
         }
 
+    if changes.get("mileage"):
+        crud_refresh_vehicle_reminder_schedules(db=db, vehicle=vehicle)
+
+    crud_bump_user_data_version(db=db, user_id=current_user.id)
     db.commit()
     db.refresh(vehicle)
 
@@ -162,7 +211,10 @@ def crud_delete_vehicle(db: Session, current_user: User, vehicle_id: int) -> dic
             detail=f"Vehicle ID {vehicle_id} not found or not owned by you."
         )
 
+    crud_remove_vehicle_stats(db=db, user_id=current_user.id, vehicle_id=vehicle_id)
     db.delete(vehicle)
+    crud_refresh_user_stats_extremes(db=db, user_id=current_user.id)
+    crud_bump_user_data_version(db=db, user_id=current_user.id)
     db.commit()
 
     return {"vehicle_id": vehicle_id, "message": f"Vehicle ID: {vehicle_id} deleted successfully."}
@@ -0,0 +1,33 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.models import UserDataVersion
+
+
+UPSERTS = {
+    "sqlite": sqlite_insert,
+    "postgresql": postgresql_insert,
+}
+
+
+def crud_bump_user_data_version(db: Session, user_id: int) -> None:
+    """
+    Called before the commit of every write to a user's vehicles, maintenance records or reminders, so the new
+    version becomes visible together with the data it describes.
+    """
+    insert = UPSERTS[db.get_bind().dialect.name]
+
+    statement = insert(UserDataVersion).values(user_id=user_id, version=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[UserDataVersion.user_id],
+        set_={"version": UserDataVersion.version + 1}
+    )
+    db.execute(statement)
+
+
+def crud_fetch_user_data_version(db: Session, user_id: int) -> int:
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    version = db.query(UserDataVersion.version).filter(UserDataVersion.user_id == user_id).scalar()
+
+    return version or 0
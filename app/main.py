@@ -2,24 +2,85 @@ import uvicorn
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
-from app.routes import users, vehicles, maintenance, reminder, statistics
-from app.models import Base
-from app.database import engine
+from app.routes import users, vehicles, maintenance, reminder, statistics, metrics
+from app.models import (
+    Base, ensure_maintenance_search_index, ensure_owner_columns, ensure_reminder_scheduler_index,
+    ensure_notification_columns, ensure_reminder_schedule_columns, ensure_query_indexes
+)
+from app.database import engine, SessionLocal, async_engine
+from app.crud.reminder import crud_backfill_reminder_schedules
+from app.crud.user_stats import crud_backfill_user_stats
+from app.utils.compression import CompressionMiddleware
+from app.utils.scheduler import REMINDER_SCHEDULER_ENABLED, ReminderScheduler, set_active_scheduler, log_sink
+from app.utils.outbox import OutboxDispatcher, configured_sinks
 
 
 @asynccontextmanager
 async def lifespan(app_name: FastAPI):
+    # Databases created before the search index existed get it, and their records indexed, on first start.
+    # Likewise for the owner columns on maintenance records and reminders, which the ORM selects from here on,
+    # and the reminders' schedule columns, which come first as the owner indexes cover notify_at.
+    with engine.begin() as connection:
+        ensure_maintenance_search_index(connection)
+        ensure_reminder_schedule_columns(connection)
+        ensure_owner_columns(connection)
+        ensure_reminder_scheduler_index(connection)
+        ensure_notification_columns(connection)
+        # create_all leaves existing tables alone, so indexes declared since are added here
+        ensure_query_indexes(connection)
+
+    with SessionLocal() as db:
+        crud_backfill_reminder_schedules(db=db)
+        # Users from before user_stats existed get their totals computed once, later writes keep them current
+        crud_backfill_user_stats(db=db)
+
+    # With a notification sink configured, due reminders go through the outbox and are delivered by its workers,
+    # which also drain what other processes queued. Without one they are only logged.
+    outbox_dispatcher = None
+    sinks = configured_sinks()
+    if sinks:
+        outbox_dispatcher = OutboxDispatcher(session_factory=SessionLocal, sinks=sinks)
+        outbox_dispatcher.start()
+    app_name.state.outbox_dispatcher = outbox_dispatcher
+
+    # Fires reminders as they come due, rebuilt from the database on every start
+    reminder_scheduler = None
+    if REMINDER_SCHEDULER_ENABLED:
+        reminder_scheduler = ReminderScheduler(
+            session_factory=SessionLocal,
+            sink=outbox_dispatcher.enqueue if outbox_dispatcher is not None else log_sink,
+            # The outbox marks what it queued in last_notified_at, a failed batch is found again on the next rebuild
+            sink_records_notified=outbox_dispatcher is not None
+        )
+        set_active_scheduler(reminder_scheduler)
+        reminder_scheduler.start()
+    app_name.state.reminder_scheduler = reminder_scheduler
+
     print("Server has started.")
     yield
+    if reminder_scheduler is not None:
+        set_active_scheduler(None)
+        reminder_scheduler.stop()
+    if outbox_dispatcher is not None:
+        outbox_dispatcher.stop()
+    await async_engine.dispose()
     print("Server has closed.")
 
 app = FastAPI(lifespan=lifespan)
 
+# List responses repeat the same vehicle block on every row and shrink several times over.
+# The NDJSON exports are streamed line by line and stay uncompressed.
+app.add_middleware(
+    CompressionMiddleware,
+    excluded_paths=("/exports/users/", "/maintenance_records/export/")
+)
+
 app.include_router(users.router)
 app.include_router(vehicles.router)
 app.include_router(maintenance.router)
 app.include_router(reminder.router)
 app.include_router(statistics.router)
+app.include_router(metrics.router)
 
 Base.metadata.create_all(bind=engine)
 
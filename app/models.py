@@ -1,10 +1,18 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, ForeignKey, Float, DateTime, Boolean, Index, JSON, UniqueConstraint
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.sql import func
 
 from app.database import Base
 
 
+# SQLite's CURRENT_TIMESTAMP stores whole seconds while bound datetimes carry microseconds, so comparing a
+# server stamped created_at with a cursor value never matches. Binding without microseconds keeps them equal.
+CreatedAt = DateTime(timezone=True).with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite")
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -16,6 +24,37 @@ class User(Base):
     vehicles = relationship("Vehicle", back_populates="user", cascade="all, delete-orphan")
 
 
+class UserDataVersion(Base):
+    __tablename__ = "user_data_versions"
+
+    # Bumped in the same transaction as every write to a user's vehicles, maintenance records and reminders
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class UserStats(Base):
+    __tablename__ = "user_stats"
+
+    # Totals behind GET /statistics/, adjusted in the same transaction as every write, see app/crud/user_stats.py
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    vehicle_count = Column(Integer, nullable=False, default=0)
+    record_count = Column(Integer, nullable=False, default=0)
+    total_cost = Column(Float, nullable=False, default=0.0)
+    max_cost = Column(Float, nullable=False, default=0.0)
+    reminder_count = Column(Integer, nullable=False, default=0)
+
+
+class VehicleStats(Base):
+    __tablename__ = "vehicle_stats"
+
+    vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    record_count = Column(Integer, nullable=False, default=0)
+    total_cost = Column(Float, nullable=False, default=0.0)
+    reminder_count = Column(Integer, nullable=False, default=0)
+    first_record_id = Column(Integer, nullable=True)  # Breaks most maintained vehicle ties, earliest record wins
+
+
 class Vehicle(Base):
     __tablename__ = "vehicles"
 
@@ -35,7 +74,7 @@ class Vehicle(Base):
     is_active = Column(Boolean, index=True)  # True/False
     nickname = Column(String)  # Big Bertha
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(CreatedAt, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     user = relationship("User", back_populates="vehicles")
@@ -48,29 +87,124 @@ class Vehicle(Base):
         "MaintenanceReminder", back_populates="vehicle", cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        Index("ix_vehicles_user_id_created_at_id", "user_id", "created_at", "id"),
+        # Case-insensitive prefix filters on /vehicles/filtered/ seek these instead of scanning the user's vehicles
+        Index("ix_vehicles_user_id_lower_make", user_id, func.lower(make)),
+        Index("ix_vehicles_user_id_lower_model", user_id, func.lower(model)),
+        Index("ix_vehicles_user_id_lower_color", user_id, func.lower(color)),
+        Index("ix_vehicles_user_id_lower_vin", user_id, func.lower(vin)),
+        Index("ix_vehicles_user_id_lower_license_plate", user_id, func.lower(license_plate)),
+        Index("ix_vehicles_user_id_lower_nickname", user_id, func.lower(nickname)),
+    )
+
 
 class MaintenanceRecord(Base):
     __tablename__ = "maintenance_records"
 
     id = Column(Integer, primary_key=True, index=True)
     vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), index=True)
+    # The owning vehicle's user_id, copied so ownership checks and per-user pages don't go through vehicles
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     maintenance_provider = Column(String, index=True)  # Valvoline, Quick-I-Lube, Self
     maintenance_type = Column(String, index=True)  # Oil Change, Brake Replacement
     description = Column(String)  # Replaced brakes for all wheels, Emptied and replaced oil with synthetic grade oil
     mileage = Column(Integer)  # 133150, 59800
     cost = Column(Float)  # 1256.12, 165.00
     serviced_at = Column(DateTime(timezone=True), index=True, nullable=True)  # Date of service
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # Date of data entry
+    created_at = Column(CreatedAt, server_default=func.now(), index=True)  # Date of data entry
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), index=True)  # Date of last update
 
     vehicle = relationship("Vehicle", back_populates="maintenance_records")
 
+    __table_args__ = (
+        # Keyset pages walk the user's records in (created_at, id) order starting right at the cursor
+        Index("ix_maintenance_records_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_maintenance_records_vehicle_id_created_at_id", "vehicle_id", "created_at", "id"),
+        # Range filters on /maintenance_records/filtered/ seek the user's slice instead of reading their history
+        Index("ix_maintenance_records_user_id_serviced_at", "user_id", "serviced_at"),
+        Index("ix_maintenance_records_user_id_cost", "user_id", "cost"),
+        Index("ix_maintenance_records_user_id_mileage", "user_id", "mileage"),
+    )
+
+
+# SQLite only, FTS5 index over description and maintenance_provider for GET /maintenance_records/search/.
+# It stores no text of its own (content=maintenance_records), the triggers keep the index in step with every
+# insert, update and delete, including rows removed by ON DELETE CASCADE.
+MAINTENANCE_SEARCH_TABLE = "maintenance_records_fts"
+
+MAINTENANCE_SEARCH_DDL = (
+    f"""
+    CREATE VIRTUAL TABLE {MAINTENANCE_SEARCH_TABLE} USING fts5(
+        description, maintenance_provider,
+        content='maintenance_records', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS maintenance_records_fts_insert AFTER INSERT ON maintenance_records BEGIN
+        INSERT INTO {MAINTENANCE_SEARCH_TABLE}(rowid, description, maintenance_provider)
+        VALUES (new.id, new.description, new.maintenance_provider);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS maintenance_records_fts_delete AFTER DELETE ON maintenance_records BEGIN
+        INSERT INTO {MAINTENANCE_SEARCH_TABLE}({MAINTENANCE_SEARCH_TABLE}, rowid, description, maintenance_provider)
+        VALUES ('delete', old.id, old.description, old.maintenance_provider);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS maintenance_records_fts_update
+    AFTER UPDATE OF description, maintenance_provider ON maintenance_records BEGIN
+        INSERT INTO {MAINTENANCE_SEARCH_TABLE}({MAINTENANCE_SEARCH_TABLE}, rowid, description, maintenance_provider)
+        VALUES ('delete', old.id, old.description, old.maintenance_provider);
+        INSERT INTO {MAINTENANCE_SEARCH_TABLE}(rowid, description, maintenance_provider)
+        VALUES (new.id, new.description, new.maintenance_provider);
+    END
+    """,
+)
+
+
+def ensure_maintenance_search_index(connection) -> bool:
+    """
+    Creates the search table and its triggers when they are missing and indexes the rows already stored.
+    Returns True if it had to. Does nothing on other backends, which search with ILIKE instead.
+    """
+    if connection.dialect.name != "sqlite":
+        return False
+
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": MAINTENANCE_SEARCH_TABLE}
+    ).first()
+
+    if exists:
+        return False
+
+    for statement in MAINTENANCE_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+
+    connection.exec_driver_sql(f"INSERT INTO {MAINTENANCE_SEARCH_TABLE}({MAINTENANCE_SEARCH_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+@event.listens_for(MaintenanceRecord.__table__, "after_create")
+def create_maintenance_search_index(target, connection, **kw):
+    ensure_maintenance_search_index(connection)
+
+
+@event.listens_for(MaintenanceRecord.__table__, "after_drop")
+def drop_maintenance_search_index(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {MAINTENANCE_SEARCH_TABLE}")
+
 
 class MaintenanceReminder(Base):
     __tablename__ = "maintenance_reminder"
 
     id = Column(Integer, primary_key=True, index=True)
     vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), index=True)
+    # The owning vehicle's user_id, copied so ownership checks and per-user pages don't go through vehicles
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     maintenance_type = Column(String, nullable=False)  # Oil-change, tire rotation
     details = Column(String, nullable=True)  # Oil-change required in 3k miles
     interval_miles = Column(Integer, nullable=True)  # 3000, 60000
@@ -81,7 +215,168 @@ class MaintenanceReminder(Base):
     notify_before_days = Column(Integer, default=14)  # 15, 30
     estimated_miles_driven_per_month = Column(Integer, default=500)  # default is less than average
     is_active = Column(Boolean, default=True)  # Bool
-    created_at = Column(DateTime(timezone=True), server_default=func.now())  # Date created in datetime
+    created_at = Column(CreatedAt, server_default=func.now())  # Date created in datetime
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), index=True)  # Date updated in datetime
 
+    # Derived on every write by apply_reminder_schedule so due lookups never recompute per row
+    next_due_date = Column(DateTime, nullable=True)  # Start date + interval_months
+    next_due_mileage = Column(Integer, nullable=True)  # last_serviced_mileage + interval_miles
+    notify_date = Column(DateTime, nullable=True)  # next_due_date - notify_before_days
+    notify_mileage = Column(Integer, nullable=True)  # next_due_mileage - notify_before_miles
+    notify_at = Column(DateTime, nullable=True)  # Earliest moment the reminder counts as overdue
+    last_notified_at = Column(DateTime, nullable=True)  # The notify_at a notification was last queued for
+
     vehicle = relationship("Vehicle", back_populates="maintenance_reminders")
+
+    __table_args__ = (
+        Index("ix_maintenance_reminder_vehicle_id_is_active_notify_at", "vehicle_id", "is_active", "notify_at"),
+        Index("ix_maintenance_reminder_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_maintenance_reminder_user_id_notify_at", "user_id", "notify_at"),
+        # The reminder scheduler streams every user's active reminders in notify_at order
+        Index("ix_maintenance_reminder_is_active_notify_at", "is_active", "notify_at"),
+        Index("ix_maintenance_reminder_vehicle_id_created_at_id", "vehicle_id", "created_at", "id"),
+        Index("ix_maintenance_reminder_user_id_last_serviced_date", "user_id", "last_serviced_date"),
+        Index("ix_maintenance_reminder_user_id_last_serviced_mileage", "user_id", "last_serviced_mileage"),
+    )
+
+
+# Tables whose rows carry a copy of their vehicle's user_id
+OWNED_BY_VEHICLE = (MaintenanceRecord, MaintenanceReminder)
+
+
+def _vehicle_owner(target):
+    # Pycharm doesn't like the '==' comparator but works just fine at runtime
+    return select(Vehicle.user_id).where(Vehicle.id == target.vehicle_id).scalar_subquery()
+
+
+def set_owner_on_insert(mapper, connection, target):
+    # Crud functions set user_id themselves, rows added any other way take it from their vehicle in the INSERT
+    if target.user_id is None:
+        target.user_id = _vehicle_owner(target)
+
+
+def set_owner_on_update(mapper, connection, target):
+    # A row moved to another vehicle follows that vehicle's owner
+    if inspect(target).attrs.vehicle_id.history.has_changes():
+        target.user_id = _vehicle_owner(target)
+
+
+for owned_model in OWNED_BY_VEHICLE:
+    event.listen(owned_model, "before_insert", set_owner_on_insert)
+    event.listen(owned_model, "before_update", set_owner_on_update)
+
+
+# Derived by apply_reminder_schedule, see crud_backfill_reminder_schedules for the rows stored before them
+REMINDER_SCHEDULE_COLUMNS = ("next_due_date", "next_due_mileage", "notify_date", "notify_mileage", "notify_at")
+
+
+def ensure_reminder_schedule_columns(connection) -> None:
+    """
+    Adds the derived schedule columns and the due lookup index to maintenance_reminder in databases created
+    before they existed. Runs before anything else indexes notify_at, the rows are filled in by the backfill.
+    """
+    table = MaintenanceReminder.__table__
+    columns = {column["name"] for column in inspect(connection).get_columns(table.name)}
+
+    for name in REMINDER_SCHEDULE_COLUMNS:
+        if name not in columns:
+            column_type = table.c[name].type.compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}")
+
+    for index in table.indexes:
+        if index.name == "ix_maintenance_reminder_vehicle_id_is_active_notify_at":
+            index.create(connection, checkfirst=True)
+
+
+def ensure_reminder_scheduler_index(connection) -> None:
+    # create_all only adds missing tables, databases from before the scheduler need its index added separately
+    for index in MaintenanceReminder.__table__.indexes:
+        if index.name == "ix_maintenance_reminder_is_active_notify_at":
+            index.create(connection, checkfirst=True)
+
+
+def ensure_notification_columns(connection) -> None:
+    # Databases from before the notification outbox lack the column recording which notify_at was sent
+    columns = {column["name"] for column in inspect(connection).get_columns(MaintenanceReminder.__tablename__)}
+
+    if "last_notified_at" not in columns:
+        column_type = DateTime().compile(dialect=connection.dialect)
+        connection.exec_driver_sql(
+            f"ALTER TABLE {MaintenanceReminder.__tablename__} ADD COLUMN last_notified_at {column_type}"
+        )
+
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # reminder-<id>-<notify_at>, the same due reminder always gets the same key and is queued once per sink
+    idempotency_key = Column(String, nullable=False)
+    sink = Column(String, nullable=False)  # mailbox, webhook
+    reminder_id = Column(Integer, nullable=False)  # No foreign key, a queued notification outlives its reminder
+    payload = Column(JSON, nullable=False)  # The message as every sink receives it
+    status = Column(String, nullable=False, default="pending")  # pending, delivered, failed
+    attempts = Column(Integer, nullable=False, default=0)  # Failed deliveries so far
+    # Due for delivery from here on. Claiming a row moves it a lease ahead, so a worker that dies mid batch
+    # only holds its rows until the lease runs out.
+    next_attempt_at = Column(DateTime, nullable=False)
+    claimed_by = Column(String, nullable=True)  # Token of the claim that last took the row
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    delivered_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("idempotency_key", "sink", name="uq_notification_outbox_idempotency_key_sink"),
+        # Workers claim the pending rows that are due, oldest first
+        Index("ix_notification_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+
+
+def ensure_owner_columns(connection) -> int:
+    """
+    Adds user_id and its indexes to maintenance_records and maintenance_reminder in databases created before
+    they existed, then copies the owner from vehicles into every row still missing it. Returns the rows filled.
+    """
+    filled = 0
+
+    for owned_model in OWNED_BY_VEHICLE:
+        table = owned_model.__table__
+        columns = {column["name"] for column in inspect(connection).get_columns(table.name)}
+
+        if "user_id" not in columns:
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table.name} ADD COLUMN user_id INTEGER REFERENCES users (id) ON DELETE CASCADE"
+            )
+
+        for index in table.indexes:
+            if "user_id" in index.columns:
+                index.create(connection, checkfirst=True)
+
+        # updated_at is kept as it was, the copy isn't an edit and reminders without a service date start their
+        # schedule from it
+        filled += connection.execute(
+            table.update()
+            .where(table.c.user_id.is_(None))
+            .values(
+                user_id=select(Vehicle.user_id).where(Vehicle.id == table.c.vehicle_id).scalar_subquery(),
+                updated_at=table.c.updated_at
+            )
+        ).rowcount
+
+    return filled
+
+
+# Tables whose list, filter and pagination queries rely on composite indexes declared in __table_args__
+INDEXED_TABLES = (Vehicle, MaintenanceRecord, MaintenanceReminder)
+
+
+def ensure_query_indexes(connection) -> None:
+    """
+    Creates every index declared on vehicles, maintenance records and reminders that a database created before it
+    lacks, the keyset pagination, range filter and case-insensitive prefix indexes among them. Runs after the
+    columns they cover have been added.
+    """
+    for indexed_model in INDEXED_TABLES:
+        for index in indexed_model.__table__.indexes:
+            # IF NOT EXISTS rather than checkfirst, SQLite's inspector doesn't report the lower() expression indexes
+            connection.execute(CreateIndex(index, if_not_exists=True))
@@ -1,40 +1,87 @@
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
 
-from app.database import get_db
+from app.database import get_async_db, SessionLocal
 from app.models import User
 from app.utils.security import get_current_user
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.utils.fields import parse_fields, sparse_list_response
+from app.utils.etag import conditional_get
+from app.utils.serialization import json_response
+from app.schemas.maintenance import MaintenanceResponse
+from app.schemas.vehicles import VehicleSummary
 from app.schemas.maintenance import MaintenanceCreate, MaintenanceCreateResponse, MaintenanceListResponse
 from app.schemas.maintenance import MaintenanceUpdate, MaintenanceUpdateResponse, MaintenanceDeleteResponse
+from app.schemas.maintenance import MaintenanceSearchResponse
 from app.crud.maintenance import crud_create_maintenance_record, crud_fetch_all_vehicle_maintenance_records
 from app.crud.maintenance import crud_fetch_all_vehicle_maintenance_records_filtered, crud_update_maintenance_record
-from app.crud.maintenance import crud_delete_maintenance_record
+from app.crud.maintenance import crud_delete_maintenance_record, crud_stream_vehicle_maintenance_records
+from app.crud.maintenance import crud_search_maintenance_records
 
 
 router = APIRouter()
 
 
 @router.post("/maintenance_records/", response_model=MaintenanceCreateResponse)
-def create_maintenance_record(
+async def create_maintenance_record(
         maintenance_create: MaintenanceCreate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
-    return crud_create_maintenance_record(db=db, current_user=current_user, maintenance_create=maintenance_create)
+    return await db.run_sync(
+        crud_create_maintenance_record,
+        current_user=current_user,
+        maintenance_create=maintenance_create
+    )
 
 
 @router.get("/maintenance_records/", response_model=MaintenanceListResponse)
-def fetch_all_vehicle_maintenance_records(
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+async def fetch_all_vehicle_maintenance_records(
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+        fields: Optional[str] = Query(None, description="Comma separated fields, e.g. id,cost,vehicle.nickname"),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user),
+        cache_headers: dict = Depends(conditional_get("maintenance_records"))
 ):
-    return crud_fetch_all_vehicle_maintenance_records(db=db, current_user=current_user)
+    selection = parse_fields(fields, MaintenanceResponse, "vehicle", VehicleSummary) if fields is not None else None
+
+    result = await db.run_sync(
+        crud_fetch_all_vehicle_maintenance_records,
+        current_user=current_user,
+        limit=limit,
+        cursor=cursor,
+        fields=selection
+    )
+
+    if selection is None:
+        return json_response(MaintenanceListResponse, result, headers=cache_headers)
+
+    return sparse_list_response(
+        result, "maintenance", MaintenanceResponse, selection, "vehicle", VehicleSummary, headers=cache_headers
+    )
+
+
+def stream_maintenance_records_ndjson(current_user: User):
+    # The request's session is closed before the response body is sent, so the stream owns its session
+    with SessionLocal() as db:
+        yield from crud_stream_vehicle_maintenance_records(db=db, current_user=current_user)
+
+
+@router.get("/maintenance_records/export/")
+async def export_vehicle_maintenance_records(current_user: User = Depends(get_current_user)):
+    # A plain generator, so Starlette pulls each batch on its threadpool instead of blocking the event loop
+    return StreamingResponse(
+        stream_maintenance_records_ndjson(current_user=current_user),
+        media_type="application/x-ndjson"
+    )
 
 
 @router.get("/maintenance_records/filtered/", response_model=MaintenanceListResponse)
-def fetch_all_vehicle_maintenance_records_filtered(
+async def fetch_all_vehicle_maintenance_records_filtered(
         vehicle_id: Optional[int] = Query(None),
         maintenance_provider: Optional[str] = Query(None),
         maintenance_type: Optional[str] = Query(None),
@@ -42,10 +89,19 @@ def fetch_all_vehicle_maintenance_records_filtered(
         mileage: Optional[int] = Query(None),
         cost: Optional[float] = Query(None),
         serviced_at: Optional[datetime] = Query(None),
-        db: Session = Depends(get_db),
+        mileage_min: Optional[int] = Query(None),
+        mileage_max: Optional[int] = Query(None),
+        cost_min: Optional[float] = Query(None),
+        cost_max: Optional[float] = Query(None),
+        serviced_at_after: Optional[datetime] = Query(None),
+        serviced_at_before: Optional[datetime] = Query(None),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
-    return crud_fetch_all_vehicle_maintenance_records_filtered(
+    result = await db.run_sync(
+        crud_fetch_all_vehicle_maintenance_records_filtered,
         vehicle_id=vehicle_id,
         maintenance_provider=maintenance_provider,
         maintenance_type=maintenance_type,
@@ -53,20 +109,51 @@ def fetch_all_vehicle_maintenance_records_filtered(
         mileage=mileage,
         cost=cost,
         serviced_at=serviced_at,
-        db=db,
+        mileage_min=mileage_min,
+        mileage_max=mileage_max,
+        cost_min=cost_min,
+        cost_max=cost_max,
+        serviced_at_after=serviced_at_after,
+        serviced_at_before=serviced_at_before,
+        limit=limit,
+        cursor=cursor,
         current_user=current_user
     )
 
+    return json_response(MaintenanceListResponse, result)
+
+
+@router.get("/maintenance_records/search/", response_model=MaintenanceSearchResponse)
+async def search_maintenance_records(
+        q: str = Query(..., min_length=1, description="Words to find in descriptions and providers"),
+        vehicle_id: Optional[int] = Query(None),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        offset: int = Query(0, ge=0),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user),
+        cache_headers: dict = Depends(conditional_get("maintenance_search"))
+):
+    result = await db.run_sync(
+        crud_search_maintenance_records,
+        current_user=current_user,
+        search=q,
+        vehicle_id=vehicle_id,
+        limit=limit,
+        offset=offset
+    )
+
+    return json_response(MaintenanceSearchResponse, result, headers=cache_headers)
+
 
 @router.put("/maintenance_records/", response_model=MaintenanceUpdateResponse)
-def update_maintenance_record(
+async def update_maintenance_record(
         maintenance_record_id: int,
         update_data: MaintenanceUpdate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
-    return crud_update_maintenance_record(
-        db=db,
+    return await db.run_sync(
+        crud_update_maintenance_record,
         current_user=current_user,
         maintenance_record_id=maintenance_record_id,
         update_data=update_data
@@ -74,9 +161,13 @@ def update_maintenance_record(
 
 
 @router.delete("/maintenance_records/", response_model=MaintenanceDeleteResponse)
-def delete_maintenance_record(
+async def delete_maintenance_record(
         maintenance_record_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
-    return crud_delete_maintenance_record(db=db, current_user=current_user, maintenance_record_id=maintenance_record_id)
+    return await db.run_sync(
+        crud_delete_maintenance_record,
+        current_user=current_user,
+        maintenance_record_id=maintenance_record_id
+    )
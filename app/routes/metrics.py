@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from app.utils.metrics import get_metrics_snapshot
+
+
+router = APIRouter()
+
+
+@router.get("/metrics/")
+def fetch_metrics():
+    return get_metrics_snapshot()
@@ -1,45 +1,73 @@
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 from datetime import datetime
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User
 from app.utils.security import get_current_user
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.utils.fields import parse_fields, sparse_list_response
+from app.utils.etag import conditional_get
+from app.utils.serialization import json_response
+from app.schemas.reminder import MaintenanceReminderResponse
+from app.schemas.vehicles import VehicleSummary
 
 from app.schemas.reminder import MaintenanceReminderCreateResponse, MaintenanceReminderCreate
 from app.schemas.reminder import MaintenanceReminderListResponse, MaintenanceReminderDeleteResponse
+from app.schemas.reminder import MaintenanceReminderDueListResponse
 from app.schemas.reminder import MaintenanceReminderUpdateResponse, MaintenanceReminderUpdate
 from app.crud.reminder import crud_create_maintenance_reminder, crud_fetch_all_maintenance_reminders
 from app.crud.reminder import crud_delete_maintenance_reminder, crud_fetch_all_maintenance_reminders_filtered
-from app.crud.reminder import crud_update_maintenance_reminder
+from app.crud.reminder import crud_update_maintenance_reminder, crud_fetch_due_maintenance_reminders
 
 router = APIRouter()
 
 
 @router.post("/reminders/", response_model=MaintenanceReminderCreateResponse)
-def create_maintenance_reminder(
+async def create_maintenance_reminder(
         maintenance_reminder: MaintenanceReminderCreate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
-    return crud_create_maintenance_reminder(
-        db=db,
+    return await db.run_sync(
+        crud_create_maintenance_reminder,
         current_user=current_user,
         maintenance_reminder=maintenance_reminder
     )
 
 
 @router.get("/reminders/", response_model=MaintenanceReminderListResponse)
-def fetch_all_maintenance_reminders(db: Session = Depends(get_db),current_user: User = Depends(get_current_user)):
-    return crud_fetch_all_maintenance_reminders(
-        db=db,
-        current_user=current_user
+async def fetch_all_maintenance_reminders(
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+        fields: Optional[str] = Query(None, description="Comma separated fields, e.g. id,details,vehicle.vin"),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user),
+        cache_headers: dict = Depends(conditional_get("reminders"))
+):
+    selection = None
+    if fields is not None:
+        selection = parse_fields(fields, MaintenanceReminderResponse, "vehicle", VehicleSummary)
+
+    result = await db.run_sync(
+        crud_fetch_all_maintenance_reminders,
+        current_user=current_user,
+        limit=limit,
+        cursor=cursor,
+        fields=selection
+    )
+
+    if selection is None:
+        return json_response(MaintenanceReminderListResponse, result, headers=cache_headers)
+
+    return sparse_list_response(
+        result, "reminders", MaintenanceReminderResponse, selection, "vehicle", VehicleSummary, headers=cache_headers
     )
 
 
 @router.get("/reminders/filtered/", response_model=MaintenanceReminderListResponse)
-def fetch_all_maintenance_reminders_filtered(
+async def fetch_all_maintenance_reminders_filtered(
         vehicle_id: Optional[int] = Query(None),
         maintenance_type: Optional[str] = Query(None),
         details: Optional[str] = Query(None),
@@ -56,10 +84,17 @@ def fetch_all_maintenance_reminders_filtered(
         vehicle_year: Optional[int] = Query(None),
         vehicle_vin: Optional[str] = Query(None),
         vehicle_nickname: Optional[str] = Query(None),
-        db: Session = Depends(get_db),
+        last_serviced_mileage_min: Optional[int] = Query(None),
+        last_serviced_mileage_max: Optional[int] = Query(None),
+        last_serviced_date_after: Optional[datetime] = Query(None),
+        last_serviced_date_before: Optional[datetime] = Query(None),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
-    return crud_fetch_all_maintenance_reminders_filtered(
+    result = await db.run_sync(
+        crud_fetch_all_maintenance_reminders_filtered,
         vehicle_id=vehicle_id,
         maintenance_type=maintenance_type,
         details=details,
@@ -76,34 +111,64 @@ def fetch_all_maintenance_reminders_filtered(
         vehicle_year=vehicle_year,
         vehicle_vin=vehicle_vin,
         vehicle_nickname=vehicle_nickname,
-        db=db,
+        last_serviced_mileage_min=last_serviced_mileage_min,
+        last_serviced_mileage_max=last_serviced_mileage_max,
+        last_serviced_date_after=last_serviced_date_after,
+        last_serviced_date_before=last_serviced_date_before,
+        limit=limit,
+        cursor=cursor,
         current_user=current_user
     )
 
+    return json_response(MaintenanceReminderListResponse, result)
+
+
+@router.get("/reminders/due/", response_model=MaintenanceReminderDueListResponse)
+async def fetch_due_maintenance_reminders(
+        due_status: Literal["overdue", "upcoming", "all"] = Query("all", alias="status"),
+        vehicle_id: Optional[int] = Query(None),
+        within_days: Optional[int] = Query(None, ge=0, description="Leave out upcoming reminders further away"),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    result = await db.run_sync(
+        crud_fetch_due_maintenance_reminders,
+        current_user=current_user,
+        due_status=due_status,
+        vehicle_id=vehicle_id,
+        within_days=within_days,
+        limit=limit,
+        cursor=cursor
+    )
+
+    return json_response(MaintenanceReminderDueListResponse, result)
+
 
 @router.put("/reminder/", response_model=MaintenanceReminderUpdateResponse)
-def update_maintenance_reminder(
+async def update_maintenance_reminder(
         maintenance_reminder_id: int,
         update_data: MaintenanceReminderUpdate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
-    return crud_update_maintenance_reminder(
+    return await db.run_sync(
+        crud_update_maintenance_reminder,
         maintenance_reminder_id=maintenance_reminder_id,
         update_data=update_data,
-        db=db,
         current_user=current_user
     )
 
 
 @router.delete("/reminder/", response_model=MaintenanceReminderDeleteResponse)
-def delete_maintenance_reminder(
+async def delete_maintenance_reminder(
         maintenance_reminder_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
-    return crud_delete_maintenance_reminder(
-        db=db,
+    return await db.run_sync(
+        crud_delete_maintenance_reminder,
         current_user=current_user,
         maintenance_reminder_id=maintenance_reminder_id
     )
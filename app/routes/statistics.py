@@ -1,18 +1,23 @@
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User
 from app.utils.security import get_current_user
 from app.schemas.statistics import UserMaintenanceStatsResponse
-from app.crud.statistics import crud_fetch_user_maintenance_statistics
+from app.utils.etag import conditional_get
+from app.crud.statistics import crud_fetch_user_maintenance_statistics, crud_fetch_user_statistics_version
 
 
 router = APIRouter()
 
 
 @router.get("/statistics/", response_model=UserMaintenanceStatsResponse)
-def get_user_maintenance_statistics(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return crud_fetch_user_maintenance_statistics(db=db, current_user=current_user)
+async def get_user_maintenance_statistics(
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user),
+        cache_headers: dict = Depends(conditional_get("statistics", crud_fetch_user_statistics_version))
+):
+    return await db.run_sync(crud_fetch_user_maintenance_statistics, current_user=current_user)
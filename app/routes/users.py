@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Optional
 
-from app.database import get_db
+from app.database import get_db, SessionLocal
+from app.models import User
 from app.schemas.users import UserCreate, UserResponse, UserLogin, UserLoginResponse,UserUpdate, UserUpdateResponse
-from app.schemas.users import UserDeleteResponse
+from app.schemas.users import UserDeleteResponse, UserListResponse
 from app.crud.users import crud_register_new_user, crud_login_user, crud_login_user_oauth, crud_fetch_user_by_username
 from app.crud.users import crud_fetch_user_by_id, crud_fetch_all_users, crud_update_user, crud_delete_user
+from app.crud.users import crud_stream_all_users
+from app.utils.security import get_current_user
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.utils.serialization import json_response
 
 router = APIRouter()
 
@@ -30,6 +36,18 @@ def login_user_oauth(
     return crud_login_user_oauth(db=db, form_data=form_data)
 
 
+def stream_users_ndjson():
+    # The request's get_db session is closed before the response body is sent, so the stream owns its session
+    with SessionLocal() as db:
+        yield from crud_stream_all_users(db=db)
+
+
+# Outside /users/ so it can't shadow, or be shadowed by, a username
+@router.get("/exports/users/")
+def export_all_users(current_user: User = Depends(get_current_user)):
+    return StreamingResponse(stream_users_ndjson(), media_type="application/x-ndjson")
+
+
 @router.get("/users/{username}/", response_model=UserResponse)
 def fetch_user_by_username(username: str, db: Session = Depends(get_db)):
     return crud_fetch_user_by_username(db=db, username=username)
@@ -40,9 +58,17 @@ def fetch_user_by_user_id(user_id: int, db: Session = Depends(get_db)):
     return crud_fetch_user_by_id(db=db, user_id=user_id)
 
 
-@router.get("/users/", response_model=List[UserResponse])
-def fetch_all_users(db: Session = Depends(get_db)):
-    return crud_fetch_all_users(db=db)
+@router.get("/users/", response_model=UserListResponse)
+def fetch_all_users(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after_id: Optional[int] = Query(None),
+    include_total: bool = Query(False),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    result = crud_fetch_all_users(db=db, limit=limit, after_id=after_id, include_total=include_total)
+
+    return json_response(UserListResponse, result)
 
 
 @router.put("/users/{user_id}/", response_model=UserUpdateResponse)
@@ -1,10 +1,15 @@
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User
 from app.utils.security import get_current_user
+from app.utils.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from app.utils.fields import parse_fields, sparse_list_response
+from app.utils.etag import conditional_get
+from app.utils.serialization import json_response
+from app.schemas.vehicles import VehicleResponse
 from app.schemas.vehicles import VehicleCreate, VehicleCreateResponse, VehicleListResponse, VehicleUpdate
 from app.schemas.vehicles import VehicleUpdateResponse, VehicleDeleteResponse
 from app.crud.vehicles import crud_register_new_vehicle, crud_fetch_user_vehicles, crud_filter_user_vehicles
@@ -14,22 +19,42 @@ router = APIRouter()
 
 
 @router.post("/vehicles/", response_model=VehicleCreateResponse)
-def register_new_vehicle(
+async def register_new_vehicle(
         vehicle_create: VehicleCreate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 
 ):
-    return crud_register_new_vehicle(db=db, vehicle_create=vehicle_create, current_user=current_user)
+    return await db.run_sync(crud_register_new_vehicle, vehicle_create=vehicle_create, current_user=current_user)
 
 
 @router.get("/vehicles/", response_model=VehicleListResponse)
-def fetch_user_vehicles(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return crud_fetch_user_vehicles(db=db, current_user=current_user)
+async def fetch_user_vehicles(
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+        fields: Optional[str] = Query(None, description="Comma separated fields, e.g. id,nickname,mileage"),
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user),
+        cache_headers: dict = Depends(conditional_get("vehicles"))
+):
+    selection = parse_fields(fields, VehicleResponse) if fields is not None else None
+
+    result = await db.run_sync(
+        crud_fetch_user_vehicles,
+        current_user=current_user,
+        limit=limit,
+        cursor=cursor,
+        fields=selection
+    )
+
+    if selection is None:
+        return json_response(VehicleListResponse, result, headers=cache_headers)
+
+    return sparse_list_response(result, "vehicles", VehicleResponse, selection, headers=cache_headers)
 
 
 @router.get("/vehicles/filtered/", response_model=VehicleListResponse)
-def fetch_user_vehicles_filtered(
+async def fetch_user_vehicles_filtered(
     vehicle_type: Optional[str] = Query(None),
     make: Optional[str] = Query(None),
     model: Optional[str] = Query(None),
@@ -43,11 +68,17 @@ def fetch_user_vehicles_filtered(
     transmission_type: Optional[str] = Query(None),
     is_active: Optional[bool] = Query(None),
     nickname: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    match: Literal["prefix", "substring"] = Query(
+        "prefix",
+        description="Text filters match the start of the value, or anywhere in it with substring (slower)"
+    ),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    return crud_filter_user_vehicles(
-        db=db,
+    result = await db.run_sync(
+        crud_filter_user_vehicles,
         current_user=current_user,
         vehicle_type=vehicle_type,
         make=make,
@@ -61,20 +92,34 @@ def fetch_user_vehicles_filtered(
         fuel_type=fuel_type,
         transmission_type=transmission_type,
         is_active=is_active,
-        nickname=nickname
+        nickname=nickname,
+        match=match,
+        limit=limit,
+        cursor=cursor
     )
 
+    return json_response(VehicleListResponse, result)
+
 
 @router.put("/vehicles/{vehicle_id}", response_model=VehicleUpdateResponse)
-def update_vehicle(
+async def update_vehicle(
         vehicle_id: int,
         update_data: VehicleUpdate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         current_user: User = Depends(get_current_user)
 ):
-    return crud_update_vehicle(db=db, current_user=current_user, vehicle_id=vehicle_id, update_data=update_data)
+    return await db.run_sync(
+        crud_update_vehicle,
+        current_user=current_user,
+        vehicle_id=vehicle_id,
+        update_data=update_data
+    )
 
 
 @router.delete("/vehicles/{vehicle_id}/", response_model=VehicleDeleteResponse)
-def delete_vehicle(vehicle_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    return crud_delete_vehicle(db=db, current_user=current_user, vehicle_id=vehicle_id)
+async def delete_vehicle(
+        vehicle_id: int,
+        db: AsyncSession = Depends(get_async_db),
+        current_user: User = Depends(get_current_user)
+):
+    return await db.run_sync(crud_delete_vehicle, current_user=current_user, vehicle_id=vehicle_id)
@@ -48,6 +48,12 @@ class MaintenanceResponse(MaintenanceBase):
 
 class MaintenanceListResponse(BaseModel):
     maintenance: List[MaintenanceResponse]
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page")
+
+
+class MaintenanceSearchResponse(BaseModel):
+    maintenance: List[MaintenanceResponse]
+    next_offset: Optional[int] = Field(None, description="Pass as offset to fetch the next page")
 
 
 class MaintenanceUpdate(MaintenanceBase):
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, model_validator, Field
-from typing import Optional, List, Type
+from typing import Optional, List, Literal, Type
 from typing_extensions import Self
 from datetime import datetime
 
@@ -71,6 +71,22 @@ class MaintenanceReminderResponse(MaintenanceReminderBase):
 
 class MaintenanceReminderListResponse(BaseModel):
     reminders: List[MaintenanceReminderResponse]
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page")
+
+
+class MaintenanceReminderDueResponse(MaintenanceReminderResponse):
+    status: Literal["overdue", "upcoming"]
+    notify_at: datetime = Field(description="When the reminder turns, or turned, overdue")
+    next_due_date: Optional[datetime] = None
+    next_due_mileage: Optional[int] = None
+    days_remaining: Optional[int] = Field(None, description="Whole days until next_due_date, negative once past")
+    estimated_mileage: Optional[int] = Field(None, description="Odometer, or the monthly estimate if further along")
+    miles_remaining: Optional[int] = Field(None, description="next_due_mileage minus estimated_mileage")
+
+
+class MaintenanceReminderDueListResponse(BaseModel):
+    reminders: List[MaintenanceReminderDueResponse]
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page")
 
 
 class MaintenanceReminderUpdate(BaseModel):
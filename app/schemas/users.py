@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, List
 
 
 class UserBase(BaseModel):
@@ -21,6 +21,12 @@ class UserResponse(UserBase):
         from_attributes = True
 
 
+class UserListResponse(BaseModel):
+    users: List[UserResponse]
+    next_after_id: Optional[int] = Field(None, description="Pass as after_id to fetch the next page")
+    total: Optional[int] = Field(None, description="Number of users, only with include_total, may lag by a minute")
+
+
 class UserLogin(BaseModel):
     username: str
     password: str
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, field_validator, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -70,6 +70,7 @@ class VehicleResponse(VehicleBase):
 
 class VehicleListResponse(BaseModel):
     vehicles: List[VehicleResponse]
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page")
 
 
 class VehicleUpdate(VehicleBase):
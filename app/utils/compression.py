@@ -0,0 +1,34 @@
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import Iterable
+import os
+
+
+# Bodies smaller than this go out as they are, gzip framing and the CPU spent outweigh the bytes saved
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", 1000))
+# 1 (fastest) to 9 (smallest), see `python -m benchmarks.compression` for the trade-off on our payloads
+GZIP_COMPRESSION_LEVEL = int(os.getenv("GZIP_COMPRESSION_LEVEL", 6))
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that leaves the paths in excluded_paths alone, e.g. NDJSON exports whose clients read lines
+    as they arrive and shouldn't wait on the compressor's buffer.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            minimum_size: int = GZIP_MINIMUM_SIZE,
+            compresslevel: int = GZIP_COMPRESSION_LEVEL,
+            excluded_paths: Iterable[str] = ()
+    ) -> None:
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.excluded_paths = frozenset(excluded_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        await super().__call__(scope, receive, send)
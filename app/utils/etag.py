@@ -0,0 +1,63 @@
+from fastapi import Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Callable, Optional
+import hashlib
+
+from app.database import get_async_db
+from app.models import User
+from app.crud.versions import crud_fetch_user_data_version
+from app.utils.metrics import increment_counter
+from app.utils.security import get_current_user
+
+
+# Responses depend on the bearer token, so shared caches must not store them and clients must revalidate
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(scope: str, user_id: int, version, query: str = "") -> str:
+    digest = hashlib.blake2b(f"{scope}:{user_id}:{version}:{query}".encode(), digest_size=12).hexdigest()
+    # Weak, the same data may go out in a different encoding, e.g. compressed
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    # If-None-Match uses the weak comparison, W/ prefixes are ignored on both sides
+    opaque_tag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(","))
+
+
+def conditional_get(scope: str, fetch_version: Optional[Callable] = None):
+    """
+    Dependency for GET endpoints whose response only changes when the user's data version does. Answers
+    304 Not Modified before the endpoint runs when If-None-Match still matches, otherwise sets the ETag on the
+    response and returns the headers, for endpoints that build their own Response.
+    """
+
+    async def check_not_modified(
+            request: Request,
+            response: Response,
+            db: AsyncSession = Depends(get_async_db),
+            current_user: User = Depends(get_current_user)
+    ) -> dict:
+        if fetch_version is None:
+            version = await db.run_sync(crud_fetch_user_data_version, user_id=current_user.id)
+        else:
+            version = await db.run_sync(fetch_version, current_user=current_user)
+
+        etag = make_etag(scope=scope, user_id=current_user.id, version=version, query=request.url.query)
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            increment_counter(f"{scope}_not_modified")
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        response.headers.update(headers)
+        return headers
+
+    return check_not_modified
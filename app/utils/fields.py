@@ -0,0 +1,118 @@
+from fastapi import HTTPException, status
+from fastapi.responses import Response
+from pydantic import BaseModel, ConfigDict, create_model
+from sqlalchemy.orm import Query, joinedload, load_only
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple, Type, List
+
+from app.utils.serialization import render_json
+
+
+# Always selected so keyset cursors can be built, only returned when asked for
+CURSOR_COLUMNS = ("id", "created_at")
+
+
+class FieldSelection(NamedTuple):
+    fields: Tuple[str, ...]
+    nested_fields: Optional[Tuple[str, ...]] = None
+
+
+def parse_fields(
+        fields: str,
+        model: Type[BaseModel],
+        nested_key: Optional[str] = None,
+        nested_model: Optional[Type[BaseModel]] = None
+) -> FieldSelection:
+    """
+    Parses ?fields=id,cost,vehicle.nickname against a response schema. A bare nested key such as `vehicle`
+    selects every field of the nested schema.
+    """
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    top_level = set()
+    nested = set()
+    unknown = []
+
+    for field in requested:
+        parent, _, child = field.partition(".")
+
+        if nested_key and parent == nested_key and not child:
+            nested.update(nested_model.model_fields)
+        elif nested_key and parent == nested_key and child in nested_model.model_fields:
+            nested.add(child)
+        elif not child and field in model.model_fields and field != nested_key:
+            top_level.add(field)
+        else:
+            unknown.append(field)
+
+    if unknown or not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}." if unknown else "No fields requested."
+        )
+
+    # Declaration order, so equal selections share one cached schema and render the same way
+    return FieldSelection(
+        fields=tuple(field for field in model.model_fields if field in top_level),
+        nested_fields=tuple(field for field in nested_model.model_fields if field in nested) if nested else None
+    )
+
+
+def apply_field_selection(query: Query, model, selection: FieldSelection, relationship=None) -> Query:
+    columns = dict.fromkeys(CURSOR_COLUMNS + selection.fields)
+    query = query.options(load_only(*(getattr(model, column) for column in columns)))
+
+    if relationship is not None and selection.nested_fields:
+        related_model = relationship.property.mapper.class_
+        query = query.options(
+            joinedload(relationship).load_only(*(getattr(related_model, column) for column in selection.nested_fields))
+        )
+
+    return query
+
+
+@lru_cache(maxsize=256)
+def sparse_model(
+        model: Type[BaseModel],
+        fields: Tuple[str, ...],
+        nested_key: Optional[str] = None,
+        nested_model: Optional[Type[BaseModel]] = None,
+        nested_fields: Optional[Tuple[str, ...]] = None
+) -> Type[BaseModel]:
+    definitions = {field: (model.model_fields[field].annotation, None) for field in fields}
+
+    if nested_fields:
+        definitions[nested_key] = (sparse_model(nested_model, nested_fields), None)
+
+    return create_model(
+        f"{model.__name__}Sparse",
+        __config__=ConfigDict(from_attributes=True),
+        **definitions
+    )
+
+
+@lru_cache(maxsize=256)
+def sparse_list_model(item_model: Type[BaseModel], list_key: str) -> Type[BaseModel]:
+    return create_model(
+        f"{item_model.__name__}List",
+        __config__=ConfigDict(from_attributes=True),
+        **{list_key: (List[item_model], ...), "next_cursor": (Optional[str], None)}
+    )
+
+
+def sparse_list_response(
+        result: dict,
+        list_key: str,
+        model: Type[BaseModel],
+        selection: FieldSelection,
+        nested_key: Optional[str] = None,
+        nested_model: Optional[Type[BaseModel]] = None,
+        headers: Optional[dict] = None
+) -> Response:
+    item_model = sparse_model(model, selection.fields, nested_key, nested_model, selection.nested_fields)
+    list_model = sparse_list_model(item_model=item_model, list_key=list_key)
+
+    return Response(
+        content=render_json(model=list_model, content=result),
+        media_type="application/json",
+        headers=headers
+    )
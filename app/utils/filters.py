@@ -0,0 +1,120 @@
+from fastapi import HTTPException, status
+from sqlalchemy import and_, bindparam, func
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import os
+
+from app.utils.metrics import increment_counter
+from app.utils.pagination import keyset_page_statement, keyset_page_params, trim_keyset_page
+
+
+# One compiled statement per endpoint and set of filters in use, 2^n shapes at most but few are ever requested
+FILTER_STATEMENT_CACHE_SIZE = int(os.getenv("FILTER_STATEMENT_CACHE_SIZE", 512))
+
+# "prefix" matches the start of the value case-insensitively and can seek the lower(column) indexes on vehicles,
+# "substring" matches anywhere in the value and has to read every one of the user's vehicles
+TEXT_MATCH_MODES = ("prefix", "substring")
+
+
+class FilterField(NamedTuple):
+    column: Any
+    # equal, contains (substring, any case), text (prefix or substring, see TEXT_MATCH_MODES), min, max
+    operator: str
+
+
+class FilterSpec:
+    """
+    Filters one /filtered/ endpoint accepts. statement selects the current user's rows, with the user's id left
+    as the :user_id bind parameter, fields maps each query parameter to the column and operator it filters with.
+    """
+
+    def __init__(self, name: str, model, statement: Select, fields: Dict[str, FilterField]):
+        self.name = name
+        self.model = model
+        self.statement = statement
+        self.fields = fields
+
+    def __repr__(self) -> str:
+        return f"FilterSpec({self.name!r})"
+
+
+def _filter_clause(name: str, field: FilterField, match: str):
+    column, operator = field
+
+    if operator == "equal":
+        return column == bindparam(f"filter_{name}")
+    if operator == "min":
+        return column >= bindparam(f"filter_{name}")
+    if operator == "max":
+        return column <= bindparam(f"filter_{name}")
+    if operator == "contains" or match == "substring":
+        return column.ilike(bindparam(f"filter_{name}"))
+
+    # LIKE can't seek an expression index, the range around the prefix can, the LIKE then rechecks each row
+    expression = func.lower(column)
+    return and_(
+        expression >= bindparam(f"filter_{name}_lower"),
+        expression < bindparam(f"filter_{name}_upper"),
+        expression.like(bindparam(f"filter_{name}"), escape="\\")
+    )
+
+
+def _filter_params(name: str, field: FilterField, value: Any, match: str) -> dict:
+    if field.operator == "contains" or (field.operator == "text" and match == "substring"):
+        return {f"filter_{name}": f"%{value}%"}
+
+    if field.operator != "text":
+        return {f"filter_{name}": value}
+
+    prefix = value.lower()
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    # An empty prefix matches every value, nothing sorts above the last code point
+    upper_bound = prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else chr(0x10FFFF)
+
+    return {
+        f"filter_{name}_lower": prefix,
+        f"filter_{name}_upper": upper_bound,
+        f"filter_{name}": f"{escaped}%"
+    }
+
+
+@lru_cache(maxsize=FILTER_STATEMENT_CACHE_SIZE)
+def compile_filter_statement(spec: FilterSpec, active: Tuple[str, ...], match: str, with_cursor: bool) -> Select:
+    """
+    The page statement for one filter shape, every value left as a bind parameter. SQLAlchemy memoizes the
+    cache key of a statement object, so reusing it also skips the key walk and goes straight to the compiled SQL.
+    """
+    increment_counter(f"{spec.name}_filter_statement_compiles")
+
+    statement = spec.statement.where(*(_filter_clause(name, spec.fields[name], match) for name in active))
+    return keyset_page_statement(statement=statement, model=spec.model, with_cursor=with_cursor)
+
+
+def fetch_filtered_page(
+        db: Session,
+        spec: FilterSpec,
+        user_id: int,
+        filters: dict,
+        limit: int,
+        cursor: Optional[str],
+        match: str = "prefix"
+) -> Tuple[List, Optional[str]]:
+    # Shapes are keyed in spec order so the same filters passed in any order share a statement
+    active = tuple(name for name in spec.fields if filters.get(name) is not None)
+
+    if not active:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one filter parameter must be provided."
+        )
+
+    statement = compile_filter_statement(spec, active, match, cursor is not None)
+
+    params = {"user_id": user_id, **keyset_page_params(limit=limit, cursor=cursor)}
+    for name in active:
+        params.update(_filter_params(name, spec.fields[name], filters[name], match))
+
+    rows = db.execute(statement, params).scalars().unique().all()
+    return trim_keyset_page(rows=rows, limit=limit)
@@ -0,0 +1,53 @@
+from collections import defaultdict
+import threading
+
+
+# In-process counters and timings exposed through GET /metrics/.
+# Each worker process keeps its own values; scrape every worker when running more than one.
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = {}
+_gauges = {}
+
+
+def increment_counter(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def observe_timing(name: str, seconds: float) -> None:
+    with _lock:
+        timing = _timings.setdefault(name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        timing["count"] += 1
+        timing["total_seconds"] += seconds
+        timing["max_seconds"] = max(timing["max_seconds"], seconds)
+
+
+def set_gauge(name: str, value: float) -> None:
+    # Last value wins, for levels such as a queue's backlog rather than running totals
+    with _lock:
+        _gauges[name] = value
+
+
+def get_counter(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def get_metrics_snapshot() -> dict:
+    with _lock:
+        timings = {
+            name: {
+                **timing,
+                "avg_seconds": timing["total_seconds"] / timing["count"] if timing["count"] else 0.0
+            }
+            for name, timing in _timings.items()
+        }
+        return {"counters": dict(_counters), "timings": timings, "gauges": dict(_gauges)}
+
+
+def reset_metrics() -> None:
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+        _gauges.clear()
@@ -0,0 +1,287 @@
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Callable, Dict, List, Optional, Sequence
+from urllib.request import Request, urlopen
+import json
+import logging
+import mailbox
+import os
+import random
+import threading
+import time
+import uuid
+
+from app.crud.outbox import (
+    crud_enqueue_reminder_notifications, crud_claim_outbox_batch, crud_mark_outbox_delivered, crud_mark_outbox_failed,
+    crud_fetch_outbox_backlog
+)
+from app.models import NotificationOutbox
+from app.utils.metrics import increment_counter, observe_timing, set_gauge, get_counter
+from app.utils.scheduler import DueReminder
+
+
+# Sinks notifications are delivered to, each left out while its setting is empty
+NOTIFICATION_MAILBOX_PATH = os.getenv("NOTIFICATION_MAILBOX_PATH", "")
+NOTIFICATION_MAIL_FROM = os.getenv("NOTIFICATION_MAIL_FROM", "reminders@localhost")
+NOTIFICATION_WEBHOOK_URL = os.getenv("NOTIFICATION_WEBHOOK_URL", "")
+NOTIFICATION_WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("NOTIFICATION_WEBHOOK_TIMEOUT_SECONDS", 10))
+
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", 4))
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", 100))
+# A notification still failing after this many attempts is marked failed and left for inspection
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", 8))
+NOTIFICATION_RETRY_BASE_SECONDS = float(os.getenv("NOTIFICATION_RETRY_BASE_SECONDS", 10))
+NOTIFICATION_RETRY_MAX_SECONDS = float(os.getenv("NOTIFICATION_RETRY_MAX_SECONDS", 3600))
+# How long a claimed batch stays with its worker, one that dies mid batch gives it up after this
+NOTIFICATION_LEASE_SECONDS = float(os.getenv("NOTIFICATION_LEASE_SECONDS", 60))
+# Idle workers look for notifications queued by other processes this often, ones queued here wake them at once
+NOTIFICATION_POLL_SECONDS = float(os.getenv("NOTIFICATION_POLL_SECONDS", 5))
+
+logger = logging.getLogger(__name__)
+
+
+class MailboxSink:
+    """
+    Stands in for SMTP, every notification becomes an email appended to an mbox file that mail clients can open.
+    The Message-ID is the idempotency key, so a redelivered notification is recognisable as the same email.
+    """
+    name = "mailbox"
+
+    def __init__(self, path: str, sender: str = NOTIFICATION_MAIL_FROM):
+        self.path = path
+        self.sender = sender
+        self._lock = threading.Lock()
+
+    def deliver(self, messages: List[dict]) -> None:
+        with self._lock:
+            box = mailbox.mbox(self.path)
+            box.lock()
+            try:
+                for message in messages:
+                    box.add(self.make_email(message))
+                box.flush()
+            finally:
+                box.unlock()
+                box.close()
+
+    def make_email(self, message: dict) -> EmailMessage:
+        vehicle = message["vehicle"]
+        vehicle_name = vehicle["nickname"] or f"{vehicle['year']} {vehicle['make']} {vehicle['model']}"
+
+        email = EmailMessage()
+        email["From"] = self.sender
+        email["To"] = message["email"]
+        email["Subject"] = f"{message['maintenance_type']} due for {vehicle_name}"
+        email["Message-ID"] = f"<{message['idempotency_key']}@vehicle-maintenance-tracker>"
+
+        lines = [f"Hi {message['username']},", "", f"{message['maintenance_type']} is coming due for {vehicle_name}."]
+        if message["next_due_date"]:
+            lines.append(f"Due date: {message['next_due_date'][:10]}")
+        if message["next_due_mileage"] is not None:
+            lines.append(f"Due mileage: {message['next_due_mileage']}")
+        if message["details"]:
+            lines.append(f"Details: {message['details']}")
+        email.set_content("\n".join(lines) + "\n")
+
+        return email
+
+
+class WebhookSink:
+    """
+    POSTs each batch as {"notifications": [...]} to url. Any status outside 2xx or a timeout fails the batch and it
+    is sent again later, receivers drop the notifications whose idempotency_key they have seen.
+    """
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float = NOTIFICATION_WEBHOOK_TIMEOUT_SECONDS):
+        self.url = url
+        self.timeout = timeout
+
+    def deliver(self, messages: List[dict]) -> None:
+        request = Request(
+            self.url,
+            data=json.dumps({"notifications": messages}).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        with urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def configured_sinks() -> list:
+    sinks = []
+    if NOTIFICATION_MAILBOX_PATH:
+        sinks.append(MailboxSink(path=NOTIFICATION_MAILBOX_PATH))
+    if NOTIFICATION_WEBHOOK_URL:
+        sinks.append(WebhookSink(url=NOTIFICATION_WEBHOOK_URL))
+    return sinks
+
+
+def retry_delay(attempts: int, base_seconds: float, max_seconds: float) -> float:
+    # Doubles with every failed attempt up to max_seconds, the random half spreads out batches that failed together
+    delay = min(base_seconds * 2 ** (attempts - 1), max_seconds)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class OutboxDispatcher:
+    """
+    Delivers the notification outbox. enqueue() is the reminder scheduler's sink, it queues due reminders in the
+    same commit that marks them notified. A pool of workers claims pending rows batch_size at a time, hands each
+    sink its share of the batch and marks the rows delivered, or schedules a retry with backoff. Delivery is at
+    least once, a payload's idempotency_key tells repeats apart.
+    """
+
+    def __init__(
+            self,
+            session_factory: Callable[[], Session],
+            sinks: Sequence,
+            workers: int = NOTIFICATION_WORKERS,
+            batch_size: int = NOTIFICATION_BATCH_SIZE,
+            max_attempts: int = NOTIFICATION_MAX_ATTEMPTS,
+            retry_base_seconds: float = NOTIFICATION_RETRY_BASE_SECONDS,
+            retry_max_seconds: float = NOTIFICATION_RETRY_MAX_SECONDS,
+            lease_seconds: float = NOTIFICATION_LEASE_SECONDS,
+            poll_seconds: float = NOTIFICATION_POLL_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.sinks = {sink.name: sink for sink in sinks}
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_seconds = poll_seconds
+
+        self._wake = threading.Condition()
+        self._pending_wakeups = 0
+        self._stopping = False
+        self._threads: List[threading.Thread] = []
+        self._backlog_lock = threading.Lock()
+        self._backlog_checked = 0.0
+        self._delivered_at_check = 0
+
+    def start(self) -> None:
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"outbox-dispatcher-{number}", daemon=True)
+            for number in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._wake:
+            self._stopping = True
+            self._wake.notify_all()
+
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def enqueue(self, due: List[DueReminder]) -> None:
+        with self.session_factory() as db:
+            added = crud_enqueue_reminder_notifications(db=db, due=due, sinks=list(self.sinks))
+
+        increment_counter("outbox_enqueued", added)
+        if added:
+            with self._wake:
+                self._pending_wakeups += 1
+                self._wake.notify_all()
+
+    def dispatch_once(self, now: Optional[datetime] = None) -> int:
+        """Claims and delivers one batch. Returns how many notifications it held, 0 once none are due."""
+        claim_token = uuid.uuid4().hex
+
+        with self.session_factory() as db:
+            rows = crud_claim_outbox_batch(
+                db=db, claim_token=claim_token, batch_size=self.batch_size, lease=self.lease, now=now
+            )
+            by_sink: Dict[str, List[NotificationOutbox]] = {}
+            for row in rows:
+                by_sink.setdefault(row.sink, []).append(row)
+
+            for sink_name, sink_rows in by_sink.items():
+                self._deliver(db=db, claim_token=claim_token, sink_name=sink_name, rows=sink_rows)
+
+        return len(rows)
+
+    def drain(self, now: Optional[datetime] = None) -> int:
+        """Dispatches batches until none are due. Returns how many notifications were handled."""
+        handled = 0
+        while True:
+            count = self.dispatch_once(now=now)
+            if not count:
+                return handled
+            handled += count
+
+    def _deliver(self, db: Session, claim_token: str, sink_name: str, rows: List[NotificationOutbox]) -> None:
+        sink = self.sinks.get(sink_name)
+        ids = [row.id for row in rows]
+        attempts = {row.id: row.attempts + 1 for row in rows}
+        started = time.perf_counter()
+
+        try:
+            if sink is None:
+                raise LookupError(f"Sink {sink_name} is not configured")
+            sink.deliver([row.payload for row in rows])
+        except Exception as error:
+            now = datetime.utcnow()
+            retry_at = {
+                outbox_id: None if attempt >= self.max_attempts else now + timedelta(
+                    seconds=retry_delay(attempt, self.retry_base_seconds, self.retry_max_seconds)
+                )
+                for outbox_id, attempt in attempts.items()
+            }
+            crud_mark_outbox_failed(db=db, claim_token=claim_token, retry_at=retry_at, error=repr(error))
+
+            given_up = sum(1 for next_attempt_at in retry_at.values() if next_attempt_at is None)
+            increment_counter("outbox_retried", len(ids) - given_up)
+            increment_counter("outbox_failed", given_up)
+            logger.warning("Delivering %s notifications to %s failed: %r", len(ids), sink_name, error)
+        else:
+            crud_mark_outbox_delivered(db=db, claim_token=claim_token, ids=ids)
+            increment_counter("outbox_delivered", len(ids))
+        finally:
+            observe_timing(f"outbox_{sink_name}_delivery", time.perf_counter() - started)
+
+    def refresh_backlog_metrics(self) -> None:
+        """Backlog gauges, and throughput since the last refresh, for GET /metrics/."""
+        with self.session_factory() as db:
+            backlog = crud_fetch_outbox_backlog(db=db)
+
+        with self._backlog_lock:
+            checked = time.monotonic()
+            delivered = get_counter("outbox_delivered")
+            if self._backlog_checked:
+                elapsed = checked - self._backlog_checked
+                set_gauge("outbox_delivered_per_second", (delivered - self._delivered_at_check) / elapsed)
+            self._backlog_checked = checked
+            self._delivered_at_check = delivered
+
+        set_gauge("outbox_pending", backlog["pending"])
+        set_gauge("outbox_failed", backlog["failed"])
+        set_gauge("outbox_oldest_pending_seconds", backlog["oldest_pending_seconds"])
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if time.monotonic() - self._backlog_checked >= self.poll_seconds:
+                    self.refresh_backlog_metrics()
+                handled = self.dispatch_once()
+            except Exception:
+                handled = 0
+                increment_counter("outbox_dispatcher_errors")
+                logger.exception("Outbox dispatch failed")
+
+            with self._wake:
+                if self._stopping:
+                    return
+                # A full batch means more are probably due, otherwise sleep until something is queued
+                if handled < self.batch_size:
+                    if not self._pending_wakeups:
+                        self._wake.wait(self.poll_seconds)
+                    self._pending_wakeups = 0
+                if self._stopping:
+                    return
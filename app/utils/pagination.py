@@ -0,0 +1,90 @@
+from fastapi import HTTPException, status
+from sqlalchemy import Integer, bindparam, tuple_
+from sqlalchemy.orm import Query
+from sqlalchemy.sql import Select
+from datetime import datetime
+from typing import Optional, Tuple, List
+import base64
+import json
+import os
+
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 500))
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor."
+        )
+
+
+def page_size(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def trim_keyset_page(rows: List, limit: int) -> Tuple[List, Optional[str]]:
+    """rows fetched with one extra past the page, trimmed to the page and the cursor for the next one."""
+    limit = page_size(limit)
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(created_at=rows[-1].created_at, row_id=rows[-1].id)
+
+
+def paginate_query(query: Query, model, limit: int, cursor: Optional[str]) -> Tuple[List, Optional[str]]:
+    """
+    Keyset pagination on (created_at, id). Any ordering already on the query is replaced, so pages stay
+    stable while rows are added and the cost of a page doesn't grow with how deep it is.
+    """
+    if cursor is not None:
+        created_at, row_id = decode_cursor(cursor)
+        # A row value comparison lets SQLite and PostgreSQL seek the (..., created_at, id) index to the cursor
+        cursor_values = tuple_(created_at, row_id, types=[model.created_at.type, model.id.type])
+        query = query.filter(tuple_(model.created_at, model.id) > cursor_values)
+
+    rows = query.order_by(None).order_by(model.created_at.asc(), model.id.asc()).limit(page_size(limit) + 1).all()
+
+    return trim_keyset_page(rows=rows, limit=limit)
+
+
+def keyset_page_statement(statement: Select, model, with_cursor: bool) -> Select:
+    """
+    paginate_query for statements built once and reused, the cursor and page size are left as the
+    :cursor_created_at, :cursor_id and :page_limit bind parameters, see keyset_page_params.
+    """
+    if with_cursor:
+        cursor_values = tuple_(
+            bindparam("cursor_created_at", type_=model.created_at.type),
+            bindparam("cursor_id", type_=model.id.type)
+        )
+        statement = statement.where(tuple_(model.created_at, model.id) > cursor_values)
+
+    return (
+        statement
+        .order_by(None)
+        .order_by(model.created_at.asc(), model.id.asc())
+        .limit(bindparam("page_limit", type_=Integer))
+    )
+
+
+def keyset_page_params(limit: int, cursor: Optional[str]) -> dict:
+    params = {"page_limit": page_size(limit) + 1}
+
+    if cursor is not None:
+        params["cursor_created_at"], params["cursor_id"] = decode_cursor(cursor)
+
+    return params
@@ -1,4 +1,5 @@
-from typing import Type
+from typing import Type, Optional
+from datetime import datetime, timedelta
 
 from app.models import MaintenanceReminder
 from app.schemas.reminder import MaintenanceReminderResponse
@@ -21,3 +22,123 @@ def make_maintenance_reminder_response(maintenance_reminder: Type[MaintenanceRem
         updated_at=maintenance_reminder.updated_at,
         vehicle=maintenance_reminder.vehicle
     )
+
+
+def get_reminder_start_date(maintenance_reminder: Type[MaintenanceReminder]) -> Optional[datetime]:
+    if maintenance_reminder.last_serviced_date:
+        return maintenance_reminder.last_serviced_date
+    elif maintenance_reminder.updated_at:
+        return maintenance_reminder.updated_at
+    return maintenance_reminder.created_at
+
+
+def estimate_days_until_mileage(miles_needed: int, estimated_miles_driven_per_month: int) -> int:
+    """
+    Smallest whole number of elapsed days at which the estimated miles driven reach miles_needed.
+
+    Statistics estimate mileage as `estimated_miles_driven_per_month * (elapsed_days / 30)`, so the
+    integer guess is nudged until it agrees with that float expression at the boundary.
+    """
+    days = -((-miles_needed * 30) // estimated_miles_driven_per_month)
+
+    while estimated_miles_driven_per_month * (days / 30) < miles_needed:
+        days += 1
+
+    while estimated_miles_driven_per_month * ((days - 1) / 30) >= miles_needed:
+        days -= 1
+
+    return days
+
+
+def apply_reminder_schedule(
+        maintenance_reminder: Type[MaintenanceReminder],
+        vehicle_mileage: Optional[int] = None,
+        now: Optional[datetime] = None
+) -> None:
+    """
+    Persist the derived due/notify columns so due lookups can be answered with an index range scan.
+
+    notify_at is the earliest moment the reminder counts as overdue, combining the time-based
+    threshold with the date the estimated mileage crosses notify_mileage. It stays None when the
+    reminder has no usable schedule. Once vehicle_mileage, the odometer, has reached notify_mileage
+    the reminder is due from now, whatever the estimate says.
+    """
+    start_date = get_reminder_start_date(maintenance_reminder)
+
+    next_due_date = None
+    notify_date = None
+    next_due_mileage = None
+    notify_mileage = None
+    candidates = []
+
+    if maintenance_reminder.interval_months and start_date is not None:
+        next_due_date = start_date + timedelta(days=(maintenance_reminder.interval_months * 30))
+        notify_date = next_due_date - timedelta(days=(maintenance_reminder.notify_before_days or 0))
+        candidates.append(notify_date)
+
+    if maintenance_reminder.last_serviced_mileage is not None and maintenance_reminder.interval_miles:
+        next_due_mileage = maintenance_reminder.last_serviced_mileage + maintenance_reminder.interval_miles
+        notify_mileage = next_due_mileage - (maintenance_reminder.notify_before_miles or 0)
+
+        if (maintenance_reminder.estimated_miles_driven_per_month or 0) > 0 and start_date is not None:
+            days = estimate_days_until_mileage(
+                miles_needed=notify_mileage - maintenance_reminder.last_serviced_mileage,
+                estimated_miles_driven_per_month=maintenance_reminder.estimated_miles_driven_per_month
+            )
+            candidates.append(start_date + timedelta(days=days))
+
+        if vehicle_mileage is not None and vehicle_mileage >= notify_mileage:
+            # A notify_at already passed stays, so refreshing the schedule doesn't make the reminder due again
+            now = now or datetime.utcnow()
+            reached = maintenance_reminder.notify_at
+            candidates.append(reached if reached is not None and reached <= now else now)
+
+    maintenance_reminder.next_due_date = next_due_date
+    maintenance_reminder.next_due_mileage = next_due_mileage
+    maintenance_reminder.notify_date = notify_date
+    maintenance_reminder.notify_mileage = notify_mileage
+    maintenance_reminder.notify_at = min(candidates) if candidates else None
+
+
+def estimate_current_mileage(maintenance_reminder: Type[MaintenanceReminder], now: datetime) -> Optional[int]:
+    """
+    The vehicle's odometer, or further along when the monthly estimate since the start date says it should be,
+    the same projection the mileage threshold is built on.
+    """
+    vehicle = maintenance_reminder.vehicle
+    mileage = vehicle.mileage if vehicle is not None else None
+    start_date = get_reminder_start_date(maintenance_reminder)
+
+    if (
+            maintenance_reminder.last_serviced_mileage is not None and
+            (maintenance_reminder.estimated_miles_driven_per_month or 0) > 0 and
+            start_date is not None
+    ):
+        elapsed_days = max((now - start_date).days, 0)
+        projected = maintenance_reminder.last_serviced_mileage + int(
+            maintenance_reminder.estimated_miles_driven_per_month * (elapsed_days / 30)
+        )
+        mileage = projected if mileage is None else max(mileage, projected)
+
+    return mileage
+
+
+def make_due_reminder_row(maintenance_reminder: Type[MaintenanceReminder], now: datetime) -> dict:
+    """The reminder's columns with what GET /reminders/due/ computes for it, ready for json_response."""
+    row = dict(maintenance_reminder.__dict__)
+    row["vehicle"] = maintenance_reminder.vehicle
+
+    row["status"] = "overdue" if maintenance_reminder.notify_at <= now else "upcoming"
+
+    next_due_date = maintenance_reminder.next_due_date
+    row["days_remaining"] = (next_due_date - now).days if next_due_date is not None else None
+
+    next_due_mileage = maintenance_reminder.next_due_mileage
+    estimated_mileage = estimate_current_mileage(maintenance_reminder=maintenance_reminder, now=now)
+    row["estimated_mileage"] = estimated_mileage
+    row["miles_remaining"] = (
+        next_due_mileage - estimated_mileage if next_due_mileage is not None and estimated_mileage is not None
+        else None
+    )
+
+    return row
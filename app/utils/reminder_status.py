@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+
+# Columns reminder_schedule reads, in the order reminder_columns expects each row. start_date is
+# get_reminder_start_date's fallback chain, last_serviced_date, then updated_at, then created_at.
+REMINDER_SCHEDULE_INPUTS = (
+    "start_date",
+    "interval_months",
+    "notify_before_days",
+    "last_serviced_mileage",
+    "interval_miles",
+    "notify_before_miles",
+    "estimated_miles_driven_per_month",
+)
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_MICROSECONDS_PER_DAY = 86_400_000_000
+# Stands in for a missing date, and sorts after every real one when picking the earlier threshold
+_NO_TIME = np.iinfo(np.int64).max
+
+
+def _microseconds(value: Optional[datetime]) -> int:
+    if value is None:
+        return _NO_TIME
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def reminder_columns(rows: Iterable[tuple]) -> Dict[str, np.ndarray]:
+    """
+    Turns (start_date, interval_months, ...) rows, ordered as REMINDER_SCHEDULE_INPUTS, into one int64 array per
+    column next to a `<column>_set` mask for the None values. Dates are microseconds since the epoch, UTC.
+    """
+    rows = rows if isinstance(rows, list) else list(rows)
+    count = len(rows)
+
+    start_date = np.fromiter((_microseconds(row[0]) for row in rows), dtype=np.int64, count=count)
+    columns = {"start_date": start_date, "start_date_set": start_date != _NO_TIME}
+
+    for index, name in enumerate(REMINDER_SCHEDULE_INPUTS[1:], start=1):
+        values = np.array([row[index] for row in rows], dtype=np.float64)
+        is_set = ~np.isnan(values)
+        columns[name] = np.where(is_set, values, 0).astype(np.int64)
+        columns[f"{name}_set"] = is_set
+
+    return columns
+
+
+def estimate_days_until_mileage_array(miles_needed: np.ndarray, miles_per_month: np.ndarray) -> np.ndarray:
+    """
+    app.utils.reminder.estimate_days_until_mileage over arrays, miles_per_month must be positive. The nudges run
+    until no element moves, a couple of passes at most.
+    """
+    days = -((-miles_needed * 30) // miles_per_month)
+    rate = miles_per_month.astype(np.float64)
+
+    while True:
+        short = rate * (days / 30) < miles_needed
+        if not short.any():
+            break
+        days = days + short
+
+    while True:
+        early = rate * ((days - 1) / 30) >= miles_needed
+        if not early.any():
+            break
+        days = days - early
+
+    return days
+
+
+def _datetimes(values: np.ndarray) -> list:
+    # datetime64 builds the datetime objects in C, an order of magnitude quicker than adding timedeltas one by one
+    is_set = values != _NO_TIME
+    result = np.where(is_set, values, 0).astype("datetime64[us]").astype(object)
+    result[~is_set] = None
+    return result.tolist()
+
+
+def reminder_schedule(
+        columns: Dict[str, np.ndarray],
+        vehicle_mileage: Optional[Iterable[Optional[int]]] = None,
+        now: Optional[datetime] = None
+) -> Dict[str, np.ndarray]:
+    """
+    The columns apply_reminder_schedule derives, for every reminder at once. next_due_date, notify_date and
+    notify_at are microseconds since the epoch holding the largest int64 where it leaves None, next_due_mileage and
+    notify_mileage come with a `<column>_set` mask. vehicle_mileage, one odometer reading or None per reminder, makes
+    the reminders whose notify_mileage it reached due from now, for reminders without a notify_at yet.
+    """
+    start_date = columns["start_date"]
+    has_start = columns["start_date_set"]
+
+    # if maintenance_reminder.interval_months and start_date is not None
+    by_time = columns["interval_months_set"] & (columns["interval_months"] != 0) & has_start
+    next_due_date = np.where(
+        by_time, start_date + columns["interval_months"] * 30 * _MICROSECONDS_PER_DAY, _NO_TIME
+    )
+    notify_date = np.where(
+        by_time, next_due_date - columns["notify_before_days"] * _MICROSECONDS_PER_DAY, _NO_TIME
+    )
+    notify_at = notify_date.copy()
+
+    # if maintenance_reminder.last_serviced_mileage is not None and maintenance_reminder.interval_miles
+    has_mileage = (
+        columns["last_serviced_mileage_set"] & columns["interval_miles_set"] & (columns["interval_miles"] != 0)
+    )
+    next_due_mileage = np.where(has_mileage, columns["last_serviced_mileage"] + columns["interval_miles"], 0)
+    notify_mileage = np.where(has_mileage, next_due_mileage - columns["notify_before_miles"], 0)
+
+    # A positive monthly estimate to project the mileage with
+    by_mileage = has_mileage & (columns["estimated_miles_driven_per_month"] > 0) & has_start
+    mileage_days = estimate_days_until_mileage_array(
+        miles_needed=notify_mileage[by_mileage] - columns["last_serviced_mileage"][by_mileage],
+        miles_per_month=columns["estimated_miles_driven_per_month"][by_mileage]
+    )
+    notify_at[by_mileage] = np.minimum(
+        notify_at[by_mileage], start_date[by_mileage] + mileage_days * _MICROSECONDS_PER_DAY
+    )
+
+    if vehicle_mileage is not None:
+        odometer = np.fromiter(
+            (np.nan if value is None else value for value in vehicle_mileage), dtype=np.float64, count=len(start_date)
+        )
+        reached = has_mileage & (odometer >= notify_mileage)
+        notify_at[reached] = np.minimum(notify_at[reached], _microseconds(now or datetime.utcnow()))
+
+    return {
+        "next_due_date": next_due_date,
+        "notify_date": notify_date,
+        "next_due_mileage": next_due_mileage,
+        "next_due_mileage_set": has_mileage,
+        "notify_mileage": notify_mileage,
+        "notify_mileage_set": has_mileage,
+        "notify_at": notify_at
+    }
+
+
+def reminder_schedule_rows(schedule: Dict[str, np.ndarray]) -> List[dict]:
+    """reminder_schedule's arrays as one dict of column values per reminder, None where the column is unset."""
+    mileage_set = schedule["next_due_mileage_set"]
+    next_due_mileage = np.where(mileage_set, schedule["next_due_mileage"], None).tolist()
+    notify_mileage = np.where(mileage_set, schedule["notify_mileage"], None).tolist()
+
+    return [
+        {
+            "next_due_date": values[0],
+            "notify_date": values[1],
+            "next_due_mileage": values[2],
+            "notify_mileage": values[3],
+            "notify_at": values[4]
+        }
+        for values in zip(
+            _datetimes(schedule["next_due_date"]),
+            _datetimes(schedule["notify_date"]),
+            next_due_mileage,
+            notify_mileage,
+            _datetimes(schedule["notify_at"])
+        )
+    ]
@@ -0,0 +1,389 @@
+from sqlalchemy import event, inspect, or_, select, tuple_
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import heapq
+import logging
+import os
+import threading
+import time
+
+from app.models import MaintenanceReminder
+from app.utils.metrics import increment_counter, observe_timing
+
+
+REMINDER_SCHEDULER_ENABLED = os.getenv("REMINDER_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Most reminders held in memory at once, the earliest ones. Later ones stay in the database until the window
+# reaches them, so memory doesn't grow with the table.
+REMINDER_SCHEDULER_WINDOW = int(os.getenv("REMINDER_SCHEDULER_WINDOW", 50_000))
+REMINDER_SCHEDULER_BATCH_SIZE = int(os.getenv("REMINDER_SCHEDULER_BATCH_SIZE", 5_000))
+# Writes made by other worker processes only reach this one's window when it is reloaded
+REMINDER_SCHEDULER_RESYNC_SECONDS = float(os.getenv("REMINDER_SCHEDULER_RESYNC_SECONDS", 300))
+# On start, reminders that came due this long before are still fired, the ones the process was down for
+REMINDER_SCHEDULER_CATCH_UP_HOURS = float(os.getenv("REMINDER_SCHEDULER_CATCH_UP_HOURS", 24))
+# A batch the sink failed to take is put back and tried again after this long
+REMINDER_SCHEDULER_RETRY_SECONDS = float(os.getenv("REMINDER_SCHEDULER_RETRY_SECONDS", 30))
+
+logger = logging.getLogger(__name__)
+
+_MICROSECOND = timedelta(microseconds=1)
+
+ScheduleKey = Tuple[datetime, int]
+
+
+class DueReminder(NamedTuple):
+    reminder_id: int
+    notify_at: datetime
+
+
+# Called with every batch of reminders that came due. A reminder can come due again after a restart or when
+# another process reloads it, (reminder_id, notify_at) identifies the event for sinks that deduplicate.
+NotificationSink = Callable[[List[DueReminder]], None]
+
+
+def log_sink(due: List[DueReminder]) -> None:
+    for reminder in due:
+        logger.info("Maintenance reminder %s due since %s", reminder.reminder_id, reminder.notify_at.isoformat())
+
+
+class ReminderScheduler:
+    """
+    Fires each active reminder at its notify_at from a min-heap of (notify_at, id). Only the earliest `window`
+    reminders are loaded, streamed from the database in notify_at order, the next ones are read once the heap
+    runs dry. Writes committed in this process reschedule the affected reminders through schedule(), see
+    track_reminder_changes, and the whole window is reloaded every resync_seconds for the writes of others.
+
+    A sink that records what it took in last_notified_at, as OutboxDispatcher.enqueue does, sets
+    sink_records_notified. Every rebuild then reloads all reminders it has not recorded since the catch up window
+    began, so nothing is lost to a failed batch even across restarts.
+    """
+
+    def __init__(
+            self,
+            session_factory: Callable[[], Session],
+            sink: NotificationSink = log_sink,
+            window: int = REMINDER_SCHEDULER_WINDOW,
+            batch_size: int = REMINDER_SCHEDULER_BATCH_SIZE,
+            resync_seconds: float = REMINDER_SCHEDULER_RESYNC_SECONDS,
+            catch_up: timedelta = timedelta(hours=REMINDER_SCHEDULER_CATCH_UP_HOURS),
+            retry_seconds: float = REMINDER_SCHEDULER_RETRY_SECONDS,
+            sink_records_notified: bool = False
+    ):
+        self.session_factory = session_factory
+        self.sink = sink
+        self.window = window
+        self.batch_size = batch_size
+        self.resync_seconds = resync_seconds
+        self.retry_seconds = retry_seconds
+        self.sink_records_notified = sink_records_notified
+
+        self._condition = threading.Condition()
+        self._heap: List[ScheduleKey] = []
+        # The live notify_at of every reminder in the heap, heap entries that disagree were rescheduled or removed
+        self._scheduled: Dict[int, datetime] = {}
+        # Every active reminder keyed at or before this is in the heap, None once the rest of the table is too
+        self._loaded_until: Optional[ScheduleKey] = None
+        self._catch_up_from = datetime.utcnow() - catch_up
+        # Reminders due at or before this have fired
+        self._fired_until = self._catch_up_from
+        # The batch the sink is taking, a reminder rescheduled meanwhile is dropped from it
+        self._in_flight: Dict[int, datetime] = {}
+        # time.monotonic() before which the background thread doesn't fire again, set when the sink fails
+        self._retry_at = 0.0
+        # Reminders rescheduled while a load reads the database and where to, the load's copy of them is stale
+        self._touched: Optional[Dict[int, Optional[datetime]]] = None
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._scheduled)
+
+    def start(self) -> None:
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def schedule(self, reminder_id: int, notify_at: Optional[datetime]) -> None:
+        """Moves the reminder to notify_at, None takes it off the schedule."""
+        with self._condition:
+            if self._touched is not None:
+                self._touched[reminder_id] = notify_at
+
+            self._scheduled.pop(reminder_id, None)
+            self._in_flight.pop(reminder_id, None)
+
+            if notify_at is None:
+                return
+
+            # Beyond the loaded window the reminder is picked up from the database with the rest
+            if self._loaded_until is not None and (notify_at, reminder_id) > self._loaded_until:
+                return
+
+            self._scheduled[reminder_id] = notify_at
+            heapq.heappush(self._heap, (notify_at, reminder_id))
+
+            if len(self._heap) > 2 * self.window:
+                self._compact()
+
+            if self._heap[0] == (notify_at, reminder_id):
+                self._condition.notify_all()
+
+    def rebuild(self) -> int:
+        """Replaces the heap with the earliest window of reminders not fired yet. Returns how many were loaded."""
+        with self._condition:
+            self._touched = {}
+            after = (self._catch_up_from if self.sink_records_notified else self._fired_until, None)
+
+        entries, loaded_until = self._load(after=after)
+
+        with self._condition:
+            self._heap = []
+            self._scheduled = {}
+            self._merge(entries=entries, loaded_until=loaded_until)
+            self._condition.notify_all()
+
+            return len(self._scheduled)
+
+    def fire_due(self, now: Optional[datetime] = None) -> int:
+        """
+        Sinks every reminder due by now, batch_size at a time, loading the next window whenever the heap runs dry.
+        Stops at the first batch the sink fails to take, which is put back. Returns how many fired.
+        """
+        now = now or datetime.utcnow()
+        fired = 0
+        fired_until = now
+
+        while True:
+            with self._condition:
+                due = self._pop_due(now=now, limit=self.batch_size)
+                refill = not due and not self._heap and self._loaded_until is not None
+                after = self._loaded_until
+                if refill:
+                    self._touched = {}
+
+            if due:
+                if not self._deliver(due):
+                    # Short of the failed batch, so a rebuild loads it again
+                    fired_until = due[0].notify_at - _MICROSECOND
+                    break
+                fired += len(due)
+            elif refill:
+                self._refill(after=after)
+            else:
+                break
+
+        with self._condition:
+            self._fired_until = max(self._fired_until, fired_until)
+
+        return fired
+
+    def _deliver(self, due: List[DueReminder]) -> bool:
+        with self._condition:
+            self._in_flight = {reminder.reminder_id: reminder.notify_at for reminder in due}
+
+        try:
+            self.sink(due)
+        except Exception:
+            increment_counter("reminder_scheduler_sink_errors")
+            logger.exception("Reminder sink failed for %s reminders", len(due))
+
+            with self._condition:
+                # Back on the heap to be tried again, except the reminders rescheduled while the sink ran
+                for reminder_id, notify_at in self._in_flight.items():
+                    self._scheduled[reminder_id] = notify_at
+                    heapq.heappush(self._heap, (notify_at, reminder_id))
+                self._in_flight = {}
+                self._retry_at = time.monotonic() + self.retry_seconds
+
+            return False
+
+        with self._condition:
+            self._in_flight = {}
+        increment_counter("reminder_scheduler_fired", len(due))
+
+        return True
+
+    def _pop_due(self, now: datetime, limit: int) -> List[DueReminder]:
+        due = []
+
+        while self._heap and len(due) < limit:
+            notify_at, reminder_id = self._heap[0]
+
+            if self._scheduled.get(reminder_id) != notify_at:
+                heapq.heappop(self._heap)
+                continue
+            if notify_at > now:
+                break
+
+            heapq.heappop(self._heap)
+            del self._scheduled[reminder_id]
+            due.append(DueReminder(reminder_id=reminder_id, notify_at=notify_at))
+
+        return due
+
+    def _compact(self) -> None:
+        # Rescheduling leaves the old entries behind, past twice the window they are dropped and the window
+        # shrinks back to its size
+        entries = sorted((notify_at, reminder_id) for reminder_id, notify_at in self._scheduled.items())
+
+        if len(entries) > self.window:
+            entries = entries[:self.window]
+            self._loaded_until = entries[-1]
+
+        self._heap = entries
+        self._scheduled = {reminder_id: notify_at for notify_at, reminder_id in entries}
+
+    def _refill(self, after: ScheduleKey) -> None:
+        entries, loaded_until = self._load(after=after)
+
+        with self._condition:
+            self._merge(entries=entries, loaded_until=loaded_until)
+
+    def _merge(self, entries: List[ScheduleKey], loaded_until: Optional[ScheduleKey]) -> None:
+        # Reminders rescheduled during the load go where they were moved to instead, if that is inside the window
+        moved = [
+            (notify_at, reminder_id) for reminder_id, notify_at in self._touched.items()
+            if notify_at is not None and (loaded_until is None or (notify_at, reminder_id) <= loaded_until)
+        ]
+
+        for notify_at, reminder_id in [entry for entry in entries if entry[1] not in self._touched] + moved:
+            if self._scheduled.get(reminder_id) == notify_at:
+                continue
+            self._scheduled[reminder_id] = notify_at
+            heapq.heappush(self._heap, (notify_at, reminder_id))
+
+        self._loaded_until = loaded_until
+        self._touched = None
+
+    def _load(self, after: Tuple[datetime, Optional[int]]) -> Tuple[List[ScheduleKey], Optional[ScheduleKey]]:
+        """
+        The next window of active reminders after the (notify_at, id) key in one streaming pass, rows are fetched
+        batch_size at a time. Also returns the key the window ends at, None when it reached the end of the table.
+        """
+        started = time.perf_counter()
+        notify_after, id_after = after
+
+        statement = select(MaintenanceReminder.notify_at, MaintenanceReminder.id).where(
+            MaintenanceReminder.is_active,
+            MaintenanceReminder.notify_at.is_not(None),
+            # Already queued in the notification outbox for this notify_at, by this process before a restart or
+            # by another one
+            or_(
+                MaintenanceReminder.last_notified_at.is_(None),
+                MaintenanceReminder.last_notified_at != MaintenanceReminder.notify_at
+            )
+        )
+        if id_after is None:
+            statement = statement.where(MaintenanceReminder.notify_at > notify_after)
+        else:
+            statement = statement.where(
+                tuple_(MaintenanceReminder.notify_at, MaintenanceReminder.id) > tuple_(
+                    notify_after, id_after, types=[MaintenanceReminder.notify_at.type, MaintenanceReminder.id.type]
+                )
+            )
+        statement = statement.order_by(MaintenanceReminder.notify_at, MaintenanceReminder.id).limit(self.window + 1)
+
+        with self.session_factory() as db:
+            result = db.execute(statement.execution_options(yield_per=self.batch_size))
+            entries = [(notify_at, reminder_id) for notify_at, reminder_id in result]
+
+        loaded_until = None
+        if len(entries) > self.window:
+            entries.pop()
+            loaded_until = entries[-1]
+
+        increment_counter("reminder_scheduler_loaded", len(entries))
+        observe_timing("reminder_scheduler_load", time.perf_counter() - started)
+
+        return entries, loaded_until
+
+    def _seconds_until_next(self) -> Optional[float]:
+        if not self._heap:
+            return None
+        # After a sink failure the batch put back waits out retry_seconds instead of failing again at once
+        return max((self._heap[0][0] - datetime.utcnow()).total_seconds(), self._retry_at - time.monotonic(), 0.0)
+
+    def _run(self) -> None:
+        next_rebuild = 0.0
+
+        while True:
+            try:
+                if time.monotonic() >= next_rebuild:
+                    self.rebuild()
+                    next_rebuild = time.monotonic() + self.resync_seconds
+
+                if time.monotonic() >= self._retry_at:
+                    self.fire_due()
+            except Exception:
+                increment_counter("reminder_scheduler_errors")
+                logger.exception("Reminder scheduler pass failed")
+
+            with self._condition:
+                if self._stopping:
+                    return
+
+                timeout = max(next_rebuild - time.monotonic(), 0.0)
+                until_next = self._seconds_until_next()
+                if until_next is not None:
+                    timeout = min(timeout, until_next)
+
+                self._condition.wait(timeout)
+
+                if self._stopping:
+                    return
+
+
+_active_scheduler: Optional[ReminderScheduler] = None
+
+
+def set_active_scheduler(scheduler: Optional[ReminderScheduler]) -> None:
+    """The scheduler committed reminder changes are passed to, None while no scheduler runs in this process."""
+    global _active_scheduler
+    _active_scheduler = scheduler
+
+
+@event.listens_for(Session, "after_flush")
+def track_reminder_changes(session: Session, flush_context) -> None:
+    if _active_scheduler is None:
+        return
+
+    changes = session.info.setdefault("reminder_schedule_changes", {})
+
+    for instance in session.new:
+        if isinstance(instance, MaintenanceReminder):
+            changes[instance.id] = instance.notify_at if instance.is_active else None
+
+    for instance in session.dirty:
+        if isinstance(instance, MaintenanceReminder):
+            state = inspect(instance)
+            # Edits that leave the schedule alone must not fire an overdue reminder again
+            if state.attrs.notify_at.history.has_changes() or state.attrs.is_active.history.has_changes():
+                changes[instance.id] = instance.notify_at if instance.is_active else None
+
+    for instance in session.deleted:
+        if isinstance(instance, MaintenanceReminder):
+            changes[instance.id] = None
+
+
+@event.listens_for(Session, "after_commit")
+def apply_reminder_changes(session: Session) -> None:
+    changes = session.info.pop("reminder_schedule_changes", None)
+
+    if changes and _active_scheduler is not None:
+        for reminder_id, notify_at in changes.items():
+            _active_scheduler.schedule(reminder_id=reminder_id, notify_at=notify_at)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_reminder_changes(session: Session) -> None:
+    session.info.pop("reminder_schedule_changes", None)
@@ -1,34 +1,93 @@
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 import os
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 import jwt
 from datetime import datetime, timedelta
-from typing import Type
+from typing import Type, Tuple, Optional
+import threading
+import time
 
 from app.models import User
-from app.database import get_db
+from app.database import get_async_db
+from app.utils.cache import TTLCache
+from app.utils.metrics import increment_counter, observe_timing
 
 
 load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"])
+# Stored hashes made with a different cost are rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_ROUNDS)
+
+# FastAPI runs sync routes on AnyIO's thread pool, 40 threads by default, and the password routes are sync, each
+# holds its thread while waiting on a hash. So however many cores there are, at most PASSWORD_HASH_MAX_IN_FLIGHT
+# requests, a quarter of that pool by default, hash or wait to. Anything beyond is turned away with a 503 and the
+# other threads keep serving every other route.
+SYNC_ROUTE_THREADS = 40
+PASSWORD_HASH_MAX_IN_FLIGHT = int(os.getenv("PASSWORD_HASH_MAX_IN_FLIGHT", SYNC_ROUTE_THREADS // 4))
+
+# bcrypt releases the GIL, so hashing runs on its own small thread pool, with PASSWORD_HASH_QUEUE_DEPTH more
+# requests allowed to wait on it inside that cap
+PASSWORD_HASH_WORKERS = min(int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1)), PASSWORD_HASH_MAX_IN_FLIGHT)
+PASSWORD_HASH_QUEUE_DEPTH = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", 16))
+
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+password_slots = threading.BoundedSemaphore(
+    min(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_DEPTH, PASSWORD_HASH_MAX_IN_FLIGHT)
+)
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRES_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRES_MINUTES", 30))
 
+# Authenticated identities are cached per process, so another worker may serve a changed or deleted
+# user for up to USER_CACHE_TTL_SECONDS. USER_CACHE_MODE picks what get_current_user hands out:
+#   detached - a fresh User per request that is not part of the session, only its columns are usable
+#   attached - the same snapshot merged into the request session without a query, relationships lazy load
+#   disabled - always query the database
+USER_CACHE_MODE = os.getenv("USER_CACHE_MODE", "detached")
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+
+user_cache = TTLCache(name="user_cache", max_entries=USER_CACHE_MAX_ENTRIES, ttl_seconds=USER_CACHE_TTL_SECONDS)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
+def run_password_task(func, *args):
+    if not password_slots.acquire(blocking=False):
+        increment_counter("password_hash_rejected")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many login attempts in progress, please retry.",
+            headers={"Retry-After": "1"}
+        )
+
+    start = time.perf_counter()
+    try:
+        return password_executor.submit(func, *args).result()
+    finally:
+        password_slots.release()
+        observe_timing("password_hash", time.perf_counter() - start)
+
+
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return run_password_task(pwd_context.hash, password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return run_password_task(pwd_context.verify, plain_password, hashed_password)
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return run_password_task(pwd_context.verify_and_update, plain_password, hashed_password)
 
 
 def create_access_token(user_id: int):
@@ -40,7 +99,32 @@ def create_access_token(user_id: int):
     return encoded_jwt
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Type[User]:
+def snapshot_user(user: User) -> dict:
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    user_cache.invalidate(user_id)
+
+
+async def load_cached_user(db: AsyncSession, user_id: int):
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        return None
+
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+
+    if USER_CACHE_MODE == "attached":
+        return await db.merge(user, load=False)
+
+    return user
+
+
+async def get_current_user(
+        token: str = Depends(oauth2_scheme),
+        db: AsyncSession = Depends(get_async_db)
+) -> Type[User]:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = int(payload.get("sub"))
@@ -51,7 +135,12 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
                 detail="Could not validate credentials."
             )
 
-        user = db.query(User).filter(User.id == user_id).first()
+        if USER_CACHE_MODE != "disabled":
+            cached_user = await load_cached_user(db=db, user_id=user_id)
+            if cached_user is not None:
+                return cached_user
+
+        user = await db.get(User, user_id)
 
         if user is None:
             raise HTTPException(
@@ -59,6 +148,9 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
                 detail="User not found."
             )
 
+        if USER_CACHE_MODE != "disabled":
+            user_cache.set(user_id, snapshot_user(user))
+
         return user
 
     except jwt.PyJWTError:
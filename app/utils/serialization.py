@@ -0,0 +1,77 @@
+from fastapi.responses import Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple, Union, get_args, get_origin
+import os
+
+
+# "fast" dumps the loaded ORM rows straight to JSON following the response schema, "standard" hands the result
+# back to FastAPI, which validates it against response_model, dumps it to Python objects and json.dumps those.
+SERIALIZATION_MODE = os.getenv("SERIALIZATION_MODE", "fast")
+
+_MISSING = object()
+
+
+def _nested_plan(annotation: Any) -> Optional[Tuple[str, tuple]]:
+    if get_origin(annotation) is Union:
+        arguments = [argument for argument in get_args(annotation) if argument is not type(None)]
+        annotation = arguments[0] if len(arguments) == 1 else annotation
+
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return "model", get_serialization_plan(annotation)
+
+    if get_origin(annotation) in (list, List):
+        (item,) = get_args(annotation)
+        if isinstance(item, type) and issubclass(item, BaseModel):
+            return "list", get_serialization_plan(item)
+
+    return None
+
+
+@lru_cache(maxsize=None)
+def get_serialization_plan(model: type) -> tuple:
+    """(field name, FieldInfo, nested plan) for every field of model, in the order the schema declares them."""
+    return tuple((name, field, _nested_plan(field.annotation)) for name, field in model.model_fields.items())
+
+
+def dump_trusted(obj: Any, plan: tuple) -> dict:
+    # ORM instances keep loaded columns in __dict__, reading it skips the instrumented attribute per field
+    values = obj if isinstance(obj, dict) else obj.__dict__
+    row = {}
+
+    for name, field, nested in plan:
+        value = values.get(name, _MISSING)
+
+        if value is _MISSING:
+            value = field.get_default(call_default_factory=True) if isinstance(obj, dict) else getattr(obj, name)
+
+        if value is not None and nested is not None:
+            kind, nested_plan = nested
+            if kind == "list":
+                value = [dump_trusted(item, nested_plan) for item in value]
+            else:
+                value = dump_trusted(value, nested_plan)
+
+        row[name] = value
+
+    return row
+
+
+def render_json(model: type, content: Any) -> bytes:
+    """
+    JSON for content shaped by model, without validating it again. Rows come from our own tables and were
+    validated on the way in, so FastAPI's second pass only re-reads every attribute to confirm them.
+    """
+    return to_json(dump_trusted(content, get_serialization_plan(model)))
+
+
+def json_response(model: type, content: Any, headers: Optional[dict] = None) -> Any:
+    """
+    Returns content rendered against model as a ready Response, which FastAPI sends without running its
+    response_model again. Keep response_model on the route, the OpenAPI schema still comes from it.
+    """
+    if SERIALIZATION_MODE == "standard":
+        return content
+
+    return Response(content=render_json(model=model, content=content), media_type="application/json", headers=headers)
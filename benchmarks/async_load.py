@@ -0,0 +1,149 @@
+"""
+Requests/sec and latency of the async request path against the previous sync stack.
+
+    python -m benchmarks.async_load --requests 2000 --concurrency 200
+
+The async stack is the real app. The sync stack mounts the same CRUD functions behind plain `def` routes
+and the blocking get_db dependency, so FastAPI runs each request on its threadpool. Both hit the same
+seeded SQLite file through an in-process ASGI transport.
+
+The pool defaults to 20 + 30 overflow connections here. With fewer connections than the sync stack's 40
+threadpool slots it can starve itself: threads waiting for a connection hold every slot, so finished requests
+can't run get_db's cleanup and give theirs back. Those requests fail after DB_POOL_TIMEOUT and are counted
+in the errors column; try DB_POOL_SIZE=5 DB_MAX_OVERFLOW=10 to see it.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("DB_POOL_SIZE", "20")
+os.environ.setdefault("DB_MAX_OVERFLOW", "30")
+os.environ.setdefault("DB_POOL_TIMEOUT", "5")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'async_load.db')}"
+
+import httpx  # noqa: E402
+import jwt  # noqa: E402
+from fastapi import FastAPI, Depends  # noqa: E402
+from fastapi.security import OAuth2PasswordBearer  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.main import app as async_app  # noqa: E402
+from app.database import SessionLocal, get_db  # noqa: E402
+from app.models import User, Vehicle, MaintenanceRecord  # noqa: E402
+from app.utils.security import create_access_token, SECRET_KEY, ALGORITHM  # noqa: E402
+from app.crud.vehicles import crud_fetch_user_vehicles  # noqa: E402
+from app.crud.statistics import crud_fetch_user_maintenance_statistics  # noqa: E402
+
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+
+def get_current_user_sync(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    return db.query(User).filter(User.id == int(payload.get("sub"))).first()
+
+
+sync_app = FastAPI()
+
+
+@sync_app.get("/vehicles/")
+def fetch_user_vehicles(db: Session = Depends(get_db), current_user: User = Depends(get_current_user_sync)):
+    vehicles = crud_fetch_user_vehicles(db=db, current_user=current_user)["vehicles"]
+    return {"vehicles": [vehicle.id for vehicle in vehicles]}
+
+
+@sync_app.get("/statistics/")
+def get_user_maintenance_statistics(db: Session = Depends(get_db), current_user: User = Depends(get_current_user_sync)):
+    return crud_fetch_user_maintenance_statistics(db=db, current_user=current_user)
+
+
+def seed() -> int:
+    with SessionLocal() as db:
+        user = User(username="bench", email="bench@test.com", password_hash="x")
+        db.add(user)
+        db.commit()
+        for i in range(10):
+            vehicle = Vehicle(
+                user_id=user.id,
+                vehicle_type="Sedan",
+                make="Toyota",
+                model="Corolla",
+                color="Blue",
+                year=2020,
+                mileage=0,
+                vin=f"BENCHVIN{i:09d}",
+                license_plate=f"BENCH{i}",
+                registration_state="OH",
+                fuel_type="Gasoline",
+                transmission_type="Automatic",
+                is_active=True,
+                nickname=f"Bench {i}"
+            )
+            db.add(vehicle)
+            db.flush()
+            db.add_all(
+                MaintenanceRecord(vehicle_id=vehicle.id, maintenance_type="Oil Change", mileage=j, cost=50.0)
+                for j in range(100)
+            )
+        db.commit()
+        return user.id
+
+
+async def run_load(app, path: str, token: str, total: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one_request():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path, headers={"Authorization": f"Bearer {token}"})
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+async def run_all(token: str, total: int, concurrency: int):
+    print(f"{'stack':<6} {'path':<14} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for path in ("/vehicles/", "/statistics/"):
+        for name, app in (("sync", sync_app), ("async", async_app)):
+            result = await run_load(app, path, token, total, concurrency)
+            print(
+                f"{name:<6} {path:<14} {result['rps']:>8.0f} {result['p50_ms']:>8.1f} "
+                f"{result['p99_ms']:>8.1f} {result['errors']:>7}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    token = create_access_token(user_id=seed())
+
+    # One event loop for every run, the async engine's pooled connections are bound to the loop that opened them
+    asyncio.run(run_all(token=token, total=args.requests, concurrency=args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
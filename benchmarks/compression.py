@@ -0,0 +1,113 @@
+"""
+CPU time against bytes saved for gzip levels on GET /maintenance_records/ and /reminders/filtered/ payloads.
+
+    python -m benchmarks.compression --rows 50 500
+
+Bodies are rendered from the real response schemas, one user with a few vehicles so every row repeats one of a
+handful of VehicleSummary blocks, as the endpoints return them. Each level compresses the same body --repeat
+times; `ms` is the mean CPU time per response and `MB/s` the uncompressed throughput of one core.
+GZIP_COMPRESSION_LEVEL and GZIP_MINIMUM_SIZE in app/utils/compression.py pick the level the API runs with.
+"""
+import argparse
+import gzip
+import time
+from datetime import datetime, timedelta
+
+from app.schemas.vehicles import VehicleSummary
+from app.schemas.maintenance import MaintenanceListResponse, MaintenanceResponse
+from app.schemas.reminder import MaintenanceReminderListResponse, MaintenanceReminderResponse
+
+VEHICLES = [
+    VehicleSummary(id=i, make=make, model=model, year=2015 + i, vin=f"1HGCM82633A00{i:04d}", nickname=nickname)
+    for i, (make, model, nickname) in enumerate(
+        (("Toyota", "Corolla", "Daily"), ("Subaru", "Outback", "Big Bertha"), ("Ford", "F-150", "Work Truck")),
+        start=1
+    )
+]
+
+PROVIDERS = ("Valvoline", "Quick-I-Lube", "Self", "Dealer")
+MAINTENANCE_TYPES = ("Oil Change", "Brake Replacement", "Tire Rotation", "Air Filter")
+
+
+def maintenance_body(rows: int) -> bytes:
+    start = datetime(2024, 1, 1, 9, 30)
+    records = [
+        MaintenanceResponse(
+            id=i + 1,
+            maintenance_provider=PROVIDERS[i % len(PROVIDERS)],
+            maintenance_type=MAINTENANCE_TYPES[i % len(MAINTENANCE_TYPES)],
+            description=f"{MAINTENANCE_TYPES[i % len(MAINTENANCE_TYPES)]} at {35000 + i * 517} miles, checked fluids",
+            mileage=35000 + i * 517,
+            cost=round(49.99 + (i * 37.13) % 900, 2),
+            serviced_at=start + timedelta(days=i * 3),
+            created_at=start + timedelta(days=i * 3, minutes=5),
+            updated_at=None,
+            vehicle=VEHICLES[i % len(VEHICLES)]
+        )
+        for i in range(rows)
+    ]
+    next_cursor = "WyIyMDI0LTAxLTAxVDA5OjMwOjAwIiw1MF0"
+    return MaintenanceListResponse(maintenance=records, next_cursor=next_cursor).model_dump_json().encode()
+
+
+def reminders_body(rows: int) -> bytes:
+    start = datetime(2024, 1, 1, 9, 30)
+    reminders = [
+        MaintenanceReminderResponse(
+            id=i + 1,
+            maintenance_type=MAINTENANCE_TYPES[i % len(MAINTENANCE_TYPES)],
+            details=f"Due every {3000 + (i % 5) * 1000} miles",
+            interval_miles=3000 + (i % 5) * 1000,
+            interval_months=6,
+            last_serviced_mileage=35000 + i * 211,
+            last_serviced_date=start + timedelta(days=i),
+            notify_before_miles=500,
+            notify_before_days=14,
+            estimated_miles_driven_per_month=1000,
+            is_active=True,
+            created_at=start + timedelta(days=i, minutes=5),
+            updated_at=None,
+            vehicle=VEHICLES[i % len(VEHICLES)]
+        )
+        for i in range(rows)
+    ]
+    return MaintenanceReminderListResponse(reminders=reminders, next_cursor=None).model_dump_json().encode()
+
+
+def measure(body: bytes, level: int, repeat: int) -> dict:
+    start = time.process_time()
+    for _ in range(repeat):
+        compressed = gzip.compress(body, compresslevel=level)
+    seconds = (time.process_time() - start) / repeat
+
+    return {
+        "bytes": len(compressed),
+        "ratio": len(body) / len(compressed),
+        "ms": seconds * 1000,
+        "mb_per_second": len(body) / seconds / 1024 / 1024 if seconds else float("inf"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 3, 6, 9])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'payload':<22} {'rows':>5} {'level':>5} {'bytes':>9} {'ratio':>6} {'ms':>7} {'MB/s':>7}")
+    for name, render in (("/maintenance_records/", maintenance_body), ("/reminders/filtered/", reminders_body)):
+        for rows in args.rows:
+            body = render(rows)
+            print(f"{name:<22} {rows:>5} {'-':>5} {len(body):>9} {1.0:>6.1f} {0.0:>7.3f} {'-':>7}")
+
+            for level in args.levels:
+                result = measure(body=body, level=level, repeat=args.repeat)
+                print(
+                    f"{name:<22} {rows:>5} {level:>5} {result['bytes']:>9} {result['ratio']:>6.1f} "
+                    f"{result['ms']:>7.3f} {result['mb_per_second']:>7.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Peak RSS of GET /maintenance_records/export/ against materializing the same history in one response.
+
+    python -m benchmarks.export_memory --records 1000000
+
+One user's vehicles get --records maintenance records in a scratch SQLite file. Each mode then runs in a fresh
+interpreter so ru_maxrss only reflects that mode: `stream` drains the export generator the route hands to
+StreamingResponse, `materialized` loads base_maintenance_records_query with .all() and dumps one
+MaintenanceListResponse, as the list endpoint did before it was paginated. Materializing 1M records needs
+several GB, so it runs on --materialized-records (100k by default) and the RSS per record is what to compare.
+
+The `performance` SQLite profile maps up to 256 MiB of the database file and keeps a 64 MB page cache, both of
+which count toward RSS but stop growing once full. Run with SQLITE_MMAP_SIZE=0 SQLITE_CACHE_SIZE=-2000 to see
+the export's own footprint.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+VEHICLES = 10
+
+
+def seed(database_url: str, records: int):
+    os.environ["DATABASE_URL"] = database_url
+    from sqlalchemy import insert
+    from app.database import Base, engine, SessionLocal
+    from app.models import User, Vehicle, MaintenanceRecord
+
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        user = User(username="bench", email="bench@test.com", password_hash="x")
+        db.add(user)
+        db.flush()
+        vehicles = [
+            Vehicle(
+                user_id=user.id,
+                vehicle_type="Sedan",
+                make="Toyota",
+                model="Corolla",
+                color="Blue",
+                year=2020,
+                mileage=0,
+                vin=f"BENCHVIN{i:09d}",
+                license_plate=f"BENCH{i}",
+                registration_state="OH",
+                fuel_type="Gasoline",
+                transmission_type="Automatic",
+                is_active=True,
+                nickname=f"Bench {i}"
+            )
+            for i in range(VEHICLES)
+        ]
+        db.add_all(vehicles)
+        db.flush()
+
+        created_at = datetime(2024, 1, 1)
+        for start in range(0, records, 50000):
+            db.execute(
+                insert(MaintenanceRecord),
+                [
+                    {
+                        "vehicle_id": vehicles[i % VEHICLES].id,
+                        "maintenance_provider": "Valvoline",
+                        "maintenance_type": "Oil Change",
+                        "description": f"Synthetic oil change {i}",
+                        "mileage": i,
+                        "cost": 89.56,
+                        "serviced_at": created_at,
+                        "created_at": created_at,
+                    }
+                    for i in range(start, min(start + 50000, records))
+                ]
+            )
+        db.commit()
+
+
+def measure(database_url: str, mode: str) -> dict:
+    os.environ["DATABASE_URL"] = database_url
+    from app.database import SessionLocal
+    from app.models import User
+    from app.crud.maintenance import base_maintenance_records_query
+    from app.routes.maintenance import stream_maintenance_records_ndjson
+    from app.schemas.maintenance import MaintenanceListResponse
+
+    with SessionLocal() as db:
+        current_user = db.query(User).filter(User.username == "bench").first()
+        db.expunge(current_user)
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    exported_bytes = 0
+    records = 0
+
+    if mode == "stream":
+        for line in stream_maintenance_records_ndjson(current_user=current_user):
+            exported_bytes += len(line)
+            records += 1
+    else:
+        with SessionLocal() as db:
+            rows = base_maintenance_records_query(db=db, current_user=current_user).all()
+            body = MaintenanceListResponse(maintenance=rows).model_dump_json()
+            exported_bytes = len(body)
+            records = len(rows)
+
+    return {
+        "records": records,
+        "seconds": time.perf_counter() - start,
+        "exported_mb": exported_bytes / 1024 / 1024,
+        "baseline_rss_mb": baseline_kb / 1024,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_mode(mode: str, records: int, tmp_dir: str) -> dict:
+    # app.database binds DATABASE_URL at import time, so seeding and measuring each get their own interpreter
+    database_url = f"sqlite:///{os.path.join(tmp_dir, f'export_{records}.db')}"
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.export_memory", "--seed", database_url, "--records", str(records)],
+        check=True
+    )
+
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.export_memory", "--measure", mode, "--database", database_url],
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--materialized-records", type=int, default=100000)
+    parser.add_argument("--seed")
+    parser.add_argument("--measure", choices=("stream", "materialized"))
+    parser.add_argument("--database")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(database_url=args.seed, records=args.records)
+        return
+
+    if args.measure:
+        print(json.dumps(measure(database_url=args.database, mode=args.measure)))
+        return
+
+    print(f"{'mode':<13} {'records':>9} {'seconds':>8} {'output MB':>10} {'start RSS MB':>13} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for mode, records in (("stream", args.records), ("materialized", args.materialized_records)):
+            result = run_mode(mode=mode, records=records, tmp_dir=tmp_dir)
+            print(
+                f"{mode:<13} {result['records']:>9} {result['seconds']:>8.1f} {result['exported_mb']:>10.1f} "
+                f"{result['baseline_rss_mb']:>13.1f} {result['peak_rss_mb']:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
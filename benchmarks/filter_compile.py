@@ -0,0 +1,144 @@
+"""
+Per-request cost of building the statement for GET /maintenance_records/filtered/, rebuilt on every call
+against the cached statements of app.utils.filters.
+
+    python -m benchmarks.filter_compile --requests 5000
+
+`build` is the time to go from the request's filters to a statement SQLAlchemy can look up in its compiled
+cache: `rebuilt` constructs the ORM query with a filter per parameter and walks it for its cache key, as every
+request did before the filter specs, `cached` picks the statement for the filter shape and its bind values.
+`request` is the whole call on an in-memory SQLite database holding --rows records, so the build shows next
+to the query it precedes. Filter shapes rotate through SHAPES so the cached side pays its dictionary lookups.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import User, Vehicle, MaintenanceRecord
+from app.crud.maintenance import MAINTENANCE_FILTERS, base_maintenance_records_query
+from app.utils.filters import compile_filter_statement, fetch_filtered_page, _filter_params
+from app.utils.pagination import keyset_page_params, paginate_query
+
+SHAPES = (
+    {"maintenance_type": "oil"},
+    {"maintenance_provider": "valv", "cost_min": 50.0},
+    {"vehicle_id": 1, "serviced_at_after": datetime(2024, 3, 1), "serviced_at_before": datetime(2024, 6, 1)},
+    {"description": "synthetic", "mileage_min": 30000, "mileage_max": 60000},
+)
+
+
+def rebuilt_query(db, user, filters: dict):
+    # The filter loop every /filtered/ endpoint ran before app.utils.filters
+    query = base_maintenance_records_query(db=db, current_user=user)
+    for name, value in filters.items():
+        column, operator = MAINTENANCE_FILTERS.fields[name]
+        if operator == "contains":
+            query = query.filter(column.ilike(f"%{value}%"))
+        elif operator == "min":
+            query = query.filter(column >= value)
+        elif operator == "max":
+            query = query.filter(column <= value)
+        else:
+            query = query.filter(column == value)
+    return query
+
+
+def build_rebuilt(db, user, filters: dict):
+    query = rebuilt_query(db, user, filters)
+    query = query.order_by(None).order_by(MaintenanceRecord.created_at, MaintenanceRecord.id).limit(51)
+    return query._statement_20()._generate_cache_key()
+
+
+def build_cached(db, user, filters: dict):
+    active = tuple(name for name in MAINTENANCE_FILTERS.fields if filters.get(name) is not None)
+    statement = compile_filter_statement(MAINTENANCE_FILTERS, active, "prefix", False)
+    params = {"user_id": user.id, **keyset_page_params(limit=50, cursor=None)}
+    for name in active:
+        params.update(_filter_params(name, MAINTENANCE_FILTERS.fields[name], filters[name], "prefix"))
+    return statement._generate_cache_key(), params
+
+
+def request_rebuilt(db, user, filters: dict):
+    return paginate_query(query=rebuilt_query(db, user, filters), model=MaintenanceRecord, limit=50, cursor=None)
+
+
+def request_cached(db, user, filters: dict):
+    return fetch_filtered_page(db=db, spec=MAINTENANCE_FILTERS, user_id=user.id, filters=filters, limit=50,
+                               cursor=None)
+
+
+def seed(db, rows: int):
+    user = User(username="bench", email="bench@test.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    vehicle = Vehicle(user_id=user.id, vin="BENCHVIN000000001", mileage=0, nickname="Bench", make="Toyota",
+                      model="Corolla", year=2020, is_active=True)
+    db.add(vehicle)
+    db.commit()
+
+    start = datetime(2024, 1, 1, 9, 30)
+    db.add_all(
+        MaintenanceRecord(
+            vehicle_id=vehicle.id,
+            maintenance_provider=("Valvoline", "Dealer")[i % 2],
+            maintenance_type=("Oil Change", "Tire Rotation")[i % 2],
+            description=f"Synthetic oil at {30000 + i * 37} miles",
+            mileage=30000 + i * 37,
+            cost=40.0 + i % 100,
+            serviced_at=start + timedelta(hours=i)
+        )
+        for i in range(rows)
+    )
+    db.commit()
+    return user
+
+
+def timed(function, db, user, requests: int) -> float:
+    for filters in SHAPES:
+        function(db, user, filters)
+
+    start = time.perf_counter()
+    for i in range(requests):
+        function(db, user, SHAPES[i % len(SHAPES)])
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rows", type=int, default=200)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+
+    with sessionmaker(autocommit=False, autoflush=False, bind=engine)() as db:
+        user = seed(db, rows=args.rows)
+
+        for filters in SHAPES:
+            rebuilt = [record.id for record in request_rebuilt(db, user, filters)[0]]
+            cached = [record.id for record in request_cached(db, user, filters)[0]]
+            if rebuilt != cached:
+                raise SystemExit(f"{filters}: rebuilt and cached statements return different pages")
+
+        print(f"{'stage':<8} {'rebuilt us':>11} {'cached us':>10} {'saved us':>9}")
+        for stage, rebuilt, cached in (
+                ("build", build_rebuilt, build_cached),
+                ("request", request_rebuilt, request_cached)
+        ):
+            rebuilt_seconds = timed(rebuilt, db, user, args.requests)
+            cached_seconds = timed(cached, db, user, args.requests)
+            print(
+                f"{stage:<8} {rebuilt_seconds * 1e6:>11.1f} {cached_seconds * 1e6:>10.1f} "
+                f"{(rebuilt_seconds - cached_seconds) * 1e6:>9.1f}"
+            )
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
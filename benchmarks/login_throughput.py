@@ -0,0 +1,148 @@
+"""
+Login throughput, and vehicle request latency while a burst of logins is in flight.
+
+    python -m benchmarks.login_throughput --logins 200 --concurrency 100
+
+Each mode fires the login burst at POST /sessions/ together with a steady stream of GET /vehicles/ requests.
+`inline` hashes on the request thread as before, `pool` goes through the bounded password executor, which
+turns away logins beyond PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_DEPTH, at most PASSWORD_HASH_MAX_IN_FLIGHT,
+with a 503 (the rejected column).
+Errors are any other failure, e.g. inline logins holding every threadpool slot until the DB pool times out.
+Set BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_DEPTH and PASSWORD_HASH_MAX_IN_FLIGHT to compare
+other settings.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("DB_POOL_SIZE", "20")
+os.environ.setdefault("DB_MAX_OVERFLOW", "30")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'login_throughput.db')}"
+
+import httpx  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.database import SessionLocal, async_engine  # noqa: E402
+from app.models import User, Vehicle  # noqa: E402
+from app.utils import security  # noqa: E402
+
+
+def seed(users: int) -> str:
+    password_hash = security.pwd_context.hash("pass12345")
+    with SessionLocal() as db:
+        db.add_all(
+            User(username=f"bench{i}", email=f"bench{i}@test.com", password_hash=password_hash)
+            for i in range(users)
+        )
+        db.commit()
+        user = db.query(User).filter(User.username == "bench0").first()
+        db.add(
+            Vehicle(
+                user_id=user.id,
+                vehicle_type="Sedan",
+                make="Toyota",
+                model="Corolla",
+                color="Blue",
+                year=2020,
+                mileage=0,
+                vin="BENCHVIN000000001",
+                license_plate="BENCH1",
+                registration_state="OH",
+                fuel_type="Gasoline",
+                transmission_type="Automatic",
+                is_active=True,
+                nickname="Bench"
+            )
+        )
+        db.commit()
+        return security.create_access_token(user_id=user.id)
+
+
+def percentile(latencies: list, fraction: float) -> float:
+    latencies = sorted(latencies)
+    return latencies[max(int(len(latencies) * fraction) - 1, 0)] * 1000
+
+
+async def run_burst(client: httpx.AsyncClient, token: str, logins: int, users: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    status_codes = []
+    vehicle_latencies = []
+    done = asyncio.Event()
+
+    async def login(i: int):
+        async with semaphore:
+            response = await client.post(
+                "/sessions/",
+                json={"username": f"bench{i % users}", "password": "pass12345"}
+            )
+            status_codes.append(response.status_code)
+
+    async def poll_vehicles():
+        while not done.is_set():
+            start = time.perf_counter()
+            await client.get("/vehicles/", headers={"Authorization": f"Bearer {token}"})
+            vehicle_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    poller = asyncio.create_task(poll_vehicles())
+    start = time.perf_counter()
+    await asyncio.gather(*(login(i) for i in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await poller
+
+    accepted = status_codes.count(200)
+    return {
+        "logins_per_second": accepted / elapsed,
+        "accepted": accepted,
+        "rejected": status_codes.count(503),
+        "errors": len(status_codes) - accepted - status_codes.count(503),
+        "vehicles_p50_ms": statistics.median(vehicle_latencies) * 1000,
+        "vehicles_p99_ms": percentile(vehicle_latencies, 0.99),
+    }
+
+
+async def run_all(token: str, logins: int, users: int, concurrency: int):
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    run_password_task = security.run_password_task
+
+    print(
+        f"{'mode':<7} {'logins/s':>9} {'accepted':>9} {'rejected':>9} {'errors':>7} "
+        f"{'veh p50 ms':>11} {'veh p99 ms':>11}"
+    )
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for mode in ("inline", "pool"):
+            if mode == "inline":
+                security.run_password_task = lambda func, *args: func(*args)
+            else:
+                security.run_password_task = run_password_task
+
+            result = await run_burst(client, token, logins, users, concurrency)
+            print(
+                f"{mode:<7} {result['logins_per_second']:>9.1f} {result['accepted']:>9} {result['rejected']:>9} "
+                f"{result['errors']:>7} {result['vehicles_p50_ms']:>11.1f} {result['vehicles_p99_ms']:>11.1f}"
+            )
+
+    security.run_password_task = run_password_task
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    token = seed(users=args.users)
+
+    # One event loop for every run, the async engine's pooled connections are bound to the loop that opened them
+    asyncio.run(run_all(token=token, logins=args.logins, users=args.users, concurrency=args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Throughput of the notification outbox delivering to a webhook that takes --latency-ms to answer each batch.
+
+    python -m benchmarks.outbox_dispatch --notifications 5000 --latency-ms 20
+
+A scratch SQLite file gets --notifications due reminders, which are queued in the outbox in batches as the reminder
+scheduler would. A local HTTP server plays the receiver. Every row of workers x batch size then drains a fresh copy
+of the outbox, delivery waits on the receiver rather than the database, so more workers or bigger batches overlap
+or share that wait. The receiver counts distinct idempotency keys, every run must deliver each one.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, get_engine_options
+from app.models import User, Vehicle, MaintenanceReminder, NotificationOutbox
+from app.utils.outbox import OutboxDispatcher, WebhookSink
+from app.utils.scheduler import DueReminder
+
+NOW = datetime(2025, 1, 1)
+
+
+def start_receiver(latency: float):
+    received = set()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+            with lock:
+                received.update(message["idempotency_key"] for message in body["notifications"])
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received
+
+
+def seed(session_factory, notifications: int, url: str):
+    with session_factory() as db:
+        user = User(username="bench", email="bench@test.com", password_hash="x")
+        db.add(user)
+        db.flush()
+        vehicle = Vehicle(user_id=user.id, vin="BENCHVIN000000001", mileage=0, nickname="Bench", make="Toyota",
+                          model="Corolla", year=2020, is_active=True)
+        db.add(vehicle)
+        db.flush()
+        db.execute(
+            insert(MaintenanceReminder),
+            [
+                {
+                    "vehicle_id": vehicle.id,
+                    "user_id": user.id,
+                    "maintenance_type": "Oil Change",
+                    "interval_months": 6,
+                    "last_serviced_date": NOW,
+                    "is_active": True,
+                    "notify_at": NOW + timedelta(seconds=i)
+                }
+                for i in range(notifications)
+            ]
+        )
+        db.commit()
+        due = [DueReminder(reminder_id, notify_at) for notify_at, reminder_id in db.query(
+            MaintenanceReminder.notify_at, MaintenanceReminder.id
+        ).order_by(MaintenanceReminder.id)]
+
+    dispatcher = OutboxDispatcher(session_factory=session_factory, sinks=[WebhookSink(url=url)])
+    for start in range(0, len(due), 500):
+        dispatcher.enqueue(due[start:start + 500])
+
+
+def run(database_path: str, url: str, workers: int, batch_size: int, notifications: int) -> float:
+    database_url = f"sqlite:///{database_path}"
+    engine = create_engine(database_url, **get_engine_options(database_url))
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    dispatcher = OutboxDispatcher(
+        session_factory=session_factory, sinks=[WebhookSink(url=url)], workers=workers, batch_size=batch_size,
+        poll_seconds=0.05
+    )
+
+    start = time.perf_counter()
+    dispatcher.start()
+    try:
+        with session_factory() as db:
+            while db.query(NotificationOutbox).filter(NotificationOutbox.status == "delivered").count() < notifications:
+                db.rollback()
+                time.sleep(0.02)
+    finally:
+        dispatcher.stop()
+        engine.dispose()
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--notifications", type=int, default=5000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    server, received = start_receiver(latency=args.latency_ms / 1000)
+    url = f"http://127.0.0.1:{server.server_port}/"
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        seeded_path = os.path.join(tmp_dir, "seeded.db")
+        engine = create_engine(f"sqlite:///{seeded_path}")
+        Base.metadata.create_all(bind=engine)
+        seed(sessionmaker(bind=engine), notifications=args.notifications, url=url)
+        engine.dispose()
+
+        print(f"{'workers':>7} {'batch':>6} {'seconds':>8} {'per second':>11}")
+        for workers, batch_size in ((1, 10), (1, 100), (4, 100), (8, 25)):
+            run_path = os.path.join(tmp_dir, f"run-{workers}-{batch_size}.db")
+            shutil.copyfile(seeded_path, run_path)
+            received.clear()
+
+            seconds = run(run_path, url, workers=workers, batch_size=batch_size, notifications=args.notifications)
+            if len(received) != args.notifications:
+                raise SystemExit(f"{workers} x {batch_size}: received {len(received)} of {args.notifications}")
+            print(f"{workers:>7} {batch_size:>6} {seconds:>8.2f} {args.notifications / seconds:>11.0f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
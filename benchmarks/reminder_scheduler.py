@@ -0,0 +1,115 @@
+"""
+Memory and time of the reminder scheduler rebuilding from, and firing through, a table of --reminders reminders.
+
+    python -m benchmarks.reminder_scheduler --reminders 1000000 --window 50000
+
+A scratch SQLite file gets --reminders active reminders whose notify_at is spread over a year. For each window
+size the scheduler is rebuilt as on startup, then fires every reminder by asking for those due a year on, which
+makes it stream the table window after window. `window` is the default bounded heap, `unbounded` loads the whole
+table at once as a heap of every reminder would. Peak memory is traced by tracemalloc, which also slows both
+runs down by the same factor.
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import User, Vehicle, MaintenanceReminder
+from app.utils.scheduler import ReminderScheduler
+
+NOW = datetime(2025, 1, 1)
+
+
+def seed(session_factory, reminders: int):
+    with session_factory() as db:
+        user = User(username="bench", email="bench@test.com", password_hash="x")
+        db.add(user)
+        db.flush()
+        vehicle = Vehicle(user_id=user.id, vin="BENCHVIN000000001", mileage=0, nickname="Bench", make="Toyota",
+                          model="Corolla", year=2020, is_active=True)
+        db.add(vehicle)
+        db.flush()
+
+        for start in range(0, reminders, 50000):
+            db.execute(
+                insert(MaintenanceReminder),
+                [
+                    {
+                        "vehicle_id": vehicle.id,
+                        "user_id": user.id,
+                        "maintenance_type": "Oil Change",
+                        "interval_months": 6,
+                        "last_serviced_date": NOW,
+                        "is_active": True,
+                        # Spread over a year, out of insertion order
+                        "notify_at": NOW + timedelta(seconds=(i * 7919) % (365 * 86400)),
+                    }
+                    for i in range(start, min(start + 50000, reminders))
+                ]
+            )
+        db.commit()
+
+
+def run(session_factory, window: int) -> dict:
+    fired = [0]
+
+    def count_sink(due):
+        fired[0] += len(due)
+
+    tracemalloc.start()
+    scheduler = ReminderScheduler(session_factory=session_factory, sink=count_sink, window=window)
+    scheduler._fired_until = NOW - timedelta(seconds=1)
+
+    start = time.perf_counter()
+    loaded = scheduler.rebuild()
+    rebuild_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scheduler.fire_due(now=NOW + timedelta(days=366))
+    fire_seconds = time.perf_counter() - start
+
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "loaded": loaded,
+        "fired": fired[0],
+        "rebuild_seconds": rebuild_seconds,
+        "fire_seconds": fire_seconds,
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reminders", type=int, default=1_000_000)
+    parser.add_argument("--window", type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'scheduler.db')}")
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        seed(session_factory, reminders=args.reminders)
+
+        print(f"{'mode':<10} {'window':>9} {'rebuild ms':>11} {'fire s':>8} {'fired/s':>9} {'peak MB':>8}")
+        for mode, window in (("window", args.window), ("unbounded", args.reminders)):
+            result = run(session_factory, window=window)
+            if result["fired"] != args.reminders:
+                raise SystemExit(f"{mode}: fired {result['fired']} of {args.reminders} reminders")
+            print(
+                f"{mode:<10} {window:>9} {result['rebuild_seconds'] * 1e3:>11.1f} {result['fire_seconds']:>8.2f} "
+                f"{result['fired'] / result['fire_seconds']:>9.0f} {result['peak_mb']:>8.1f}"
+            )
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
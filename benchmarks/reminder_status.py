@@ -0,0 +1,133 @@
+"""
+Cost of deriving reminder schedules, as the startup backfill does, one at a time against the vectorized pass of
+app.utils.reminder_status.
+
+    python -m benchmarks.reminder_status --rows 1000000
+
+`per row` derives each reminder's schedule with apply_reminder_schedule, the timedelta arithmetic and branching
+every reminder paid. `arrays` turns the fetched rows into NumPy columns, `schedule` is the single pass over them,
+`rows` turns its arrays back into the column values the backfill writes, `vectorized` is all three together, each
+the best of --repeat runs. Rows are generated with a fixed seed, a share of missing values and odometer readings,
+both sides must agree on every column of every reminder or the run stops.
+"""
+import argparse
+import gc
+import random
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.utils.reminder import apply_reminder_schedule, get_reminder_start_date
+from app.utils.reminder_status import reminder_columns, reminder_schedule, reminder_schedule_rows
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def make_reminders(rows: int) -> list:
+    rng = random.Random(rows)
+
+    def maybe(value):
+        return None if rng.random() < 0.1 else value
+
+    return [
+        SimpleNamespace(
+            last_serviced_date=maybe(NOW - timedelta(days=rng.randint(0, 800))),
+            updated_at=None,
+            created_at=NOW - timedelta(days=rng.randint(400, 900)),
+            interval_months=maybe(rng.choice([3, 6, 12])),
+            notify_before_days=rng.choice([7, 14, 30]),
+            last_serviced_mileage=maybe(rng.randint(0, 150000)),
+            interval_miles=maybe(rng.choice([3000, 5000, 7500])),
+            notify_before_miles=rng.choice([250, 500]),
+            estimated_miles_driven_per_month=maybe(rng.choice([500, 1000, 1234])),
+            notify_at=None,
+            vehicle_mileage=maybe(rng.randint(0, 160000))
+        )
+        for _ in range(rows)
+    ]
+
+
+def per_row(reminders: list) -> list:
+    schedules = []
+    for reminder in reminders:
+        apply_reminder_schedule(maintenance_reminder=reminder, vehicle_mileage=reminder.vehicle_mileage, now=NOW)
+        schedules.append({
+            "next_due_date": reminder.next_due_date,
+            "notify_date": reminder.notify_date,
+            "next_due_mileage": reminder.next_due_mileage,
+            "notify_mileage": reminder.notify_mileage,
+            "notify_at": reminder.notify_at
+        })
+    return schedules
+
+
+def vectorized_schedule(columns: dict, vehicle_mileage: list):
+    return reminder_schedule(columns=columns, vehicle_mileage=vehicle_mileage, now=NOW)
+
+
+def best_of(repeat: int, function, *args):
+    # The first call also pays for faulting in freshly allocated arrays, later ones show the steady state
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs for the vectorized stages")
+    args = parser.parse_args()
+
+    reminders = make_reminders(args.rows)
+    # The columns the backfill selects, start date already resolved by the query's coalesce
+    rows = [
+        (
+            get_reminder_start_date(reminder),
+            reminder.interval_months,
+            reminder.notify_before_days,
+            reminder.last_serviced_mileage,
+            reminder.interval_miles,
+            reminder.notify_before_miles,
+            reminder.estimated_miles_driven_per_month
+        )
+        for reminder in reminders
+    ]
+    vehicle_mileage = [reminder.vehicle_mileage for reminder in reminders]
+    # Neither side should pay for the collector walking the million objects built above
+    gc.collect()
+    gc.freeze()
+
+    start = time.perf_counter()
+    expected = per_row(reminders)
+    per_row_seconds = time.perf_counter() - start
+
+    columns, arrays_seconds = best_of(args.repeat, reminder_columns, rows)
+    schedule, schedule_seconds = best_of(args.repeat, vectorized_schedule, columns, vehicle_mileage)
+    schedules, rows_seconds = best_of(args.repeat, reminder_schedule_rows, schedule)
+
+    if schedules != expected:
+        raise SystemExit("per row and vectorized schedules differ")
+
+    vectorized_seconds = arrays_seconds + schedule_seconds + rows_seconds
+    scheduled = sum(1 for row in expected if row["notify_at"] is not None)
+    print(f"{args.rows} reminders, {scheduled} with a notify_at")
+    print(f"{'stage':<11} {'ms':>9} {'ns/row':>8}")
+    for stage, seconds in (
+            ("per row", per_row_seconds),
+            ("arrays", arrays_seconds),
+            ("schedule", schedule_seconds),
+            ("rows", rows_seconds),
+            ("vectorized", vectorized_seconds)
+    ):
+        print(f"{stage:<11} {seconds * 1e3:>9.1f} {seconds / args.rows * 1e9:>8.0f}")
+    print(
+        f"speedup {per_row_seconds / vectorized_seconds:.1f}x, "
+        f"schedule alone {per_row_seconds / schedule_seconds:.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Write/read throughput of the SQLite pragma profiles in app/database.py.
+
+    python -m benchmarks.sqlite_profile --writes 2000 --reads 20000
+
+Each profile gets a fresh database file. Writes commit one maintenance record per transaction,
+like the API does, so the journal mode and fsync policy dominate. Reads run the per-user
+maintenance records query used by GET /maintenance_records/.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, SQLITE_PROFILES, apply_sqlite_pragmas
+from app.models import User, Vehicle, MaintenanceRecord
+from app.crud.maintenance import base_maintenance_records_query
+
+
+def run_profile(profile: str, writes: int, reads: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(
+            f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}", connect_args={"check_same_thread": False}
+        )
+        event.listen(engine, "connect", lambda conn, record: apply_sqlite_pragmas(conn, SQLITE_PROFILES[profile]))
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        with session_factory() as db:
+            user = User(username="bench", email="bench@test.com", password_hash="x")
+            db.add(user)
+            db.commit()
+            vehicle = Vehicle(user_id=user.id, vin="BENCHVIN000000001", mileage=0, nickname="Bench", make="Toyota",
+                              model="Corolla", year=2020, is_active=True)
+            db.add(vehicle)
+            db.commit()
+
+            start = time.perf_counter()
+            for i in range(writes):
+                db.add(MaintenanceRecord(vehicle_id=vehicle.id, maintenance_type="Oil Change", mileage=i, cost=50.0))
+                db.commit()
+            write_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(reads):
+                base_maintenance_records_query(db=db, current_user=user).limit(20).all()
+            read_seconds = time.perf_counter() - start
+
+        engine.dispose()
+
+    return {"writes_per_sec": writes / write_seconds, "reads_per_sec": reads / read_seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--reads", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'profile':<12} {'writes/s':>12} {'reads/s':>12}")
+    for profile in SQLITE_PROFILES:
+        result = run_profile(profile=profile, writes=args.writes, reads=args.reads)
+        print(f"{profile:<12} {result['writes_per_sec']:>12.0f} {result['reads_per_sec']:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from app.utils.compression import CompressionMiddleware
+
+
+def make_client(minimum_size: int = 100) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=minimum_size,
+        compresslevel=6,
+        excluded_paths=("/export/",)
+    )
+
+    @app.get("/large/")
+    def large():
+        return PlainTextResponse("maintenance " * 100)
+
+    @app.get("/small/")
+    def small():
+        return PlainTextResponse("ok")
+
+    @app.get("/export/")
+    def export():
+        return PlainTextResponse("maintenance " * 100)
+
+    return TestClient(app)
+
+
+def test_compression_middleware_compresses_large_responses():
+    client = make_client()
+
+    response = client.get("/large/", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len("maintenance " * 100)
+    assert response.text == "maintenance " * 100
+
+
+def test_compression_middleware_minimum_size():
+    client = make_client(minimum_size=100)
+
+    response = client.get("/small/", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.text == "ok"
+
+
+def test_compression_middleware_excluded_path():
+    client = make_client()
+
+    response = client.get("/export/", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+    assert response.text == "maintenance " * 100
+
+
+def test_compression_middleware_requires_accept_encoding():
+    client = make_client()
+
+    response = client.get("/large/", headers={"Accept-Encoding": "identity"})
+
+    assert "content-encoding" not in response.headers
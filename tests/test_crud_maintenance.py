@@ -1,18 +1,25 @@
+import os
+import json
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, Table, create_engine, event, insert, inspect, text
 from sqlalchemy.orm import sessionmaker
 from fastapi import HTTPException
+from datetime import datetime
 
-from app.models import Base
+from app.database import get_engine_options
+from app.models import Base, User, Vehicle, MaintenanceRecord, MaintenanceReminder, ensure_owner_columns
+from app.models import MAINTENANCE_SEARCH_TABLE, ensure_maintenance_search_index
 from app.crud import vehicles, maintenance
-from app.schemas.vehicles import VehicleCreate
-from app.schemas.maintenance import MaintenanceCreate, MaintenanceUpdate
+from app.schemas.vehicles import VehicleCreate, VehicleSummary
+from app.schemas.maintenance import MaintenanceCreate, MaintenanceUpdate, MaintenanceResponse
+from app.utils.fields import parse_fields, sparse_list_response
 from test_crud_vehicles import get_new_user
 
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Point TEST_DATABASE_URL at a scratch PostgreSQL database to run the suite against that backend
+SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite:///:memory:")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **get_engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -285,6 +292,158 @@ def test_fetch_all_vehicle_maintenance_records_filtered_no_filters(db):
     assert exc_info.value.detail == "At least one filter parameter must be provided."
 
 
+def create_maintenance_records(db, current_user, vehicle_id: int, count: int) -> list:
+    records = []
+    for i in range(count):
+        maintenance_create = MaintenanceCreate(
+            maintenance_provider="Valvoline",
+            maintenance_type="Oil Change",
+            description=f"Oil Change {i}",
+            mileage=35000 + i,
+            cost=89.65,
+            serviced_at="2024-04-10T10:00:00",
+            vehicle_id=vehicle_id
+        )
+        records.append(
+            maintenance.crud_create_maintenance_record(
+                db=db,
+                current_user=current_user,
+                maintenance_create=maintenance_create
+            )
+        )
+
+    return records
+
+
+def test_fetch_all_vehicle_maintenance_records_paginated(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    records = create_maintenance_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id, count=5)
+
+    # Same second for the first three rows, the id breaks the tie
+    db.query(MaintenanceRecord).filter(MaintenanceRecord.id.in_([r.id for r in records[:3]])).update(
+        {MaintenanceRecord.created_at: datetime(2024, 4, 10, 10, 0, 0)}
+    )
+    db.commit()
+
+    seen_ids = []
+    cursor = None
+    pages = 0
+    while True:
+        page = maintenance.crud_fetch_all_vehicle_maintenance_records(
+            db=db,
+            current_user=created_user,
+            limit=2,
+            cursor=cursor
+        )
+        seen_ids.extend(record.id for record in page["maintenance"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert seen_ids == [record.id for record in records]
+
+
+def test_fetch_all_vehicle_maintenance_records_filtered_paginated(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    records = create_maintenance_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id, count=3)
+
+    first_page = maintenance.crud_fetch_all_vehicle_maintenance_records_filtered(
+        db=db,
+        current_user=created_user,
+        vehicle_id=new_vehicle.id,
+        maintenance_provider="Valvoline",
+        maintenance_type=None,
+        description=None,
+        mileage=None,
+        cost=None,
+        serviced_at=None,
+        limit=2
+    )
+
+    second_page = maintenance.crud_fetch_all_vehicle_maintenance_records_filtered(
+        db=db,
+        current_user=created_user,
+        vehicle_id=new_vehicle.id,
+        maintenance_provider="Valvoline",
+        maintenance_type=None,
+        description=None,
+        mileage=None,
+        cost=None,
+        serviced_at=None,
+        limit=2,
+        cursor=first_page["next_cursor"]
+    )
+
+    assert [record.id for record in first_page["maintenance"]] == [records[0].id, records[1].id]
+    assert [record.id for record in second_page["maintenance"]] == [records[2].id]
+    assert second_page["next_cursor"] is None
+
+
+def test_fetch_all_vehicle_maintenance_records_invalid_cursor(db):
+    created_user = get_new_user(db=db, user_id=1)
+
+    with pytest.raises(HTTPException) as exc_info:
+        maintenance.crud_fetch_all_vehicle_maintenance_records(db=db, current_user=created_user, cursor="not-a-cursor")
+
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "Invalid cursor."
+
+
+def test_fetch_all_vehicle_maintenance_records_sparse_fields(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    create_maintenance_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id, count=2)
+    db.expire_all()
+
+    selection = parse_fields("cost,id", MaintenanceResponse, "vehicle", VehicleSummary)
+    page = maintenance.crud_fetch_all_vehicle_maintenance_records(db=db, current_user=created_user, fields=selection)
+
+    assert selection.fields == ("cost", "id")
+    assert selection.nested_fields is None
+    for record in page["maintenance"]:
+        assert {"description", "maintenance_provider", "vehicle"} <= inspect(record).unloaded
+
+    response = sparse_list_response(page, "maintenance", MaintenanceResponse, selection, "vehicle", VehicleSummary)
+    assert json.loads(response.body) == {
+        "maintenance": [{"cost": 89.65, "id": 1}, {"cost": 89.65, "id": 2}],
+        "next_cursor": None
+    }
+
+
+def test_fetch_all_vehicle_maintenance_records_sparse_nested_fields(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    create_maintenance_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id, count=1)
+    db.expire_all()
+
+    selection = parse_fields("id,vehicle.nickname", MaintenanceResponse, "vehicle", VehicleSummary)
+    page = maintenance.crud_fetch_all_vehicle_maintenance_records(db=db, current_user=created_user, fields=selection)
+    record = page["maintenance"][0]
+
+    assert "vehicle" not in inspect(record).unloaded
+    assert {"vin", "make"} <= inspect(record.vehicle).unloaded
+
+    response = sparse_list_response(page, "maintenance", MaintenanceResponse, selection, "vehicle", VehicleSummary)
+    assert json.loads(response.body)["maintenance"] == [{"id": 1, "vehicle": {"nickname": new_vehicle.nickname}}]
+
+
+def test_parse_fields_unknown_field():
+    with pytest.raises(HTTPException) as exc_info:
+        parse_fields("id,vehicle.color,password", MaintenanceResponse, "vehicle", VehicleSummary)
+
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "Unknown fields: password, vehicle.color."
+
+    with pytest.raises(HTTPException) as exc_info:
+        parse_fields(" , ", MaintenanceResponse, "vehicle", VehicleSummary)
+
+    assert exc_info.value.detail == "No fields requested."
+
+
 def test_update_maintenance_record(db):
     created_user = get_new_user(db=db, user_id=1)
     new_vehicle = get_registered_car(db=db, current_user=created_user)
@@ -540,3 +699,286 @@ def test_delete_maintenance_record_user_does_not_own_record(db):
 
     assert exc_info.value.status_code == 403
     assert exc_info.value.detail == "Not authorized to delete this record."
+
+
+def test_stream_vehicle_maintenance_records(db):
+    created_user = get_new_user(db=db, user_id=1)
+    other_user = get_new_user(db=db, user_id=2)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    other_vehicle = get_registered_car(db=db, current_user=other_user, vehicle_number=2)
+    records = create_maintenance_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id, count=3)
+    create_maintenance_records(db=db, current_user=other_user, vehicle_id=other_vehicle.id, count=2)
+
+    lines = list(maintenance.crud_stream_vehicle_maintenance_records(db=db, current_user=created_user, batch_size=2))
+    exported = [json.loads(line) for line in lines]
+
+    assert all(line.endswith("\n") for line in lines)
+    assert [record["id"] for record in exported] == [record.id for record in records]
+    assert exported[0]["description"] == "Oil Change 0"
+    assert exported[0]["vehicle"]["nickname"] == new_vehicle.nickname
+
+
+def create_searchable_records(db, current_user, vehicle_id: int) -> list:
+    records = []
+    for provider, description in (
+            ("Valvoline", "Synthetic oil change"),
+            ("Dealer", "Replaced front brake pads"),
+            ("Self", "Topped up synthetic brake fluid")
+    ):
+        maintenance_create = MaintenanceCreate(
+            maintenance_provider=provider,
+            maintenance_type="Service",
+            description=description,
+            mileage=35000,
+            cost=50.0,
+            vehicle_id=vehicle_id
+        )
+        records.append(
+            maintenance.crud_create_maintenance_record(
+                db=db,
+                current_user=current_user,
+                maintenance_create=maintenance_create
+            )
+        )
+
+    return records
+
+
+def search_ids(db, current_user, search: str, **kwargs) -> set:
+    result = maintenance.crud_search_maintenance_records(db=db, current_user=current_user, search=search, **kwargs)
+    return {record.id for record in result["maintenance"]}
+
+
+def test_search_maintenance_records(db):
+    created_user = get_new_user(db=db, user_id=1)
+    other_user = get_new_user(db=db, user_id=2)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    other_vehicle = get_registered_car(db=db, current_user=other_user, vehicle_number=2)
+    oil, pads, fluid = create_searchable_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id)
+    create_searchable_records(db=db, current_user=other_user, vehicle_id=other_vehicle.id)
+
+    assert search_ids(db, created_user, "synth") == {oil.id, fluid.id}
+    assert search_ids(db, created_user, "synthetic BRAKE") == {fluid.id}
+    assert search_ids(db, created_user, "valvo") == {oil.id}
+    assert search_ids(db, created_user, "brake", vehicle_id=other_vehicle.id) == set()
+    # FTS5 syntax in the input is read as plain words
+    assert search_ids(db, created_user, '"brake') == {pads.id, fluid.id}
+    assert search_ids(db, created_user, "brake NOT pads") == set()
+
+    first_page = maintenance.crud_search_maintenance_records(db=db, current_user=created_user, search="brake", limit=1)
+    second_page = maintenance.crud_search_maintenance_records(
+        db=db,
+        current_user=created_user,
+        search="brake",
+        limit=1,
+        offset=first_page["next_offset"]
+    )
+
+    assert first_page["next_offset"] == 1
+    assert second_page["next_offset"] is None
+    assert {first_page["maintenance"][0].id, second_page["maintenance"][0].id} == {pads.id, fluid.id}
+
+
+def test_search_maintenance_records_follows_writes(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    oil, pads, fluid = create_searchable_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id)
+
+    maintenance.crud_update_maintenance_record(
+        db=db,
+        current_user=created_user,
+        maintenance_record_id=oil.id,
+        update_data=MaintenanceUpdate(description="Rotated all tires")
+    )
+    maintenance.crud_delete_maintenance_record(db=db, current_user=created_user, maintenance_record_id=pads.id)
+
+    assert search_ids(db, created_user, "synthetic") == {fluid.id}
+    assert search_ids(db, created_user, "tires") == {oil.id}
+    assert search_ids(db, created_user, "pads") == set()
+
+    vehicles.crud_delete_vehicle(db=db, current_user=created_user, vehicle_id=new_vehicle.id)
+
+    assert search_ids(db, created_user, "tires") == set()
+
+    if db.get_bind().dialect.name == "sqlite":
+        # Raises if the index holds anything that doesn't match maintenance_records
+        db.execute(text(f"INSERT INTO {MAINTENANCE_SEARCH_TABLE}({MAINTENANCE_SEARCH_TABLE}, rank) "
+                        "VALUES ('integrity-check', 1)"))
+
+
+def test_search_maintenance_records_no_words(db):
+    created_user = get_new_user(db=db, user_id=1)
+
+    with pytest.raises(HTTPException) as exc_info:
+        maintenance.crud_search_maintenance_records(db=db, current_user=created_user, search=" *: ")
+
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "Search must contain at least one word."
+
+
+@pytest.mark.skipif(not SQLALCHEMY_DATABASE_URL.startswith("sqlite"), reason="FTS5 index is SQLite only")
+def test_ensure_maintenance_search_index_indexes_existing_records(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+
+    # A database from before the index existed
+    connection = db.connection()
+    for trigger in ("insert", "delete", "update"):
+        connection.exec_driver_sql(f"DROP TRIGGER maintenance_records_fts_{trigger}")
+    connection.exec_driver_sql(f"DROP TABLE {MAINTENANCE_SEARCH_TABLE}")
+    oil, pads, fluid = create_searchable_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id)
+
+    assert ensure_maintenance_search_index(db.connection()) is True
+    assert ensure_maintenance_search_index(db.connection()) is False
+    assert search_ids(db, created_user, "synthetic") == {oil.id, fluid.id}
+
+
+def test_fetch_all_vehicle_maintenance_records_filtered_ranges(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    records = create_maintenance_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id, count=4)
+    for i, record in enumerate(records):
+        record.cost = 50 + i * 25
+        record.serviced_at = datetime(2024, 4, 10 + i, 10)
+    db.commit()
+
+    def filtered_ids(**ranges) -> list:
+        response = maintenance.crud_fetch_all_vehicle_maintenance_records_filtered(
+            db=db,
+            current_user=created_user,
+            vehicle_id=None,
+            maintenance_provider=None,
+            maintenance_type=None,
+            description=None,
+            mileage=None,
+            cost=None,
+            serviced_at=None,
+            **ranges
+        )
+        return [record.id for record in response["maintenance"]]
+
+    assert filtered_ids(cost_min=75, cost_max=100) == [records[1].id, records[2].id]
+    assert filtered_ids(mileage_min=35002) == [records[2].id, records[3].id]
+    assert filtered_ids(mileage_max=35000) == [records[0].id]
+    assert filtered_ids(serviced_at_after=datetime(2024, 4, 11, 10)) == [record.id for record in records[1:]]
+    assert filtered_ids(serviced_at_before=datetime(2024, 4, 11, 10)) == [records[0].id, records[1].id]
+    assert filtered_ids(serviced_at_after=datetime(2024, 4, 12), serviced_at_before=datetime(2024, 4, 11)) == []
+
+
+def explain_filtered_query(db, current_user, **ranges) -> str:
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        maintenance.crud_fetch_all_vehicle_maintenance_records_filtered(
+            db=db,
+            current_user=current_user,
+            vehicle_id=None,
+            maintenance_provider=None,
+            maintenance_type=None,
+            description=None,
+            mileage=None,
+            cost=None,
+            serviced_at=None,
+            **ranges
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    statement, parameters = next((s, p) for s, p in statements if "FROM maintenance_records" in s)
+    plan = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return "\n".join(row[-1] for row in plan)
+
+
+@pytest.mark.skipif(not SQLALCHEMY_DATABASE_URL.startswith("sqlite"), reason="Query plans are SQLite specific")
+@pytest.mark.parametrize(
+    "ranges, index",
+    [
+        ({"cost_min": 50, "cost_max": 100}, "ix_maintenance_records_user_id_cost"),
+        ({"mileage_min": 35000}, "ix_maintenance_records_user_id_mileage"),
+        ({"serviced_at_after": datetime(2024, 1, 1)}, "ix_maintenance_records_user_id_serviced_at"),
+    ]
+)
+def test_fetch_all_vehicle_maintenance_records_filtered_ranges_use_index(db, ranges, index):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    create_maintenance_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id, count=3)
+
+    plan = explain_filtered_query(db=db, current_user=created_user, **ranges)
+
+    assert f"USING INDEX {index} (user_id=? AND" in plan
+
+
+def test_maintenance_record_user_id_follows_vehicle(db):
+    created_user = get_new_user(db=db, user_id=1)
+    other_user = get_new_user(db=db, user_id=2)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    other_vehicle = get_registered_car(db=db, current_user=other_user, vehicle_number=2)
+    created = create_maintenance_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id, count=1)[0]
+
+    # Added without going through the crud functions
+    added = MaintenanceRecord(vehicle_id=new_vehicle.id, maintenance_type="Oil Change", mileage=35000, cost=10.0)
+    db.add(added)
+    db.commit()
+
+    assert created.user_id == created_user.id
+    assert added.user_id == created_user.id
+
+    added.vehicle_id = other_vehicle.id
+    db.commit()
+
+    assert added.user_id == other_user.id
+    page = maintenance.crud_fetch_all_vehicle_maintenance_records(db=db, current_user=created_user)
+    assert [record.id for record in page["maintenance"]] == [created.id]
+
+
+def test_ensure_owner_columns_backfills_existing_database():
+    old_engine = create_engine("sqlite://")
+    old_metadata = MetaData()
+    for table in (User.__table__, Vehicle.__table__):
+        table.to_metadata(old_metadata)
+    # The tables as they were before user_id
+    for table in (MaintenanceRecord.__table__, MaintenanceReminder.__table__):
+        Table(table.name, old_metadata, *(column._copy() for column in table.columns if column.name != "user_id"))
+    old_metadata.create_all(bind=old_engine)
+
+    with old_engine.begin() as connection:
+        connection.execute(insert(User.__table__).values(id=1, username="owner"))
+        connection.execute(insert(Vehicle.__table__).values(id=1, user_id=1, vin="OLDVIN"))
+        connection.execute(text("INSERT INTO maintenance_records (vehicle_id, maintenance_type) VALUES (1, 'Oil')"))
+        connection.execute(text("INSERT INTO maintenance_reminder (vehicle_id, maintenance_type) VALUES (1, 'Oil')"))
+
+        assert ensure_owner_columns(connection) == 2
+        assert ensure_owner_columns(connection) == 0
+
+        owners = connection.execute(text(
+            "SELECT user_id FROM maintenance_records UNION ALL SELECT user_id FROM maintenance_reminder"
+        )).scalars().all()
+        updated_at = connection.execute(text(
+            "SELECT updated_at FROM maintenance_records UNION ALL SELECT updated_at FROM maintenance_reminder"
+        )).scalars().all()
+        indexes = {index["name"] for index in inspect(connection).get_indexes("maintenance_records")}
+
+    assert owners == [1, 1]
+    assert updated_at == [None, None]
+    assert "ix_maintenance_records_user_id_created_at_id" in indexes
+    old_engine.dispose()
+
+
+@pytest.mark.skipif(not SQLALCHEMY_DATABASE_URL.startswith("sqlite"), reason="Query plans are SQLite specific")
+def test_fetch_all_vehicle_maintenance_records_reads_user_index(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    create_maintenance_records(db=db, current_user=created_user, vehicle_id=new_vehicle.id, count=3)
+
+    query = maintenance.base_maintenance_records_query(db=db, current_user=created_user)
+    query = query.order_by(None).order_by(MaintenanceRecord.created_at, MaintenanceRecord.id).limit(51)
+    statement = query.statement.compile(engine, compile_kwargs={"literal_binds": True})
+    plan = "\n".join(row[-1] for row in db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}"))
+
+    assert "USING INDEX ix_maintenance_records_user_id_created_at_id (user_id=?)" in plan
+    assert "TEMP B-TREE" not in plan
+    assert "vehicles_1" in plan and "SEARCH vehicles " not in plan
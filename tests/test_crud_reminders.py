@@ -1,18 +1,26 @@
+import os
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, Table, create_engine, event, insert, inspect, text
 from sqlalchemy.orm import sessionmaker
 from fastapi import HTTPException
-
-from app.models import Base, MaintenanceReminder
-from app.crud import reminder
-from app.schemas.reminder import MaintenanceReminderCreate, MaintenanceReminderUpdate
+from datetime import datetime, timedelta
+
+from app.database import get_engine_options
+from app.models import Base, User, Vehicle, MaintenanceReminder, REMINDER_SCHEDULE_COLUMNS
+from app.models import ensure_reminder_schedule_columns
+from app.crud import reminder, vehicles, maintenance
+from app.schemas.reminder import MaintenanceReminderCreate, MaintenanceReminderUpdate, MaintenanceReminderResponse
+from app.schemas.vehicles import VehicleSummary, VehicleUpdate
+from app.schemas.maintenance import MaintenanceCreate
+from app.utils.fields import parse_fields
 from test_crud_vehicles import get_new_user
 from test_crud_maintenance import get_registered_car
 
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Point TEST_DATABASE_URL at a scratch PostgreSQL database to run the suite against that backend
+SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite:///:memory:")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **get_engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -181,6 +189,58 @@ def test_fetch_all_maintenance_reminders(db):
         assert getattr(all_response["reminders"][0], field) == value
 
 
+def test_fetch_all_maintenance_reminders_paginated(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+
+    created = []
+    for interval_miles in (3000, 5000, 8000):
+        reminder_create = MaintenanceReminderCreate(
+            maintenance_type="Tire Rotation",
+            interval_miles=interval_miles,
+            last_serviced_mileage=new_vehicle.mileage,
+            vehicle_id=new_vehicle.id
+        )
+        created.append(
+            reminder.crud_create_maintenance_reminder(
+                db=db,
+                current_user=created_user,
+                maintenance_reminder=reminder_create
+            )
+        )
+
+    first_page = reminder.crud_fetch_all_maintenance_reminders(db=db, current_user=created_user, limit=2)
+    second_page = reminder.crud_fetch_all_maintenance_reminders(
+        db=db,
+        current_user=created_user,
+        limit=2,
+        cursor=first_page["next_cursor"]
+    )
+
+    assert [r.id for r in first_page["reminders"]] == [created[0].id, created[1].id]
+    assert [r.id for r in second_page["reminders"]] == [created[2].id]
+    assert second_page["next_cursor"] is None
+
+
+def test_fetch_all_maintenance_reminders_sparse_fields(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    reminder_create = MaintenanceReminderCreate(
+        maintenance_type="Tire Rotation",
+        interval_miles=5000,
+        last_serviced_mileage=new_vehicle.mileage,
+        vehicle_id=new_vehicle.id
+    )
+    reminder.crud_create_maintenance_reminder(db=db, current_user=created_user, maintenance_reminder=reminder_create)
+    db.expire_all()
+
+    selection = parse_fields("maintenance_type", MaintenanceReminderResponse, "vehicle", VehicleSummary)
+    page = reminder.crud_fetch_all_maintenance_reminders(db=db, current_user=created_user, fields=selection)
+
+    assert page["reminders"][0].maintenance_type == "Tire Rotation"
+    assert {"details", "interval_miles", "vehicle"} <= inspect(page["reminders"][0]).unloaded
+
+
 def test_fetch_all_maintenance_reminders_filtered(db):
     created_user = get_new_user(db=db, user_id=1)
     new_vehicle = get_registered_car(db=db, current_user=created_user)
@@ -732,3 +792,463 @@ def test_delete_maintenance_not_owned_by_user(db):
 
     assert exc_info.value.status_code == 403
     assert exc_info.value.detail == "You do not have permission to delete reminder for Vehicle ID 1."
+
+
+def test_create_maintenance_reminder_persists_schedule(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+
+    reminder_create = MaintenanceReminderCreate(
+        maintenance_type="Tire Rotation",
+        interval_miles=8000,
+        interval_months=12,
+        last_serviced_mileage=new_vehicle.mileage,
+        last_serviced_date="2025-01-01T00:00:00",
+        notify_before_miles=500,
+        notify_before_days=30,
+        estimated_miles_driven_per_month=1000,
+        vehicle_id=new_vehicle.id
+    )
+
+    new_reminder = reminder.crud_create_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder=reminder_create
+    )
+
+    assert new_reminder.next_due_date == datetime(2025, 1, 1) + timedelta(days=360)
+    assert new_reminder.notify_date == datetime(2025, 1, 1) + timedelta(days=330)
+    assert new_reminder.next_due_mileage == new_vehicle.mileage + 8000
+    assert new_reminder.notify_mileage == new_vehicle.mileage + 7500
+    # 7500 estimated miles at 1000 a month are reached after 225 days, before the time-based threshold
+    assert new_reminder.notify_at == datetime(2025, 1, 1) + timedelta(days=225)
+
+
+def test_update_maintenance_reminder_recomputes_schedule(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+
+    reminder_create = MaintenanceReminderCreate(
+        maintenance_type="Oil Change",
+        interval_months=6,
+        last_serviced_date="2025-01-01T00:00:00",
+        notify_before_days=10,
+        vehicle_id=new_vehicle.id
+    )
+
+    reminder.crud_create_maintenance_reminder(db=db, current_user=created_user, maintenance_reminder=reminder_create)
+
+    reminder.crud_update_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder_id=1,
+        update_data=MaintenanceReminderUpdate(interval_months=12, interval_miles=None)
+    )
+
+    updated_reminder = db.query(MaintenanceReminder).filter(MaintenanceReminder.id == 1).first()
+
+    assert updated_reminder.next_due_date == datetime(2025, 1, 1) + timedelta(days=360)
+    assert updated_reminder.notify_at == datetime(2025, 1, 1) + timedelta(days=350)
+    assert updated_reminder.next_due_mileage is None
+
+
+def test_backfill_reminder_schedules(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+
+    db.add(MaintenanceReminder(
+        vehicle_id=new_vehicle.id,
+        maintenance_type="Oil Change",
+        interval_miles=3000,
+        last_serviced_mileage=new_vehicle.mileage,
+        notify_before_miles=500,
+        estimated_miles_driven_per_month=0
+    ))
+    db.commit()
+
+    assert reminder.crud_backfill_reminder_schedules(db=db) == 1
+
+    backfilled = db.query(MaintenanceReminder).first()
+
+    assert backfilled.next_due_mileage == new_vehicle.mileage + 3000
+    assert backfilled.notify_mileage == new_vehicle.mileage + 2500
+    # without a driving estimate there is no date at which the mileage threshold is crossed
+    assert backfilled.notify_at is None
+
+
+def test_backfill_reminder_schedules_keeps_start_date(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+
+    # Without a service date the schedule starts from updated_at, or created_at before any update
+    db.add(MaintenanceReminder(
+        vehicle_id=new_vehicle.id, maintenance_type="Oil Change", interval_months=6, notify_before_days=14
+    ))
+    # Neither a month interval nor a complete mileage one, there is nothing to derive
+    db.add(MaintenanceReminder(vehicle_id=new_vehicle.id, maintenance_type="Brakes", interval_miles=3000))
+    db.commit()
+
+    assert reminder.crud_backfill_reminder_schedules(db=db) == 1
+
+    db.expire_all()
+    backfilled = db.query(MaintenanceReminder).filter(MaintenanceReminder.maintenance_type == "Oil Change").one()
+
+    assert backfilled.updated_at is None
+    assert backfilled.notify_at == backfilled.created_at.replace(tzinfo=None) + timedelta(days=166)
+    # Neither is selected again on the next start
+    assert reminder.crud_backfill_reminder_schedules(db=db) == 0
+
+
+def test_ensure_reminder_schedule_columns_upgrades_existing_database():
+    old_engine = create_engine("sqlite://")
+    old_metadata = MetaData()
+    for table in (User.__table__, Vehicle.__table__):
+        table.to_metadata(old_metadata)
+    # The reminders table as it was before the schedule was persisted
+    Table(
+        MaintenanceReminder.__tablename__, old_metadata,
+        *(column._copy() for column in MaintenanceReminder.__table__.columns
+          if column.name not in REMINDER_SCHEDULE_COLUMNS + ("last_notified_at",))
+    )
+    old_metadata.create_all(bind=old_engine)
+
+    with old_engine.begin() as connection:
+        connection.execute(insert(User.__table__).values(id=1, username="owner"))
+        connection.execute(insert(Vehicle.__table__).values(id=1, user_id=1, vin="OLDVIN", mileage=1000))
+        connection.execute(text(
+            "INSERT INTO maintenance_reminder (vehicle_id, user_id, maintenance_type, interval_months, "
+            "notify_before_days, is_active, created_at) VALUES (1, 1, 'Oil', 6, 14, 1, '2025-01-01 08:00:00')"
+        ))
+
+        ensure_reminder_schedule_columns(connection)
+        ensure_reminder_schedule_columns(connection)
+
+        columns = {column["name"] for column in inspect(connection).get_columns("maintenance_reminder")}
+        indexes = {index["name"] for index in inspect(connection).get_indexes("maintenance_reminder")}
+
+    assert set(REMINDER_SCHEDULE_COLUMNS) <= columns
+    assert "ix_maintenance_reminder_vehicle_id_is_active_notify_at" in indexes
+
+    # The startup backfill can now schedule the old rows
+    with sessionmaker(bind=old_engine)() as old_db:
+        assert reminder.crud_backfill_reminder_schedules(db=old_db) == 1
+        notify_at, updated_at = old_db.execute(text("SELECT notify_at, updated_at FROM maintenance_reminder")).one()
+
+    assert notify_at == "2025-06-16 08:00:00.000000"
+    assert updated_at is None
+    old_engine.dispose()
+
+
+def test_fetch_all_maintenance_reminders_filtered_ranges(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+
+    created = []
+    for i, last_serviced_mileage in enumerate((25000, 27000, 29000)):
+        reminder_create = MaintenanceReminderCreate(
+            maintenance_type="Tire Rotation",
+            interval_miles=5000,
+            last_serviced_mileage=last_serviced_mileage,
+            last_serviced_date=datetime(2024, 1, 1 + i),
+            vehicle_id=new_vehicle.id
+        )
+        created.append(
+            reminder.crud_create_maintenance_reminder(
+                db=db,
+                current_user=created_user,
+                maintenance_reminder=reminder_create
+            )
+        )
+
+    def filtered_ids(**ranges) -> list:
+        response = reminder.crud_fetch_all_maintenance_reminders_filtered(
+            db=db,
+            current_user=created_user,
+            **{
+                "vehicle_id": None, "maintenance_type": None, "details": None, "interval_miles": None,
+                "interval_months": None, "last_serviced_mileage": None, "last_serviced_date": None,
+                "notify_before_miles": None, "notify_before_days": None, "estimated_miles_driven_per_month": None,
+                "is_active": None, "vehicle_make": None, "vehicle_model": None, "vehicle_year": None,
+                "vehicle_vin": None, "vehicle_nickname": None, **ranges
+            }
+        )
+        return [r.id for r in response["reminders"]]
+
+    assert filtered_ids(last_serviced_mileage_min=27000) == [created[1].id, created[2].id]
+    assert filtered_ids(last_serviced_mileage_min=26000, last_serviced_mileage_max=28000) == [created[1].id]
+    assert filtered_ids(last_serviced_date_before=datetime(2024, 1, 2)) == [created[0].id, created[1].id]
+    assert filtered_ids(last_serviced_date_after=datetime(2024, 1, 3), last_serviced_mileage_max=27000) == []
+
+
+def explain_filtered_reminder_query(db, current_user, **ranges) -> str:
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        reminder.crud_fetch_all_maintenance_reminders_filtered(
+            db=db,
+            current_user=current_user,
+            **{
+                "vehicle_id": None, "maintenance_type": None, "details": None, "interval_miles": None,
+                "interval_months": None, "last_serviced_mileage": None, "last_serviced_date": None,
+                "notify_before_miles": None, "notify_before_days": None, "estimated_miles_driven_per_month": None,
+                "is_active": None, "vehicle_make": None, "vehicle_model": None, "vehicle_year": None,
+                "vehicle_vin": None, "vehicle_nickname": None, **ranges
+            }
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    statement, parameters = next((s, p) for s, p in statements if "FROM maintenance_reminder" in s)
+    plan = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return "\n".join(row[-1] for row in plan)
+
+
+@pytest.mark.skipif(not SQLALCHEMY_DATABASE_URL.startswith("sqlite"), reason="Query plans are SQLite specific")
+@pytest.mark.parametrize(
+    "ranges, index",
+    [
+        (
+            {"last_serviced_mileage_min": 26000, "last_serviced_mileage_max": 28000},
+            "ix_maintenance_reminder_user_id_last_serviced_mileage"
+        ),
+        ({"last_serviced_date_after": datetime(2024, 1, 2)}, "ix_maintenance_reminder_user_id_last_serviced_date"),
+    ]
+)
+def test_fetch_all_maintenance_reminders_filtered_ranges_use_index(db, ranges, index):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    for i in range(3):
+        reminder.crud_create_maintenance_reminder(
+            db=db,
+            current_user=created_user,
+            maintenance_reminder=MaintenanceReminderCreate(
+                maintenance_type="Tire Rotation",
+                interval_miles=5000,
+                last_serviced_mileage=25000 + i * 1000,
+                last_serviced_date=datetime(2024, 1, 1 + i),
+                vehicle_id=new_vehicle.id
+            )
+        )
+
+    plan = explain_filtered_reminder_query(db=db, current_user=created_user, **ranges)
+
+    assert f"USING INDEX {index} (user_id=? AND" in plan
+
+
+def test_create_maintenance_reminder_sets_owner(db):
+    created_user = get_new_user(db=db, user_id=1)
+    other_user = get_new_user(db=db, user_id=2)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    reminder_create = MaintenanceReminderCreate(
+        maintenance_type="Tire Rotation",
+        interval_miles=5000,
+        last_serviced_mileage=new_vehicle.mileage,
+        vehicle_id=new_vehicle.id
+    )
+
+    created = reminder.crud_create_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder=reminder_create
+    )
+
+    assert created.user_id == created_user.id
+    assert reminder.crud_fetch_all_maintenance_reminders(db=db, current_user=other_user)["reminders"] == []
+
+
+def create_due_reminders(db, current_user, vehicle) -> list:
+    now = datetime.utcnow()
+    schedules = (
+        # interval_months, days since last service: notify_at 76 days ago, in 16 days and in 351 days
+        (3, 200),
+        (6, 150),
+        (12, 0)
+    )
+    created = [
+        reminder.crud_create_maintenance_reminder(
+            db=db,
+            current_user=current_user,
+            maintenance_reminder=MaintenanceReminderCreate(
+                maintenance_type="Oil Change",
+                interval_months=interval_months,
+                last_serviced_date=now - timedelta(days=days_ago),
+                vehicle_id=vehicle.id
+            )
+        )
+        for interval_months, days_ago in schedules
+    ]
+
+    # No monthly estimate to project the mileage with, so no notify_at either
+    reminder.crud_create_maintenance_reminder(
+        db=db,
+        current_user=current_user,
+        maintenance_reminder=MaintenanceReminderCreate(
+            maintenance_type="Tire Rotation",
+            interval_miles=5000,
+            last_serviced_mileage=vehicle.mileage,
+            estimated_miles_driven_per_month=0,
+            vehicle_id=vehicle.id
+        )
+    )
+
+    return created
+
+
+def test_fetch_due_maintenance_reminders(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    overdue, soon, later = create_due_reminders(db=db, current_user=created_user, vehicle=new_vehicle)
+
+    def due_ids(**kwargs) -> list:
+        response = reminder.crud_fetch_due_maintenance_reminders(db=db, current_user=created_user, **kwargs)
+        return [row["id"] for row in response["reminders"]]
+
+    assert due_ids() == [overdue.id, soon.id, later.id]
+    assert due_ids(due_status="overdue") == [overdue.id]
+    assert due_ids(due_status="upcoming") == [soon.id, later.id]
+    assert due_ids(due_status="upcoming", within_days=30) == [soon.id]
+    assert due_ids(vehicle_id=new_vehicle.id + 1) == []
+
+    rows = reminder.crud_fetch_due_maintenance_reminders(db=db, current_user=created_user)["reminders"]
+    assert [row["status"] for row in rows] == ["overdue", "upcoming", "upcoming"]
+    assert [row["days_remaining"] for row in rows] == [-111, 29, 359]
+    assert rows[0]["next_due_date"] == overdue.next_due_date
+    assert rows[0]["vehicle"].id == new_vehicle.id
+    assert rows[0]["miles_remaining"] is None
+
+
+def test_fetch_due_maintenance_reminders_mileage_and_pages(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    overdue, soon, later = create_due_reminders(db=db, current_user=created_user, vehicle=new_vehicle)
+
+    first = reminder.crud_fetch_due_maintenance_reminders(db=db, current_user=created_user, limit=2)
+    second = reminder.crud_fetch_due_maintenance_reminders(
+        db=db, current_user=created_user, limit=2, cursor=first["next_cursor"]
+    )
+
+    assert [row["id"] for row in first["reminders"] + second["reminders"]] == [overdue.id, soon.id, later.id]
+    assert second["next_cursor"] is None
+
+    # 60 days at 1000 miles a month puts 2000 of the 5000 mile interval behind it
+    mileage_reminder = reminder.crud_create_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder=MaintenanceReminderCreate(
+            maintenance_type="Brakes",
+            interval_miles=5000,
+            last_serviced_mileage=new_vehicle.mileage,
+            last_serviced_date=datetime.utcnow() - timedelta(days=60, hours=1),
+            estimated_miles_driven_per_month=1000,
+            vehicle_id=new_vehicle.id
+        )
+    )
+    rows = reminder.crud_fetch_due_maintenance_reminders(db=db, current_user=created_user, due_status="upcoming")
+    row = next(row for row in rows["reminders"] if row["id"] == mileage_reminder.id)
+
+    assert row["next_due_mileage"] == new_vehicle.mileage + 5000
+    assert row["estimated_mileage"] == new_vehicle.mileage + 2000
+    assert row["miles_remaining"] == 3000
+    assert row["days_remaining"] is None
+
+
+def test_fetch_due_maintenance_reminders_active_and_odometer(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    overdue, soon, later = create_due_reminders(db=db, current_user=created_user, vehicle=new_vehicle)
+
+    def due_rows(**kwargs) -> list:
+        return reminder.crud_fetch_due_maintenance_reminders(db=db, current_user=created_user, **kwargs)["reminders"]
+
+    reminder.crud_update_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder_id=overdue.id,
+        update_data=MaintenanceReminderUpdate(is_active=False)
+    )
+    assert [row["id"] for row in due_rows()] == [soon.id, later.id]
+
+    mileage_reminder = reminder.crud_create_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder=MaintenanceReminderCreate(
+            maintenance_type="Brakes",
+            interval_miles=5000,
+            last_serviced_mileage=new_vehicle.mileage,
+            last_serviced_date=datetime.utcnow(),
+            vehicle_id=new_vehicle.id
+        )
+    )
+    assert mileage_reminder.id in [row["id"] for row in due_rows(due_status="upcoming")]
+
+    # The odometer is 15000 miles past the due mileage long before the estimate gets there
+    vehicles.crud_update_vehicle(
+        db=db, current_user=created_user, vehicle_id=new_vehicle.id,
+        update_data=VehicleUpdate(mileage=mileage_reminder.next_due_mileage + 15000)
+    )
+
+    row = next(row for row in due_rows(due_status="overdue") if row["id"] == mileage_reminder.id)
+    assert row["status"] == "overdue"
+    assert row["miles_remaining"] == -15000
+    assert mileage_reminder.id not in [row["id"] for row in due_rows(due_status="upcoming")]
+
+
+def test_fetch_due_maintenance_reminders_invalid_status(db):
+    created_user = get_new_user(db=db, user_id=1)
+
+    with pytest.raises(HTTPException) as exc_info:
+        reminder.crud_fetch_due_maintenance_reminders(db=db, current_user=created_user, due_status="late")
+
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "status must be one of: overdue, upcoming, all."
+
+
+def test_odometer_refresh_keeps_updated_at_and_due_date(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+
+    # Without a service date the time-based schedule starts from updated_at, or created_at before any edit
+    created = reminder.crud_create_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder=MaintenanceReminderCreate(
+            maintenance_type="Oil Change",
+            interval_months=6,
+            interval_miles=5000,
+            last_serviced_mileage=new_vehicle.mileage,
+            estimated_miles_driven_per_month=0,
+            vehicle_id=new_vehicle.id
+        )
+    )
+    next_due_date = created.next_due_date
+    assert created.updated_at is None
+
+    # A record past notify_mileage makes it due, a later odometer reading leaves it due
+    maintenance.crud_create_maintenance_record(
+        db=db,
+        current_user=created_user,
+        maintenance_create=MaintenanceCreate(
+            maintenance_provider="Valvoline",
+            maintenance_type="Oil Change",
+            mileage=created.notify_mileage + 100,
+            cost=89.65,
+            vehicle_id=new_vehicle.id
+        )
+    )
+    db.refresh(created)
+    notify_at = created.notify_at
+    assert notify_at <= datetime.utcnow()
+
+    vehicles.crud_update_vehicle(
+        db=db, current_user=created_user, vehicle_id=new_vehicle.id,
+        update_data=VehicleUpdate(mileage=created.notify_mileage + 2000)
+    )
+    db.refresh(created)
+
+    assert created.updated_at is None
+    assert created.next_due_date == next_due_date
+    assert created.notify_at == notify_at
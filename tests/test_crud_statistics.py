@@ -1,18 +1,22 @@
+import os
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from app.models import Base
-from app.crud import reminder, maintenance, statistics
+from app.database import get_engine_options
+from app.models import Base, MaintenanceReminder, UserStats
+from app.crud import reminder, maintenance, statistics, vehicles, user_stats
 from app.schemas.reminder import MaintenanceReminderCreate, MaintenanceReminderUpdate
-from app.schemas.maintenance import MaintenanceCreate
+from app.schemas.maintenance import MaintenanceCreate, MaintenanceUpdate
+from app.schemas.vehicles import VehicleCreate, VehicleUpdate
 from test_crud_vehicles import get_new_user
 from test_crud_maintenance import get_registered_car
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Point TEST_DATABASE_URL at a scratch PostgreSQL database to run the suite against that backend
+SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite:///:memory:")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **get_engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -317,3 +321,253 @@ def test_crud_fetch_user_statistics_with_estimated_miles_driven_higher_than_noti
     assert stats.most_maintained_vehicle == vehicle_one.nickname
     assert date_generated <= datetime.utcnow()
     assert statistics_response["message"] == "User maintenance stats fetched successfully."
+
+
+def test_crud_fetch_user_statistics_no_maintenance_records(db):
+    created_user = get_new_user(db=db, user_id=1)
+    get_registered_car(db=db, current_user=created_user, vehicle_number=1)
+
+    statistics_response = statistics.crud_fetch_user_maintenance_statistics(db=db, current_user=created_user)
+
+    stats = statistics_response["stats"]
+
+    assert stats.total_amount_of_vehicles == 1
+    assert stats.total_maintenance_records == 0
+    assert stats.total_maintenance_cost == 0.0
+    assert stats.total_maintenance_reminders == 0
+    assert stats.highest_cost_maintenance_record == 0.0
+    assert stats.most_maintained_vehicle is None
+
+
+def test_crud_fetch_user_statistics_most_maintained_vehicle_by_record_count(db):
+    created_user = get_new_user(db=db, user_id=1)
+    vehicle_one = get_registered_car(db=db, current_user=created_user, vehicle_number=1)
+    vehicle_two = get_registered_car(db=db, current_user=created_user, vehicle_number=2)
+
+    for vehicle_id, cost in ((vehicle_one.id, 50.0), (vehicle_two.id, 20.0), (vehicle_two.id, 30.0)):
+        maintenance.crud_create_maintenance_record(
+            db=db,
+            current_user=created_user,
+            maintenance_create=MaintenanceCreate(
+                maintenance_provider="Valvoline",
+                maintenance_type="Oil Change",
+                mileage=25000,
+                cost=cost,
+                vehicle_id=vehicle_id
+            )
+        )
+
+    # records belonging to another user must not leak into the aggregates
+    other_user = get_new_user(db=db, user_id=2)
+    other_vehicle = vehicles.crud_register_new_vehicle(
+        db=db,
+        current_user=other_user,
+        vehicle_create=VehicleCreate(
+            vehicle_type="Sedan",
+            make="Honda",
+            model="Civic",
+            color="Red",
+            year=2018,
+            mileage=1000,
+            vin="zzzz853dasdf51g",
+            license_plate="ABC555",
+            registration_state="OH",
+            fuel_type="Gasoline",
+            transmission_type="Automatic",
+            is_active=True,
+            nickname="Other"
+        )
+    )
+    maintenance.crud_create_maintenance_record(
+        db=db,
+        current_user=other_user,
+        maintenance_create=MaintenanceCreate(
+            maintenance_type="Brakes",
+            mileage=1000,
+            cost=999.0,
+            vehicle_id=other_vehicle.id
+        )
+    )
+
+    stats = statistics.crud_fetch_user_maintenance_statistics(db=db, current_user=created_user)["stats"]
+
+    assert stats.total_amount_of_vehicles == 2
+    assert stats.total_maintenance_records == 3
+    assert stats.total_maintenance_cost == 100.0
+    assert stats.highest_cost_maintenance_record == 50.0
+    assert stats.most_maintained_vehicle == vehicle_two.nickname
+
+
+def test_crud_fetch_user_statistics_version(db):
+    created_user = get_new_user(db=db, user_id=1)
+    empty_version = statistics.crud_fetch_user_statistics_version(db=db, current_user=created_user)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+
+    created_reminder = reminder.crud_create_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder=MaintenanceReminderCreate(
+            maintenance_type="Oil Change",
+            interval_months=6,
+            last_serviced_date=datetime.utcnow(),
+            vehicle_id=new_vehicle.id
+        )
+    )
+    version = statistics.crud_fetch_user_statistics_version(db=db, current_user=created_user)
+
+    assert version != empty_version
+    assert version == statistics.crud_fetch_user_statistics_version(db=db, current_user=created_user)
+
+    # No write happens when a reminder turns overdue, the version still moves once notify_at is behind us
+    db.query(MaintenanceReminder).filter(MaintenanceReminder.id == created_reminder.id).update(
+        {MaintenanceReminder.notify_at: datetime.utcnow() - timedelta(minutes=1)}
+    )
+    db.commit()
+
+    assert statistics.crud_fetch_user_statistics_version(db=db, current_user=created_user) != version
+
+
+def test_user_stats_follow_every_write(db):
+    created_user = get_new_user(db=db, user_id=1)
+    vehicle_one = get_registered_car(db=db, current_user=created_user, vehicle_number=1)
+    vehicle_two = get_registered_car(db=db, current_user=created_user, vehicle_number=2)
+
+    created_records = [
+        maintenance.crud_create_maintenance_record(
+            db=db,
+            current_user=created_user,
+            maintenance_create=MaintenanceCreate(maintenance_type="Oil Change", mileage=25000, cost=cost,
+                                                 vehicle_id=vehicle_id)
+        )
+        for vehicle_id, cost in ((vehicle_one.id, 300.0), (vehicle_two.id, 40.0), (vehicle_two.id, 25.0))
+    ]
+    created_reminder = reminder.crud_create_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder=MaintenanceReminderCreate(maintenance_type="Oil Change", interval_miles=5000,
+                                                       last_serviced_mileage=25000, vehicle_id=vehicle_one.id)
+    )
+
+    # The most expensive record gets cheaper, then goes away
+    maintenance.crud_update_maintenance_record(
+        db=db,
+        current_user=created_user,
+        maintenance_record_id=created_records[0].id,
+        update_data=MaintenanceUpdate(cost=120.0)
+    )
+    maintenance.crud_delete_maintenance_record(
+        db=db, current_user=created_user, maintenance_record_id=created_records[0].id
+    )
+    stats = statistics.crud_fetch_user_maintenance_statistics(db=db, current_user=created_user)["stats"]
+
+    assert stats.total_amount_of_vehicles == 2
+    assert stats.total_maintenance_records == 2
+    assert stats.total_maintenance_cost == 65.0
+    assert stats.highest_cost_maintenance_record == 40.0
+    assert stats.total_maintenance_reminders == 1
+    assert stats.most_maintained_vehicle == vehicle_two.nickname
+
+    reminder.crud_delete_maintenance_reminder(
+        db=db, current_user=created_user, maintenance_reminder_id=created_reminder.id
+    )
+    vehicles.crud_delete_vehicle(db=db, current_user=created_user, vehicle_id=vehicle_two.id)
+    stats = statistics.crud_fetch_user_maintenance_statistics(db=db, current_user=created_user)["stats"]
+
+    assert stats.total_amount_of_vehicles == 1
+    assert stats.total_maintenance_records == 0
+    assert stats.total_maintenance_cost == 0.0
+    assert stats.highest_cost_maintenance_record == 0.0
+    assert stats.total_maintenance_reminders == 0
+    assert stats.most_maintained_vehicle is None
+    assert user_stats.crud_rebuild_user_stats(db=db, write=False)["mismatched"] == []
+
+
+def test_rebuild_user_stats_repairs_stale_totals(db):
+    created_user = get_new_user(db=db, user_id=1)
+    untouched_user = get_new_user(db=db, user_id=2)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    maintenance.crud_create_maintenance_record(
+        db=db,
+        current_user=created_user,
+        maintenance_create=MaintenanceCreate(maintenance_type="Oil Change", mileage=25000, cost=75.5,
+                                             vehicle_id=new_vehicle.id)
+    )
+
+    db.query(UserStats).filter(UserStats.user_id == created_user.id).update(
+        {UserStats.record_count: 7, UserStats.total_cost: 1.0}
+    )
+    db.commit()
+
+    assert user_stats.crud_rebuild_user_stats(db=db, write=False)["mismatched"] == [created_user.id]
+    assert user_stats.crud_rebuild_user_stats(db=db) == {"users": 2, "mismatched": [created_user.id]}
+    assert user_stats.crud_rebuild_user_stats(db=db, write=False)["mismatched"] == []
+
+    stats = statistics.crud_fetch_user_maintenance_statistics(db=db, current_user=created_user)["stats"]
+    assert stats.total_maintenance_records == 1
+    assert stats.total_maintenance_cost == 75.5
+
+    # The rebuild also wrote the row of the user who had none
+    assert db.query(UserStats).filter(UserStats.user_id == untouched_user.id).one().vehicle_count == 0
+
+
+def test_crud_fetch_user_statistics_matches_due_reminders(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    now = datetime.utcnow()
+
+    def create(**fields):
+        return reminder.crud_create_maintenance_reminder(
+            db=db,
+            current_user=created_user,
+            maintenance_reminder=MaintenanceReminderCreate(
+                maintenance_type="Oil Change", vehicle_id=new_vehicle.id, **fields
+            )
+        )
+
+    # Overdue, upcoming, and upcoming but switched off
+    create(interval_months=3, last_serviced_date=now - timedelta(days=200))
+    create(interval_months=12, last_serviced_date=now)
+    inactive = create(interval_months=12, last_serviced_date=now)
+    reminder.crud_update_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder_id=inactive.id,
+        update_data=MaintenanceReminderUpdate(is_active=False)
+    )
+    # Without a monthly estimate only the odometer makes these due, the first once it is driven 6000 miles below
+    create(interval_miles=5000, last_serviced_mileage=new_vehicle.mileage, estimated_miles_driven_per_month=0)
+    create(interval_miles=10000, last_serviced_mileage=new_vehicle.mileage, estimated_miles_driven_per_month=0)
+
+    # Saved before the schedule columns existed, one is changed again after the backfill
+    legacy = [
+        MaintenanceReminder(
+            vehicle_id=new_vehicle.id, user_id=created_user.id, maintenance_type="Brakes", interval_months=6,
+            is_active=True
+        )
+        for _ in range(2)
+    ]
+    db.add_all(legacy)
+    db.commit()
+    assert reminder.crud_backfill_reminder_schedules(db=db) == 2
+    reminder.crud_update_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder_id=legacy[1].id,
+        update_data=MaintenanceReminderUpdate(last_serviced_date=now - timedelta(days=365))
+    )
+    vehicles.crud_update_vehicle(
+        db=db, current_user=created_user, vehicle_id=new_vehicle.id,
+        update_data=VehicleUpdate(mileage=new_vehicle.mileage + 6000)
+    )
+
+    stats = statistics.crud_fetch_user_maintenance_statistics(db=db, current_user=created_user)["stats"]
+    due = {
+        due_status: reminder.crud_fetch_due_maintenance_reminders(
+            db=db, current_user=created_user, due_status=due_status
+        )["reminders"]
+        for due_status in ("overdue", "upcoming")
+    }
+
+    # The same split, except that statistics also count the inactive reminder
+    assert stats.overdue_reminder_count == len(due["overdue"]) == 3
+    assert stats.upcoming_reminder_count == len(due["upcoming"]) + 1 == 3
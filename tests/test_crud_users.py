@@ -1,17 +1,25 @@
+import os
+import json
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from fastapi import HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.routing import Match
+from passlib.context import CryptContext
 
+from app.database import get_engine_options
 from app.models import Base, User
 from app.crud import users
+from app.routes import users as user_routes
 from app.schemas.users import UserCreate, UserUpdate, UserLogin
-from app.utils.security import verify_password
+from app.utils import security
+from app.utils.security import verify_password, user_cache, snapshot_user
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Point TEST_DATABASE_URL at a scratch PostgreSQL database to run the suite against that backend
+SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite:///:memory:")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **get_engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -239,7 +247,7 @@ def test_fetch_all_users(db):
 
     users.crud_register_new_user(db=db, user=user_data)
 
-    all_users = users.crud_fetch_all_users(db=db)
+    all_users = users.crud_fetch_all_users(db=db)["users"]
 
     assert len(all_users) == 1
     assert type(all_users) == list
@@ -249,6 +257,60 @@ def test_fetch_all_users(db):
     assert all_users[0].id == 1
 
 
+def test_fetch_all_users_paginated(db):
+    for i in range(3):
+        users.crud_register_new_user(
+            db=db,
+            user=UserCreate(username=f"testuser{i}", email=f"testuser{i}@test.com", password="pass12345")
+        )
+
+    first_page = users.crud_fetch_all_users(db=db, limit=2)
+    second_page = users.crud_fetch_all_users(db=db, limit=2, after_id=first_page["next_after_id"])
+
+    assert [user.username for user in first_page["users"]] == ["testuser0", "testuser1"]
+    assert [user.username for user in second_page["users"]] == ["testuser2"]
+    assert second_page["next_after_id"] is None
+    assert first_page["total"] is None
+
+
+def test_fetch_all_users_include_total_is_cached(db):
+    users.crud_register_new_user(
+        db=db,
+        user=UserCreate(username="testuser", email="testuser1@test.com", password="pass12345")
+    )
+
+    assert users.crud_fetch_all_users(db=db, include_total=True)["total"] == 1
+
+    # Rows written behind the crud functions' back are only counted once the cached total expires
+    db.add(User(username="direct", email="direct@test.com", password_hash="x"))
+    db.commit()
+    assert users.crud_fetch_all_users(db=db, include_total=True)["total"] == 1
+
+    users.crud_register_new_user(
+        db=db,
+        user=UserCreate(username="testuser2", email="testuser2@test.com", password="pass12345")
+    )
+    assert users.crud_fetch_all_users(db=db, include_total=True)["total"] == 3
+
+    users.crud_delete_user(db=db, user_id=1)
+    assert users.crud_fetch_all_users(db=db, include_total=True)["total"] == 2
+
+
+def test_stream_all_users(db):
+    for i in range(3):
+        users.crud_register_new_user(
+            db=db,
+            user=UserCreate(username=f"testuser{i}", email=f"testuser{i}@test.com", password="pass12345")
+        )
+
+    lines = list(users.crud_stream_all_users(db=db, batch_size=2))
+
+    assert all(line.endswith("\n") for line in lines)
+    assert [json.loads(line) for line in lines] == [
+        {"id": i + 1, "username": f"testuser{i}", "email": f"testuser{i}@test.com"} for i in range(3)
+    ]
+
+
 def test_update_user(db):
     user_data = UserCreate(
         username="testuser",
@@ -449,3 +511,59 @@ def test_update_user_delete_user_does_not_exist(db):
 
     assert exc_info.value.status_code == 404
     assert exc_info.value.detail == f"User: 1 not found."
+
+
+def test_update_user_invalidates_cached_user(db):
+    user_data = UserCreate(username="testuser", email="testuser1@test.com", password="pass12345")
+    created_user = users.crud_register_new_user(db=db, user=user_data)
+    user_cache.set(created_user.id, snapshot_user(created_user))
+
+    users.crud_update_user(db=db, user_id=created_user.id, user_update=UserUpdate(email="changed@test.com"))
+
+    assert user_cache.get(created_user.id) is None
+
+
+def test_delete_user_invalidates_cached_user(db):
+    user_data = UserCreate(username="testuser", email="testuser1@test.com", password="pass12345")
+    created_user = users.crud_register_new_user(db=db, user=user_data)
+    user_cache.set(created_user.id, snapshot_user(created_user))
+
+    users.crud_delete_user(db=db, user_id=created_user.id)
+
+    assert user_cache.get(created_user.id) is None
+
+
+def test_login_rehashes_password_with_new_cost(db, monkeypatch):
+    monkeypatch.setattr(security, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=4))
+    user_data = UserCreate(username="testuser", email="testuser1@test.com", password="pass12345")
+    created_user = users.crud_register_new_user(db=db, user=user_data)
+    assert created_user.password_hash.startswith("$2b$04$")
+
+    monkeypatch.setattr(security, "pwd_context", CryptContext(schemes=["bcrypt"], bcrypt__rounds=5))
+    authenticated_user = users.crud_authenticate_user(db=db, username="testuser", password="pass12345")
+
+    assert authenticated_user.password_hash.startswith("$2b$05$")
+    assert verify_password("pass12345", authenticated_user.password_hash)
+
+
+def test_login_keeps_hash_with_same_cost(db):
+    user_data = UserCreate(username="testuser", email="testuser1@test.com", password="pass12345")
+    created_user = users.crud_register_new_user(db=db, user=user_data)
+    original_hash = created_user.password_hash
+
+    authenticated_user = users.crud_authenticate_user(db=db, username="testuser", password="pass12345")
+
+    assert authenticated_user.password_hash == original_hash
+
+
+def get_route_endpoint(path: str):
+    scope = {"type": "http", "method": "GET", "path": path, "root_path": ""}
+    for route in user_routes.router.routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route.endpoint
+
+
+def test_user_named_export_is_not_shadowed_by_the_export():
+    assert get_route_endpoint("/users/export/") is user_routes.fetch_user_by_username
+    assert get_route_endpoint("/exports/users/") is user_routes.export_all_users
+
@@ -1,17 +1,23 @@
+import os
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, Table, create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 from fastapi import HTTPException
 
-from app.models import Base
+from app.database import get_engine_options
+from app.models import Base, Vehicle, MaintenanceRecord, MaintenanceReminder, INDEXED_TABLES, ensure_query_indexes
 from app.crud import users, vehicles
+from app.crud.versions import crud_fetch_user_data_version
 from app.schemas.users import UserCreate
-from app.schemas.vehicles import VehicleCreate, VehicleUpdate
+from app.schemas.vehicles import VehicleCreate, VehicleUpdate, VehicleResponse
+from app.utils import pagination
+from app.utils.fields import parse_fields
 
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Point TEST_DATABASE_URL at a scratch PostgreSQL database to run the suite against that backend
+SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite:///:memory:")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **get_engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
@@ -256,6 +262,111 @@ def test_filter_user_vehicles_no_filters_passed(db):
     assert exc_info.value.detail == "At least one filter parameter must be provided."
 
 
+def register_vehicles(db, current_user, count: int) -> list:
+    registered = []
+    for i in range(count):
+        vehicle_data = VehicleCreate(
+            vehicle_type="Sedan",
+            make="Toyota",
+            model="Corolla",
+            color="Blue",
+            year=2020,
+            mileage=25000,
+            vin=f"asdf853dasdf5{i:02d}",
+            license_plate=f"XYZ12{i}",
+            registration_state="OH",
+            fuel_type="Gasoline",
+            transmission_type="Automatic",
+            is_active=True,
+            nickname=f"DailyDriver{i}"
+        )
+        registered.append(
+            vehicles.crud_register_new_vehicle(db=db, current_user=current_user, vehicle_create=vehicle_data)
+        )
+
+    return registered
+
+
+def test_fetch_user_vehicles_paginated(db):
+    created_user = get_new_user(db=db, user_id=1)
+    registered = register_vehicles(db=db, current_user=created_user, count=3)
+
+    first_page = vehicles.crud_fetch_user_vehicles(db=db, current_user=created_user, limit=2)
+    second_page = vehicles.crud_fetch_user_vehicles(
+        db=db,
+        current_user=created_user,
+        limit=2,
+        cursor=first_page["next_cursor"]
+    )
+
+    assert [vehicle.id for vehicle in first_page["vehicles"]] == [registered[0].id, registered[1].id]
+    assert [vehicle.id for vehicle in second_page["vehicles"]] == [registered[2].id]
+    assert second_page["next_cursor"] is None
+
+
+def test_fetch_user_vehicles_page_size_capped(db, monkeypatch):
+    monkeypatch.setattr(pagination, "MAX_PAGE_SIZE", 2)
+    created_user = get_new_user(db=db, user_id=1)
+    register_vehicles(db=db, current_user=created_user, count=3)
+
+    page = vehicles.crud_fetch_user_vehicles(db=db, current_user=created_user, limit=100)
+
+    assert len(page["vehicles"]) == 2
+    assert page["next_cursor"] is not None
+
+
+def test_fetch_user_vehicles_sparse_fields(db):
+    created_user = get_new_user(db=db, user_id=1)
+    register_vehicles(db=db, current_user=created_user, count=2)
+    db.expire_all()
+
+    selection = parse_fields("nickname,mileage", VehicleResponse)
+    page = vehicles.crud_fetch_user_vehicles(db=db, current_user=created_user, fields=selection)
+
+    assert len(page["vehicles"]) == 2
+    for vehicle in page["vehicles"]:
+        assert {"vin", "make", "license_plate"} <= inspect(vehicle).unloaded
+        assert not {"id", "created_at", "nickname", "mileage"} & inspect(vehicle).unloaded
+
+
+def test_vehicle_writes_bump_user_data_version(db):
+    created_user = get_new_user(db=db, user_id=1)
+    other_user = get_new_user(db=db, user_id=2)
+    assert crud_fetch_user_data_version(db=db, user_id=created_user.id) == 0
+
+    registered = register_vehicles(db=db, current_user=created_user, count=1)
+    assert crud_fetch_user_data_version(db=db, user_id=created_user.id) == 1
+
+    vehicles.crud_update_vehicle(
+        db=db,
+        current_user=created_user,
+        vehicle_id=registered[0].id,
+        update_data=VehicleUpdate(color="Green")
+    )
+    assert crud_fetch_user_data_version(db=db, user_id=created_user.id) == 2
+
+    vehicles.crud_delete_vehicle(db=db, current_user=created_user, vehicle_id=registered[0].id)
+    assert crud_fetch_user_data_version(db=db, user_id=created_user.id) == 3
+    assert crud_fetch_user_data_version(db=db, user_id=other_user.id) == 0
+
+
+def test_filter_user_vehicles_paginated(db):
+    created_user = get_new_user(db=db, user_id=1)
+    registered = register_vehicles(db=db, current_user=created_user, count=3)
+
+    first_page = vehicles.crud_filter_user_vehicles(db=db, current_user=created_user, make="Toyota", limit=2)
+    second_page = vehicles.crud_filter_user_vehicles(
+        db=db,
+        current_user=created_user,
+        make="Toyota",
+        limit=2,
+        cursor=first_page["next_cursor"]
+    )
+
+    assert len(first_page["vehicles"]) == 2
+    assert [vehicle.id for vehicle in second_page["vehicles"]] == [registered[2].id]
+    assert second_page["next_cursor"] is None
+
 def test_update_vehicle(db):
     created_user = get_new_user(db=db, user_id=1)
 
@@ -405,3 +516,96 @@ def test_delete_vehicle_no_existing_vehicle_id(db):
 
     assert exc_info.value.status_code == 404
     assert exc_info.value.detail == f"Vehicle ID 1 not found or not owned by you."
+
+
+def filtered_vehicle_ids(db, current_user, **filters) -> list:
+    page = vehicles.crud_filter_user_vehicles(db=db, current_user=current_user, **filters)
+    return [vehicle.id for vehicle in page["vehicles"]]
+
+
+def test_filter_user_vehicles_prefix_match(db):
+    created_user = get_new_user(db=db, user_id=1)
+    registered = register_vehicles(db=db, current_user=created_user, count=3)
+    vehicles.crud_update_vehicle(
+        db=db,
+        current_user=created_user,
+        vehicle_id=registered[2].id,
+        update_data=VehicleUpdate(nickname="Big_Bertha")
+    )
+    all_ids = [vehicle.id for vehicle in registered]
+
+    assert filtered_vehicle_ids(db, created_user, make="toyo") == all_ids
+    assert filtered_vehicle_ids(db, created_user, vin="ASDF853DASDF501") == [registered[1].id]
+    assert filtered_vehicle_ids(db, created_user, make="yota") == []
+    assert filtered_vehicle_ids(db, created_user, nickname="dailydriver") == all_ids[:2]
+    # Wildcards in the value are matched literally
+    assert filtered_vehicle_ids(db, created_user, nickname="Big_") == [registered[2].id]
+    assert filtered_vehicle_ids(db, created_user, nickname="Daily_") == []
+    assert filtered_vehicle_ids(db, created_user, nickname="%") == []
+
+
+def test_filter_user_vehicles_substring_match(db):
+    created_user = get_new_user(db=db, user_id=1)
+    registered = register_vehicles(db=db, current_user=created_user, count=2)
+
+    assert filtered_vehicle_ids(db, created_user, make="yota", match="substring") == [v.id for v in registered]
+    assert filtered_vehicle_ids(db, created_user, nickname="driver1", match="substring") == [registered[1].id]
+
+
+def test_filter_user_vehicles_invalid_match(db):
+    created_user = get_new_user(db=db, user_id=1)
+
+    with pytest.raises(HTTPException) as exc_info:
+        vehicles.crud_filter_user_vehicles(db=db, current_user=created_user, make="Toyota", match="fuzzy")
+
+    assert exc_info.value.status_code == 400
+    assert exc_info.value.detail == "match must be one of: prefix, substring."
+
+
+@pytest.mark.skipif(not SQLALCHEMY_DATABASE_URL.startswith("sqlite"), reason="Query plans are SQLite specific")
+@pytest.mark.parametrize("column", ["make", "model", "color", "vin", "license_plate", "nickname"])
+def test_filter_user_vehicles_prefix_match_uses_index(db, column):
+    created_user = get_new_user(db=db, user_id=1)
+    register_vehicles(db=db, current_user=created_user, count=2)
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        vehicles.crud_filter_user_vehicles(db=db, current_user=created_user, **{column: "ab"})
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    statement, parameters = next((s, p) for s, p in statements if "FROM vehicles" in s)
+    plan = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+
+    assert f"USING INDEX ix_vehicles_user_id_lower_{column} (user_id=? AND <expr>>? AND <expr><?)" in plan[0][-1]
+
+
+@pytest.mark.skipif(not SQLALCHEMY_DATABASE_URL.startswith("sqlite"), reason="Query plans are SQLite specific")
+def test_ensure_query_indexes_upgrades_existing_database():
+    old_engine = create_engine("sqlite://")
+    old_metadata = MetaData()
+    # The tables with their columns but none of the indexes declared on them
+    for indexed_model in INDEXED_TABLES:
+        table = indexed_model.__table__
+        Table(table.name, old_metadata, *(column._copy() for column in table.columns))
+    old_metadata.create_all(bind=old_engine)
+
+    with old_engine.begin() as connection:
+        ensure_query_indexes(connection)
+        ensure_query_indexes(connection)
+
+        # The inspector leaves out expression indexes, sqlite_master lists them all
+        indexes = set(connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").scalars())
+        plan = "\n".join(row[-1] for row in connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM vehicles WHERE user_id = 1 AND lower(make) >= 'toy' AND lower(make) < 'toz'"
+        ))
+
+    for indexed_model in (Vehicle, MaintenanceRecord, MaintenanceReminder):
+        assert {index.name for index in indexed_model.__table__.indexes} <= indexes
+    assert "ix_vehicles_user_id_lower_make" in plan
+    old_engine.dispose()
+
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from starlette.requests import Request
+
+from app import database
+from app.models import Base, User
+from app.crud.versions import crud_bump_user_data_version, crud_fetch_user_data_version
+from app.utils.etag import make_etag, etag_matches, conditional_get
+
+
+def make_request(query: str = "", if_none_match: str = None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/vehicles/", "query_string": query.encode(),
+                    "headers": headers})
+
+
+def test_make_etag_is_scoped():
+    etag = make_etag(scope="vehicles", user_id=1, version=3)
+
+    assert etag.startswith('W/"')
+    assert etag == make_etag(scope="vehicles", user_id=1, version=3)
+    assert etag != make_etag(scope="vehicles", user_id=2, version=3)
+    assert etag != make_etag(scope="vehicles", user_id=1, version=4)
+    assert etag != make_etag(scope="reminders", user_id=1, version=3)
+    assert etag != make_etag(scope="vehicles", user_id=1, version=3, query="limit=10")
+
+
+def test_etag_matches():
+    etag = 'W/"abc"'
+
+    assert etag_matches('W/"abc"', etag)
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"xyz", W/"abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('W/"xyz"', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
+
+
+def test_conditional_get_answers_not_modified_until_a_write(tmp_path):
+    url = f"sqlite+aiosqlite:///{tmp_path / 'etag.db'}"
+    async_engine = create_async_engine(url, **database.get_engine_options(url, asynchronous=True))
+    event.listen(async_engine.sync_engine, "connect", database.enable_sqlite_foreign_keys)
+    session_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    check_not_modified = conditional_get("vehicles")
+
+    async def scenario():
+        async with async_engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        async with session_factory() as db:
+            db.add(User(username="etag", email="etag@test.com", password_hash="x"))
+            await db.commit()
+            current_user = await db.get(User, 1)
+
+            response = Response()
+            headers = await check_not_modified(make_request(), response, db=db, current_user=current_user)
+            etag = headers["ETag"]
+            assert response.headers["etag"] == etag
+
+            with pytest.raises(HTTPException) as exc_info:
+                await check_not_modified(make_request(if_none_match=etag), Response(), db=db, current_user=current_user)
+            assert exc_info.value.status_code == 304
+            assert exc_info.value.headers["ETag"] == etag
+
+            await db.run_sync(crud_bump_user_data_version, user_id=current_user.id)
+            await db.commit()
+
+            headers = await check_not_modified(
+                make_request(if_none_match=etag), Response(), db=db, current_user=current_user
+            )
+            assert headers["ETag"] != etag
+
+            version = await db.run_sync(crud_fetch_user_data_version, user_id=current_user.id)
+
+        await async_engine.dispose()
+        return version
+
+    assert asyncio.run(scenario()) == 1
@@ -0,0 +1,77 @@
+import os
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import get_engine_options
+from app.models import Base
+from app.crud import vehicles
+from app.crud.vehicles import VEHICLE_FILTERS
+from app.utils.filters import compile_filter_statement, fetch_filtered_page
+from app.utils.metrics import get_counter
+from test_crud_vehicles import get_new_user, register_vehicles
+
+
+# Point TEST_DATABASE_URL at a scratch PostgreSQL database to run the suite against that backend
+SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite:///:memory:")
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **get_engine_options(SQLALCHEMY_DATABASE_URL))
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture(scope="function")
+def db():
+    Base.metadata.create_all(bind=engine)
+    compile_filter_statement.cache_clear()
+
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        db.close()
+
+
+def test_filter_statement_is_compiled_once_per_shape(db):
+    created_user = get_new_user(db=db, user_id=1)
+    registered = register_vehicles(db=db, current_user=created_user, count=3)
+    compiles = get_counter("vehicles_filter_statement_compiles")
+
+    first = vehicles.crud_filter_user_vehicles(db=db, current_user=created_user, make="Toyota", year=2020)
+    # Same filters with other values and in another order
+    second = vehicles.crud_filter_user_vehicles(db=db, current_user=created_user, year=2021, make="Honda")
+    third = vehicles.crud_filter_user_vehicles(db=db, current_user=created_user, nickname="dailydriver2")
+
+    assert [vehicle.id for vehicle in first["vehicles"]] == [vehicle.id for vehicle in registered]
+    assert second["vehicles"] == []
+    assert [vehicle.id for vehicle in third["vehicles"]] == [registered[2].id]
+    assert get_counter("vehicles_filter_statement_compiles") == compiles + 2
+
+
+def test_filter_statement_pages_with_cursor(db):
+    created_user = get_new_user(db=db, user_id=1)
+    registered = register_vehicles(db=db, current_user=created_user, count=3)
+    other_user = get_new_user(db=db, user_id=2)
+
+    first_page, cursor = fetch_filtered_page(
+        db=db, spec=VEHICLE_FILTERS, user_id=created_user.id, filters={"make": "toy"}, limit=2, cursor=None
+    )
+    second_page, last_cursor = fetch_filtered_page(
+        db=db, spec=VEHICLE_FILTERS, user_id=created_user.id, filters={"make": "toy"}, limit=2, cursor=cursor
+    )
+    other_page, _ = fetch_filtered_page(
+        db=db, spec=VEHICLE_FILTERS, user_id=other_user.id, filters={"make": "toy"}, limit=2, cursor=None
+    )
+
+    assert [vehicle.id for vehicle in first_page + second_page] == [vehicle.id for vehicle in registered]
+    assert last_cursor is None
+    assert other_page == []
+
+
+def test_filter_statement_empty_prefix_matches_every_value(db):
+    created_user = get_new_user(db=db, user_id=1)
+    registered = register_vehicles(db=db, current_user=created_user, count=2)
+
+    page = vehicles.crud_filter_user_vehicles(db=db, current_user=created_user, make="")
+
+    assert [vehicle.id for vehicle in page["vehicles"]] == [vehicle.id for vehicle in registered]
@@ -0,0 +1,202 @@
+import os
+import json
+import mailbox
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime, timedelta
+
+from app.database import get_engine_options
+from app.models import Base, NotificationOutbox
+from app.utils.metrics import get_counter, get_metrics_snapshot
+from app.utils.outbox import OutboxDispatcher, MailboxSink, WebhookSink
+from app.utils.scheduler import ReminderScheduler, DueReminder
+from test_scheduler import add_reminders, NOW
+
+# Point TEST_DATABASE_URL at a scratch PostgreSQL database to run the suite against that backend
+SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite:///:memory:")
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **get_engine_options(SQLALCHEMY_DATABASE_URL))
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture(scope="function")
+def db():
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        db.close()
+
+
+@pytest.fixture(scope="function")
+def webhook():
+    # A local receiver that answers 503 to the first failures_left requests and keeps every batch it accepts
+    received = []
+    state = {"failures_left": 1}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if state["failures_left"]:
+                state["failures_left"] -= 1
+                self.send_response(503)
+            else:
+                received.extend(body["notifications"])
+                self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/notifications", received, state
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class FailingSink:
+    name = "webhook"
+
+    def deliver(self, messages):
+        raise ConnectionError("receiver down")
+
+
+def due_reminders(reminders: list) -> list:
+    return [DueReminder(reminder_id=reminder.id, notify_at=reminder.notify_at) for reminder in reminders]
+
+
+def outbox_rows(db) -> list:
+    db.expire_all()
+    return db.query(NotificationOutbox).order_by(NotificationOutbox.id).all()
+
+
+def test_enqueue_marks_reminders_and_queues_each_once(db, tmp_path):
+    reminders = add_reminders(db=db, offsets_in_hours=[-2, -1, 3])
+    updated_at = [reminder.updated_at for reminder in reminders]
+    dispatcher = OutboxDispatcher(
+        session_factory=SessionLocal,
+        sinks=[MailboxSink(path=str(tmp_path / "mbox")), WebhookSink(url="http://127.0.0.1:9/")]
+    )
+
+    # The third was rescheduled since it came due
+    dispatcher.enqueue(due_reminders(reminders[:2]) + [DueReminder(reminder_id=reminders[2].id, notify_at=NOW)])
+
+    rows = outbox_rows(db)
+    assert [(row.reminder_id, row.sink) for row in rows] == [
+        (reminders[0].id, "mailbox"), (reminders[0].id, "webhook"),
+        (reminders[1].id, "mailbox"), (reminders[1].id, "webhook")
+    ]
+    assert rows[0].payload["idempotency_key"] == f"reminder-{reminders[0].id}-20250601T100000.000000"
+    assert rows[0].payload["email"] == "testuser1@test.com"
+    assert [reminder.last_notified_at for reminder in reminders] == [
+        reminders[0].notify_at, reminders[1].notify_at, None
+    ]
+    assert [reminder.updated_at for reminder in reminders] == updated_at
+
+    # Fired again after a restart, nothing new is queued
+    dispatcher.enqueue(due_reminders(reminders[:2]))
+    assert len(outbox_rows(db)) == 4
+
+    # and a rebuilt scheduler leaves them out
+    scheduler = ReminderScheduler(session_factory=SessionLocal, sink=dispatcher.enqueue)
+    scheduler._fired_until = NOW - timedelta(days=1)
+    assert scheduler.rebuild() == 1
+
+
+def test_failed_enqueue_is_fired_again(db, tmp_path):
+    reminders = add_reminders(db=db, offsets_in_hours=[-1])
+    dispatcher = OutboxDispatcher(session_factory=SessionLocal, sinks=[MailboxSink(path=str(tmp_path / "mbox"))])
+    state = {"failures_left": 1}
+
+    def flaky_enqueue(due):
+        if state["failures_left"]:
+            state["failures_left"] -= 1
+            raise ConnectionError("database unavailable")
+        dispatcher.enqueue(due)
+
+    def make_scheduler() -> ReminderScheduler:
+        scheduler = ReminderScheduler(session_factory=SessionLocal, sink=flaky_enqueue, sink_records_notified=True)
+        # As if the process started at NOW with two hours of catch up
+        scheduler._catch_up_from = scheduler._fired_until = NOW - timedelta(hours=2)
+        return scheduler
+
+    scheduler = make_scheduler()
+    assert scheduler.rebuild() == 1
+    assert scheduler.fire_due(now=NOW) == 0
+    assert outbox_rows(db) == []
+
+    # Kept for the next pass, and loaded again from the database whatever passes were made since
+    assert len(scheduler) == 1
+    restarted = make_scheduler()
+    restarted._fired_until = NOW
+    assert restarted.rebuild() == 1
+
+    assert scheduler.fire_due(now=NOW) == 1
+    assert [row.reminder_id for row in outbox_rows(db)] == [reminders[0].id]
+    # Queued now, so neither loads it again
+    assert scheduler.rebuild() == 0
+    assert make_scheduler().rebuild() == 0
+
+
+def test_dispatcher_retries_webhook_with_backoff(db, webhook):
+    url, received, state = webhook
+    reminders = add_reminders(db=db, offsets_in_hours=[-3, -2, -1])
+    dispatcher = OutboxDispatcher(session_factory=SessionLocal, sinks=[WebhookSink(url=url)], batch_size=2)
+    dispatcher.enqueue(due_reminders(reminders))
+    retried = get_counter("outbox_retried")
+    delivered = get_counter("outbox_delivered")
+
+    # The first batch is refused and waits out its backoff, the second goes through
+    assert dispatcher.drain() == 3
+    rows = outbox_rows(db)
+    assert [row.status for row in rows] == ["pending", "pending", "delivered"]
+    assert [row.attempts for row in rows] == [1, 1, 0]
+    assert all(row.next_attempt_at > datetime.utcnow() for row in rows[:2])
+    assert "503" in rows[0].last_error
+
+    assert dispatcher.drain(now=datetime.utcnow() + timedelta(hours=1)) == 2
+    assert [row.status for row in outbox_rows(db)] == ["delivered"] * 3
+    assert sorted(message["reminder_id"] for message in received) == sorted(reminder.id for reminder in reminders)
+    assert get_counter("outbox_retried") == retried + 2
+    assert get_counter("outbox_delivered") == delivered + 3
+    assert get_metrics_snapshot()["timings"]["outbox_webhook_delivery"]["count"] >= 3
+
+
+def test_mailbox_delivers_and_failing_sink_gives_up(db, tmp_path):
+    reminders = add_reminders(db=db, offsets_in_hours=[-1])
+    path = str(tmp_path / "mbox")
+    dispatcher = OutboxDispatcher(
+        session_factory=SessionLocal, sinks=[MailboxSink(path=path), FailingSink()], max_attempts=2
+    )
+    dispatcher.enqueue(due_reminders(reminders))
+
+    dispatcher.drain()
+    dispatcher.drain(now=datetime.utcnow() + timedelta(days=1))
+    # Given up on, no longer claimed
+    assert dispatcher.drain(now=datetime.utcnow() + timedelta(days=2)) == 0
+
+    rows = outbox_rows(db)
+    assert [(row.sink, row.status, row.attempts) for row in rows] == [
+        ("mailbox", "delivered", 0), ("webhook", "failed", 2)
+    ]
+
+    messages = list(mailbox.mbox(path))
+    assert len(messages) == 1
+    assert messages[0]["To"] == "testuser1@test.com"
+    assert messages[0]["Message-ID"] == f"<{rows[0].idempotency_key}@vehicle-maintenance-tracker>"
+    assert "Oil Change is coming due" in messages[0].get_payload()
+
+    dispatcher.refresh_backlog_metrics()
+    gauges = get_metrics_snapshot()["gauges"]
+    assert gauges["outbox_pending"] == 0
+    assert gauges["outbox_failed"] == 1
@@ -0,0 +1,87 @@
+import random
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.utils.reminder import apply_reminder_schedule, get_reminder_start_date
+from app.utils.reminder_status import reminder_columns, reminder_schedule, reminder_schedule_rows
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def make_reminder(rng: random.Random) -> SimpleNamespace:
+    def maybe(value):
+        return None if rng.random() < 0.2 else value
+
+    return SimpleNamespace(
+        last_serviced_date=maybe(NOW - timedelta(days=rng.randint(0, 800), microseconds=rng.randint(0, 999999))),
+        updated_at=maybe(NOW - timedelta(days=rng.randint(0, 400))),
+        created_at=NOW - timedelta(days=rng.randint(400, 900), seconds=rng.randint(0, 86399)),
+        interval_months=maybe(rng.choice([0, 1, 3, 6, 12, 24])),
+        notify_before_days=maybe(rng.randint(0, 60)),
+        last_serviced_mileage=maybe(rng.randint(0, 150000)),
+        interval_miles=maybe(rng.choice([0, 500, 3000, 5000, 7500, 10000])),
+        # Larger than some intervals, so the miles needed go negative
+        notify_before_miles=maybe(rng.choice([0, 250, 500, 1000, 4000])),
+        estimated_miles_driven_per_month=maybe(rng.choice([0, 1, 7, 333, 1000, 1234, 2500])),
+        notify_at=None
+    )
+
+
+def as_row(reminder) -> tuple:
+    return (
+        get_reminder_start_date(reminder),
+        reminder.interval_months,
+        reminder.notify_before_days,
+        reminder.last_serviced_mileage,
+        reminder.interval_miles,
+        reminder.notify_before_miles,
+        reminder.estimated_miles_driven_per_month
+    )
+
+
+def test_reminder_schedule_matches_apply_reminder_schedule():
+    # What the startup backfill writes, odometer readings included
+    rng = random.Random(20251017)
+    reminders = [make_reminder(rng) for _ in range(5000)]
+    vehicle_mileage = [rng.choice([None, rng.randint(0, 170000)]) for _ in reminders]
+
+    schedule = reminder_schedule(
+        columns=reminder_columns([as_row(reminder) for reminder in reminders]), vehicle_mileage=vehicle_mileage, now=NOW
+    )
+
+    expected = []
+    for reminder, mileage in zip(reminders, vehicle_mileage):
+        apply_reminder_schedule(maintenance_reminder=reminder, vehicle_mileage=mileage, now=NOW)
+        expected.append({
+            "next_due_date": reminder.next_due_date,
+            "notify_date": reminder.notify_date,
+            "next_due_mileage": reminder.next_due_mileage,
+            "notify_mileage": reminder.notify_mileage,
+            "notify_at": reminder.notify_at
+        })
+    assert reminder_schedule_rows(schedule) == expected
+    assert any(row["notify_at"] == NOW for row in expected)
+
+
+def test_reminder_schedule_notify_at_boundary():
+    start = datetime(2025, 1, 1, 8, 30)
+    # Mileage is reached 27 days in (900 miles at 1000 a month), the time threshold at 30 * 3 - 10 days
+    columns = reminder_columns([(start, 3, 10, 20000, 1000, 100, 1000)])
+
+    assert reminder_schedule_rows(reminder_schedule(columns=columns)) == [{
+        "next_due_date": start + timedelta(days=90),
+        "notify_date": start + timedelta(days=80),
+        "next_due_mileage": 21000,
+        "notify_mileage": 20900,
+        "notify_at": start + timedelta(days=27)
+    }]
+
+
+def test_reminder_schedule_handles_aware_and_empty_input():
+    start = datetime(2025, 5, 1, 12, 0, tzinfo=timezone(timedelta(hours=-5)))
+    columns = reminder_columns([(start, 1, 0, None, None, None, None), (None, 6, 0, None, None, None, None)])
+
+    assert [row["notify_at"] for row in reminder_schedule_rows(reminder_schedule(columns=columns))] == [
+        datetime(2025, 5, 31, 17, 0), None
+    ]
+    assert reminder_schedule_rows(reminder_schedule(columns=reminder_columns([]))) == []
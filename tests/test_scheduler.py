@@ -0,0 +1,233 @@
+import os
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime, timedelta
+
+from app.database import get_engine_options
+from app.models import Base, MaintenanceReminder
+from app.crud import reminder, vehicles
+from app.schemas.reminder import MaintenanceReminderCreate, MaintenanceReminderUpdate
+from app.schemas.vehicles import VehicleUpdate
+from app.utils.metrics import get_counter
+from app.utils.scheduler import ReminderScheduler, DueReminder, set_active_scheduler
+from test_crud_vehicles import get_new_user
+from test_crud_maintenance import get_registered_car
+
+# Point TEST_DATABASE_URL at a scratch PostgreSQL database to run the suite against that backend
+SQLALCHEMY_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite:///:memory:")
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **get_engine_options(SQLALCHEMY_DATABASE_URL))
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+NOW = datetime(2025, 6, 1, 12, 0)
+
+
+@pytest.fixture(scope="function")
+def db():
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        set_active_scheduler(None)
+        Base.metadata.drop_all(bind=engine)
+        db.close()
+
+
+def add_reminders(db, offsets_in_hours: list) -> list:
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+
+    reminders = [
+        MaintenanceReminder(
+            maintenance_type="Oil Change",
+            interval_months=6,
+            last_serviced_date=NOW,
+            vehicle_id=new_vehicle.id,
+            is_active=True,
+            notify_at=NOW + timedelta(hours=hours)
+        )
+        for hours in offsets_in_hours
+    ]
+    db.add_all(reminders)
+    db.commit()
+    return reminders
+
+
+def make_scheduler(fired: list, **kwargs) -> ReminderScheduler:
+    scheduler = ReminderScheduler(session_factory=SessionLocal, sink=fired.extend, **kwargs)
+    # As if the process started at NOW with an hour of catch up
+    scheduler._fired_until = NOW - timedelta(hours=1)
+    return scheduler
+
+
+def test_scheduler_fires_in_notify_order_with_bounded_window(db):
+    # Out of order, one from before the catch up window and two due in the same hour
+    reminders = add_reminders(db=db, offsets_in_hours=[5, -3, 1, -0.5, 2, 1, 30])
+    fired = []
+    scheduler = make_scheduler(fired=fired, window=2)
+
+    assert scheduler.rebuild() == 2
+    assert scheduler.fire_due(now=NOW) == 1
+    assert fired == [DueReminder(reminders[3].id, reminders[3].notify_at)]
+
+    scheduler.fire_due(now=NOW + timedelta(hours=6))
+    # Each time the heap ran dry the next window was streamed in, never more than two at once
+    assert len(scheduler) <= 2
+    assert [due.reminder_id for due in fired] == [
+        reminders[3].id, reminders[2].id, reminders[5].id, reminders[4].id, reminders[0].id
+    ]
+
+    scheduler.fire_due(now=NOW + timedelta(days=2))
+    assert fired[-1].reminder_id == reminders[6].id
+    assert len(scheduler) == 0
+
+
+def test_scheduler_skips_inactive_and_resumes_after_restart(db):
+    reminders = add_reminders(db=db, offsets_in_hours=[1, 2])
+    inactive = MaintenanceReminder(
+        maintenance_type="Brakes", interval_months=6, last_serviced_date=NOW, vehicle_id=reminders[0].vehicle_id,
+        is_active=False, notify_at=NOW
+    )
+    db.add(inactive)
+    db.commit()
+
+    fired = []
+    scheduler = make_scheduler(fired=fired)
+    scheduler.rebuild()
+    scheduler.fire_due(now=NOW + timedelta(hours=1))
+
+    # A new process picks up where the last one's catch up window starts, the rest is rebuilt from the database
+    restarted = make_scheduler(fired=fired)
+    restarted._fired_until = NOW + timedelta(hours=1)
+    restarted.rebuild()
+    restarted.fire_due(now=NOW + timedelta(hours=3))
+
+    assert [due.reminder_id for due in fired] == [reminders[0].id, reminders[1].id]
+
+
+def test_scheduler_follows_committed_reminder_changes(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    fired = []
+    scheduler = ReminderScheduler(session_factory=SessionLocal, sink=fired.extend)
+    scheduler.rebuild()
+    set_active_scheduler(scheduler)
+
+    created = reminder.crud_create_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder=MaintenanceReminderCreate(
+            maintenance_type="Oil Change",
+            interval_months=6,
+            last_serviced_date=datetime.utcnow(),
+            vehicle_id=new_vehicle.id
+        )
+    )
+    assert len(scheduler) == 1
+
+    # Serviced long ago, the reminder is overdue right away
+    reminder.crud_update_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder_id=created.id,
+        update_data=MaintenanceReminderUpdate(last_serviced_date=datetime.utcnow() - timedelta(days=365))
+    )
+    assert scheduler.fire_due() == 1
+    assert [due.reminder_id for due in fired] == [created.id]
+
+    # Edits that leave notify_at alone don't bring it back
+    reminder.crud_update_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder_id=created.id,
+        update_data=MaintenanceReminderUpdate(details="Synthetic")
+    )
+    assert scheduler.fire_due() == 0
+
+    second = reminder.crud_create_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder=MaintenanceReminderCreate(
+            maintenance_type="Brakes",
+            interval_months=6,
+            last_serviced_date=datetime.utcnow(),
+            vehicle_id=new_vehicle.id
+        )
+    )
+    reminder.crud_delete_maintenance_reminder(db=db, current_user=created_user, maintenance_reminder_id=second.id)
+
+    assert len(scheduler) == 0
+    assert [due.reminder_id for due in fired] == [created.id]
+
+
+def test_scheduler_fires_when_odometer_reaches_notify_mileage(db):
+    created_user = get_new_user(db=db, user_id=1)
+    new_vehicle = get_registered_car(db=db, current_user=created_user)
+    fired = []
+    scheduler = ReminderScheduler(session_factory=SessionLocal, sink=fired.extend)
+    scheduler.rebuild()
+    set_active_scheduler(scheduler)
+
+    # At the estimated 500 miles a month the 4500 miles to notify_mileage take nine months
+    created = reminder.crud_create_maintenance_reminder(
+        db=db,
+        current_user=created_user,
+        maintenance_reminder=MaintenanceReminderCreate(
+            maintenance_type="Oil Change",
+            interval_miles=5000,
+            last_serviced_mileage=new_vehicle.mileage,
+            last_serviced_date=datetime.utcnow(),
+            vehicle_id=new_vehicle.id
+        )
+    )
+    assert created.notify_at > datetime.utcnow() + timedelta(days=200)
+    assert scheduler.fire_due() == 0
+
+    # Driven far past it in a few days
+    vehicles.crud_update_vehicle(
+        db=db, current_user=created_user, vehicle_id=new_vehicle.id,
+        update_data=VehicleUpdate(mileage=new_vehicle.mileage + 20000)
+    )
+    db.refresh(created)
+    notify_at = created.notify_at
+    assert notify_at <= datetime.utcnow()
+    assert scheduler.fire_due() == 1
+    assert [due.reminder_id for due in fired] == [created.id]
+
+    # Further mileage leaves notify_at where it is and doesn't fire it again
+    vehicles.crud_update_vehicle(
+        db=db, current_user=created_user, vehicle_id=new_vehicle.id,
+        update_data=VehicleUpdate(mileage=new_vehicle.mileage + 1000)
+    )
+    db.refresh(created)
+    assert created.notify_at == notify_at
+    assert scheduler.fire_due() == 0
+
+
+def test_scheduler_keeps_batches_the_sink_failed(db):
+    reminders = add_reminders(db=db, offsets_in_hours=[-0.5, 0])
+    errors = get_counter("reminder_scheduler_sink_errors")
+    fired = []
+    state = {"failures_left": 1}
+
+    def flaky_sink(due):
+        if state["failures_left"]:
+            state["failures_left"] -= 1
+            raise RuntimeError("sink down")
+        fired.extend(due)
+
+    scheduler = ReminderScheduler(session_factory=SessionLocal, sink=flaky_sink, batch_size=1)
+    scheduler._fired_until = NOW - timedelta(hours=1)
+    scheduler.rebuild()
+
+    assert scheduler.fire_due(now=NOW) == 0
+    assert get_counter("reminder_scheduler_sink_errors") == errors + 1
+    # Put back, and not counted as fired should the window be rebuilt first
+    assert len(scheduler) == 2
+    assert scheduler.rebuild() == 2
+
+    assert scheduler.fire_due(now=NOW) == 2
+    assert [due.reminder_id for due in fired] == [reminder.id for reminder in reminders]
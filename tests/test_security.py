@@ -0,0 +1,182 @@
+import asyncio
+import importlib
+import os
+import threading
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import object_session
+
+from app.models import Base, User
+from app.utils import security
+from app.utils.cache import TTLCache
+from app.utils.metrics import get_counter, reset_metrics
+
+
+@pytest.fixture(scope="function")
+def async_db_factory(monkeypatch):
+    monkeypatch.setattr(security, "SECRET_KEY", "test-secret")
+    security.user_cache.clear()
+    reset_metrics()
+
+    async_engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+
+    async def setup():
+        async with async_engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+        async with async_sessionmaker(bind=async_engine)() as db:
+            db.add(User(username="testuser", email="testuser1@test.com", password_hash="x"))
+            await db.commit()
+
+    asyncio.run(setup())
+    yield async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    security.user_cache.clear()
+    asyncio.run(async_engine.dispose())
+
+
+def fetch_current_user(session_factory, token: str):
+    async def scenario():
+        async with session_factory() as db:
+            user = await security.get_current_user(token=token, db=db)
+            return user, object_session(user) is not None
+
+    return asyncio.run(scenario())
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.utils.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(name="test_cache", max_entries=10, ttl_seconds=5)
+
+    cache.set(1, "value")
+    assert cache.get(1) == "value"
+
+    now[0] += 5
+    assert cache.get(1) is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(name="test_cache", max_entries=2, ttl_seconds=60)
+
+    cache.set(1, "one")
+    cache.set(2, "two")
+    cache.get(1)
+    cache.set(3, "three")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "one"
+    assert cache.get(3) == "three"
+
+
+def test_ttl_cache_counts_hits_and_misses():
+    reset_metrics()
+    cache = TTLCache(name="test_cache", max_entries=2, ttl_seconds=60)
+
+    cache.get(1)
+    cache.set(1, "one")
+    cache.get(1)
+    cache.get(1)
+
+    assert get_counter("test_cache_misses") == 1
+    assert get_counter("test_cache_hits") == 2
+
+
+def test_get_current_user_is_cached(async_db_factory):
+    token = security.create_access_token(user_id=1)
+
+    first_user, _ = fetch_current_user(async_db_factory, token)
+    second_user, attached = fetch_current_user(async_db_factory, token)
+
+    assert first_user.id == second_user.id == 1
+    assert second_user.username == "testuser"
+    assert not attached
+    assert get_counter("user_cache_misses") == 1
+    assert get_counter("user_cache_hits") == 1
+
+
+def test_get_current_user_attached_mode(async_db_factory, monkeypatch):
+    monkeypatch.setattr(security, "USER_CACHE_MODE", "attached")
+    token = security.create_access_token(user_id=1)
+
+    fetch_current_user(async_db_factory, token)
+    cached_user, attached = fetch_current_user(async_db_factory, token)
+
+    assert cached_user.username == "testuser"
+    assert attached
+    assert get_counter("user_cache_hits") == 1
+
+
+def test_get_current_user_disabled_cache(async_db_factory, monkeypatch):
+    monkeypatch.setattr(security, "USER_CACHE_MODE", "disabled")
+    token = security.create_access_token(user_id=1)
+
+    fetch_current_user(async_db_factory, token)
+    fetch_current_user(async_db_factory, token)
+
+    assert len(security.user_cache) == 0
+    assert get_counter("user_cache_hits") == 0
+
+
+def test_get_current_user_after_invalidation(async_db_factory):
+    token = security.create_access_token(user_id=1)
+    fetch_current_user(async_db_factory, token)
+
+    async def delete_user():
+        async with async_db_factory() as db:
+            await db.delete(await db.get(User, 1))
+            await db.commit()
+
+    asyncio.run(delete_user())
+    security.invalidate_cached_user(user_id=1)
+
+    with pytest.raises(HTTPException) as exc_info:
+        fetch_current_user(async_db_factory, token)
+
+    assert exc_info.value.status_code == 401
+    assert exc_info.value.detail == "User not found."
+
+
+def test_password_task_rejected_when_saturated(monkeypatch):
+    reset_metrics()
+    monkeypatch.setattr(security, "password_slots", threading.BoundedSemaphore(1))
+    security.password_slots.acquire()
+
+    with pytest.raises(HTTPException) as exc_info:
+        security.verify_password("pass12345", "hash")
+
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers == {"Retry-After": "1"}
+    assert get_counter("password_hash_rejected") == 1
+
+
+def test_password_task_releases_slot(monkeypatch):
+    monkeypatch.setattr(security, "password_slots", threading.BoundedSemaphore(1))
+
+    hashed_password = security.hash_password("pass12345")
+
+    assert security.verify_password("pass12345", hashed_password)
+    assert not security.verify_password("wrong", hashed_password)
+    assert security.password_slots.acquire(blocking=False)
+
+
+def test_password_slots_stay_well_below_sync_route_threads(monkeypatch):
+    # On a large host one worker per core would otherwise let logins hold every sync route thread
+    monkeypatch.setattr(os, "cpu_count", lambda: 64)
+    for name in ("PASSWORD_HASH_WORKERS", "PASSWORD_HASH_QUEUE_DEPTH", "PASSWORD_HASH_MAX_IN_FLIGHT"):
+        monkeypatch.delenv(name, raising=False)
+
+    try:
+        importlib.reload(security)
+        slots = 0
+        while security.password_slots.acquire(blocking=False):
+            slots += 1
+
+        assert slots == security.PASSWORD_HASH_MAX_IN_FLIGHT == security.SYNC_ROUTE_THREADS // 4
+        assert security.PASSWORD_HASH_WORKERS == slots
+    finally:
+        security.password_executor.shutdown()
+        monkeypatch.undo()
+        importlib.reload(security)
+
@@ -0,0 +1,56 @@
+import json
+from datetime import datetime
+from fastapi.responses import Response
+
+from app.models import Vehicle, MaintenanceRecord
+from app.schemas.maintenance import MaintenanceListResponse
+from app.schemas.users import UserListResponse
+from app.utils import serialization
+from app.utils.serialization import render_json, json_response
+
+
+def make_page() -> dict:
+    vehicle = Vehicle(id=1, make="Toyota", model="Corolla", year=2020, vin="1HGCM82633A004352", nickname="Daily")
+    records = [
+        MaintenanceRecord(
+            id=i,
+            maintenance_provider="Valvoline",
+            maintenance_type="Oil Change",
+            description=None,
+            mileage=35000 + i,
+            cost=89.65,
+            serviced_at=datetime(2024, 4, 10, 10, 0, 0),
+            created_at=datetime(2024, 4, 10, 10, 5, 0),
+            updated_at=None,
+            vehicle=vehicle
+        )
+        for i in (1, 2)
+    ]
+    return {"maintenance": records, "next_cursor": "abc", "message": "not part of the schema"}
+
+
+def test_render_json_matches_validated_dump():
+    page = make_page()
+
+    expected = MaintenanceListResponse.model_validate(page).model_dump_json().encode()
+
+    assert render_json(model=MaintenanceListResponse, content=page) == expected
+
+
+def test_render_json_fills_defaults_for_missing_keys():
+    body = json.loads(render_json(model=UserListResponse, content={"users": []}))
+
+    assert body == {"users": [], "next_after_id": None, "total": None}
+
+
+def test_json_response_modes(monkeypatch):
+    page = make_page()
+
+    response = json_response(MaintenanceListResponse, page, headers={"ETag": 'W/"abc"'})
+    assert isinstance(response, Response)
+    assert response.media_type == "application/json"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert json.loads(response.body)["maintenance"][0]["vehicle"]["nickname"] == "Daily"
+
+    monkeypatch.setattr(serialization, "SERIALIZATION_MODE", "standard")
+    assert json_response(MaintenanceListResponse, page) is page